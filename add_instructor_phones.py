@@ -3,9 +3,12 @@
 Add phone numbers to existing instructors for WhatsApp integration
 """
 
-from app import app, db
+from app import create_app, db
 from models import User
 
+# Registers the model listeners that keep derived tables up to date
+app = create_app()
+
 def add_instructor_phone_numbers():
     """Add phone numbers to existing instructors"""
     with app.app_context():
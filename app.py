@@ -1,59 +1,85 @@
+import time
+
+# Start of the cold start window create_app() reports
+_import_started = time.perf_counter()
+
 import os
 from dotenv import load_dotenv
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
+from replica_routing import RoutingSession
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+# Report and dashboard reads can be routed to a read replica (see replica_routing)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 # Create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET") or os.urandom(32)
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-    "connect_args": {
-        "connect_timeout": 10,
-        "application_name": "drivelink_app"
-    }
-}
+# Logging goes through a queue to a background writer (see structured_logging). LOG_LEVELS
+# sets levels per logger ("module=LEVEL,..."); DEBUG records are sampled per call site
+from structured_logging import configure_logging  # noqa: E402
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+app.config['LOG_LEVELS'] = os.environ.get('LOG_LEVELS', '')
+app.config['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'json')
+app.config['LOG_DEBUG_SAMPLE_EVERY'] = int(os.environ.get('LOG_DEBUG_SAMPLE_EVERY', '100'))
+configure_logging(app.config)
+
+# Configure the database (DB_PROFILE: postgres-prod, postgres-pgbouncer or sqlite-bench)
+from engine_profiles import engine_profile, register_engine_listeners  # noqa: E402
+db_profile = engine_profile()
+app.config["DB_PROFILE"] = db_profile.name
+app.config["SQLALCHEMY_DATABASE_URI"] = db_profile.url
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_profile.engine_options
+
+# Optional read replica for reports and dashboards; reads fall back to the primary without it
+# (string binds get no SQLALCHEMY_ENGINE_OPTIONS, so it is given its profile's options and pool)
+if os.environ.get("REPLICA_DATABASE_URL"):
+    replica_profile = engine_profile({**os.environ, "DATABASE_URL": os.environ["REPLICA_DATABASE_URL"]})
+    app.config["SQLALCHEMY_BINDS"] = {"replica": dict(replica_profile.engine_options, url=replica_profile.url)}
+
+# Seconds a user's reads stay on the primary after they commit a write
+app.config['REPLICA_READ_YOUR_WRITES_SECONDS'] = int(os.environ.get('REPLICA_READ_YOUR_WRITES_SECONDS', '5'))
 
 # Configure file uploads
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'doc', 'docx'}
 
+# Seconds each worker may reuse dashboard statistics before recomputing them
+app.config['DASHBOARD_STATS_TTL'] = int(os.environ.get('DASHBOARD_STATS_TTL', '10'))
+
+# Seconds each worker may reuse a student's dashboard (a committed change drops it in every worker)
+app.config['STUDENT_DASHBOARD_TTL'] = int(os.environ.get('STUDENT_DASHBOARD_TTL', '60'))
+
+# Seconds clients may reuse the instructor stats API response before revalidating
+app.config['INSTRUCTOR_STATS_MAX_AGE'] = int(os.environ.get('INSTRUCTOR_STATS_MAX_AGE', '30'))
+
+# Count statements per request and bot message, warning when one repeats more than
+# SQL_REPEAT_THRESHOLD times (totals at /admin/sql-stats)
+app.config['SQL_INSTRUMENTATION'] = os.environ.get('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+app.config['SQL_REPEAT_THRESHOLD'] = int(os.environ.get('SQL_REPEAT_THRESHOLD', '10'))
+
 # Initialize the app with the extension
 db.init_app(app)
 
-def create_tables():
-    """Create database tables with proper error handling"""
-    try:
-        with app.app_context():
-            # Make sure to import the models here or their tables won't be created
-            import models  # noqa: F401
-            db.create_all()
-            logging.info("Database tables created successfully")
-            return True
-    except Exception as e:
-        logging.error(f"Failed to create database tables: {e}")
-        return False
+from sql_instrumentation import init_sql_instrumentation  # noqa: E402
+init_sql_instrumentation(app)
+
+with app.app_context():
+    for engine in db.engines.values():
+        register_engine_listeners(engine)
 
 def init_app_with_routes():
     """Initialize app with routes after database setup"""
@@ -62,6 +88,14 @@ def init_app_with_routes():
         import routes  # noqa: F401
         import auth  # noqa: F401
         
+        # Register the mapper listeners that keep demand buckets, rollups, instructor
+        # stats, system totals and leaderboards up to date
+        import demand_signal  # noqa: F401
+        import rollups  # noqa: F401
+        import instructor_stats  # noqa: F401
+        import system_totals  # noqa: F401
+        import leaderboards  # noqa: F401
+        
         # Register subscription blueprint
         from subscription_routes import subscription_bp
         app.register_blueprint(subscription_bp)
@@ -80,16 +114,56 @@ def init_app_with_routes():
         logging.error(f"Failed to initialize routes: {e}")
         return False
 
-# Try to create tables and initialize routes
-if __name__ != "__main__":
-    # This ensures tables are created when the app is imported by gunicorn
-    try:
-        if create_tables():
-            init_app_with_routes()
-        else:
-            logging.warning("Database unavailable, but starting app anyway")
-            init_app_with_routes()
-    except Exception as e:
-        logging.error(f"App initialization error: {e}")
-        # Start the app even if database initialization fails
+_app_ready = False
+
+def create_app():
+    """The app with its routes, blueprints and model listeners registered (once per process)
+
+    Importing this module only configures the app and never touches the database;
+    tables and migrations are applied with `flask --app main init-db`.
+    """
+    global _app_ready
+    if not _app_ready:
         init_app_with_routes()
+        _app_ready = True
+        logging.info(f"App ready {(time.perf_counter() - _import_started) * 1000:.0f} ms after import started")
+    return app
+
+def warm_up():
+    """Build shared state once before gunicorn forks its workers (--preload)"""
+    from sqlalchemy.orm import configure_mappers
+    from jinja2 import TemplateError
+    
+    started = time.perf_counter()
+    with app.app_context():
+        configure_mappers()
+        
+        # Compiled templates stay in the Jinja cache every forked worker inherits
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            try:
+                app.jinja_env.get_template(name)
+            except TemplateError as e:
+                logging.warning(f"Could not compile template {name}: {e}")
+        
+        # A failure here only delays loading to the first booking
+        try:
+            from lesson_pricing import LessonPriceTable
+            LessonPriceTable.load()
+        except Exception as e:
+            logging.warning(f"Could not preload lesson pricing: {e}")
+        
+        # Workers must not share the master's database connections
+        for engine in db.engines.values():
+            engine.dispose()
+    logging.info(f"Warmed up in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create missing tables, apply schema migrations and add default data"""
+    from init_db import init_database
+    from schema_migrations import migrate
+    
+    if not init_database():
+        raise SystemExit(1)
+    applied = migrate()
+    logging.info(f"Applied {applied} schema migrations")
@@ -0,0 +1,6 @@
+"""
+Benchmarks for DriveLink
+Times the app's hot paths against a seeded database (see synthetic_data.py),
+records latency percentiles, statements per call and peak memory to a JSON
+results file, and compares them with a stored baseline. Run benchmarks/run.py.
+"""
@@ -0,0 +1,170 @@
+"""
+Benchmark cases: the WhatsApp bot, availability, recommendations, pricing,
+admin reports, subscription expiry, leaderboards and the reminder sweep
+"""
+from datetime import datetime, timedelta
+from typing import List, NamedTuple
+
+from flask import url_for
+from sqlalchemy import delete, func, insert, select, update
+
+from benchmarks.harness import Case
+
+# Expired subscriptions check_subscription_expiry() renews or expires per call
+EXPIRING_SUBSCRIPTIONS = 20
+
+# No synthetic user has this number, so it walks the registration flow
+UNKNOWN_PHONE = '+263700000001'
+
+_BOT_ERROR = "Sorry, I'm having technical difficulties"
+
+
+class Sample(NamedTuple):
+    """The accounts the cases act as, picked deterministically from the seeded data"""
+    admin_id: int
+    admin_phone: str
+    instructor_id: int
+    instructor_phone: str
+    student_id: int
+    student_phone: str
+
+
+def pick_sample(db) -> Sample:
+    from models import Student, User, ROLE_ADMIN
+
+    admin = db.session.execute(
+        select(User.id, User.phone).where(User.role == ROLE_ADMIN, User.active == True, User.phone.isnot(None))
+        .order_by(User.id).limit(1)
+    ).first()
+    student = db.session.execute(
+        select(Student.id, Student.phone, User.id, User.phone)
+        .join(User, Student.instructor_id == User.id)
+        .where(Student.is_active == True, Student.phone.isnot(None), User.active == True, User.phone.isnot(None))
+        .order_by(Student.id).limit(1)
+    ).first()
+    if admin is None or student is None:
+        raise RuntimeError("No admin or assigned student to benchmark with; seed the database first "
+                           "(python synthetic_data.py)")
+    return Sample(admin.id, admin.phone, student[2], student[3], student[0], student[1])
+
+
+def _bot_case(name: str, phone: str, message: str) -> Case:
+    from enhanced_whatsapp_bot import enhanced_bot
+
+    def run():
+        reply = enhanced_bot.process_message(phone, message)
+        if reply.startswith(_BOT_ERROR):
+            raise RuntimeError(f"{name}: the bot failed to handle {message!r}")
+    return Case(name, run)
+
+
+def _page_case(app, name: str, endpoint: str, admin_id: int, setup=None) -> Case:
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(admin_id)
+        sess['_fresh'] = True
+    with app.test_request_context():
+        path = url_for(endpoint)
+
+    def run():
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"{name}: GET {path} returned {response.status_code}")
+    return Case(name, run, setup)
+
+
+def _subscription_expiry_case(db, sample: Sample) -> Case:
+    from models import InstructorSubscription, User, ROLE_INSTRUCTOR, SUBSCRIPTION_ACTIVE, PAYMENT_COMPLETED
+    from subscription_manager import SubscriptionManager
+
+    instructors = db.session.execute(
+        select(User.id, User.subscription_status, User.subscription_end_date)
+        .where(User.role == ROLE_INSTRUCTOR, User.id != sample.instructor_id)
+        .order_by(User.id.desc()).limit(EXPIRING_SUBSCRIPTIONS)
+    ).all()
+    last_id = db.session.scalar(select(func.max(InstructorSubscription.id))) or 0
+
+    def reset():
+        db.session.execute(delete(InstructorSubscription).where(InstructorSubscription.id > last_id))
+        for instructor in instructors:
+            db.session.execute(update(User).where(User.id == instructor.id).values(
+                subscription_status=instructor.subscription_status,
+                subscription_end_date=instructor.subscription_end_date
+            ))
+        db.session.commit()
+
+    def setup():
+        # Every call starts from the same EXPIRING_SUBSCRIPTIONS expired subscriptions
+        reset()
+        ended = datetime.now() - timedelta(days=1)
+        db.session.execute(insert(InstructorSubscription), [{
+            'instructor_id': instructor.id,
+            'plan': 'basic',
+            'status': SUBSCRIPTION_ACTIVE,
+            'start_date': ended - timedelta(days=30),
+            'end_date': ended,
+            'amount': 29,
+            'payment_status': PAYMENT_COMPLETED,
+            # Half renew, half expire
+            'auto_renew': index % 2 == 0,
+        } for index, instructor in enumerate(instructors)])
+        db.session.commit()
+
+    def teardown():
+        reset()
+        db.session.remove()
+
+    return Case('subscriptions.check_expiry', SubscriptionManager.check_subscription_expiry, setup, teardown)
+
+
+def build_cases(app, db) -> List[Case]:
+    """Every benchmark case; call inside an app context"""
+    from dashboard_stats import AdminDashboardStats
+    from enhanced_features import DynamicPricingEngine, enhanced_features
+    from enhanced_whatsapp_bot import enhanced_bot
+    from leaderboards import LeaderboardService
+    from models import User
+    from routes import due_lesson_reminders, get_instructor_available_timeslots
+
+    sample = pick_sample(db)
+
+    def instructor():
+        return db.session.get(User, sample.instructor_id)
+
+    # A mid-morning slot three days out
+    lesson_date = (datetime.now() + timedelta(days=3)).replace(hour=10, minute=0, second=0, microsecond=0)
+
+    def reminder_sweep():
+        lessons_24h, lessons_2h = due_lesson_reminders(datetime.now())
+        # The reminder texts read both sides of every lesson
+        return [(lesson.student.name, lesson.instructor.phone) for lesson in lessons_24h + lessons_2h]
+
+    return [
+        _bot_case('bot.student.menu', sample.student_phone, 'menu'),
+        _bot_case('bot.student.lessons', sample.student_phone, '3'),
+        _bot_case('bot.student.progress', sample.student_phone, '4'),
+        _bot_case('bot.student.balance', sample.student_phone, '5'),
+        _bot_case('bot.instructor.menu', sample.instructor_phone, 'menu'),
+        _bot_case('bot.instructor.students', sample.instructor_phone, '1'),
+        _bot_case('bot.instructor.today', sample.instructor_phone, '2'),
+        _bot_case('bot.instructor.schedule', sample.instructor_phone, '3'),
+        _bot_case('bot.instructor.earnings', sample.instructor_phone, '4'),
+        _bot_case('bot.admin.menu', sample.admin_phone, 'menu'),
+        _bot_case('bot.admin.students', sample.admin_phone, '1'),
+        _bot_case('bot.admin.reports', sample.admin_phone, '5'),
+        _bot_case('bot.unknown.register', UNKNOWN_PHONE, 'hi'),
+        Case('availability.timeslots', lambda: get_instructor_available_timeslots(instructor(), 2)),
+        Case('availability.bot', lambda: enhanced_bot.show_instructor_availability(instructor())),
+        Case('recommendations.smart', lambda: enhanced_features.get_smart_instructor_recommendations(sample.student_id)),
+        Case('pricing.lesson_price', lambda: DynamicPricingEngine.calculate_lesson_price(
+            sample.student_id, sample.instructor_id, 60, lesson_date)),
+        _page_case(app, 'reports.admin_dashboard', 'admin_dashboard', sample.admin_id),
+        _page_case(app, 'reports.admin_dashboard.uncached', 'admin_dashboard', sample.admin_id,
+                   setup=AdminDashboardStats.invalidate),
+        _page_case(app, 'reports.commission_reports', 'subscription.commission_reports', sample.admin_id),
+        _subscription_expiry_case(db, sample),
+        Case('leaderboards.load', LeaderboardService.load),
+        Case('leaderboards.top', lambda: LeaderboardService.top('overall', 10)),
+        Case('leaderboards.rank', lambda: LeaderboardService.rank(sample.student_id)),
+        Case('reminders.sweep', reminder_sweep),
+    ]
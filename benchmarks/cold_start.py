@@ -0,0 +1,79 @@
+"""
+Cold start: time from a fresh interpreter's first import of the app until
+create_app() returns, measured in separate processes
+"""
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+from benchmarks.harness import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Linux keeps ru_maxrss across fork and exec, so the child's own peak (VmHWM) is read where it exists
+_CHILD = """
+import json, resource, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+seconds = time.perf_counter() - started
+try:
+    with open('/proc/self/status') as status:
+        peak_kb = next(int(line.split()[1]) for line in status if line.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': seconds, 'max_rss_kb': peak_kb}))
+"""
+
+
+def _run(*arguments: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *arguments], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+
+
+def _start() -> Dict:
+    return json.loads(_run('-c', _CHILD).stdout.strip().splitlines()[-1])
+
+
+def _top_level_imports(importtime: str) -> Dict[str, int]:
+    """Cumulative microseconds of each top-level import in -X importtime output"""
+    imports = {}
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Imports are indented two spaces per level under the module that triggered them
+        if len(name) - len(name.lstrip()) == 3:
+            imports[name.strip()] = int(cumulative)
+    return imports
+
+
+def slowest_imports(limit: int) -> List[Dict]:
+    """The app's top-level imports that take longest, leaving out the interpreter's own"""
+    interpreter = _top_level_imports(_run('-X', 'importtime', '-c', 'pass').stderr)
+    app = _top_level_imports(_run('-X', 'importtime', '-c', _CHILD).stderr)
+    imports = [{'module': name, 'ms': round(microseconds / 1000, 1)}
+               for name, microseconds in app.items() if name not in interpreter]
+    return sorted(imports, key=lambda item: item['ms'], reverse=True)[:limit]
+
+
+def measure_cold_start(runs: int) -> Dict:
+    """Cold start percentiles, peak RSS and the slowest imports, shaped like harness.measure()"""
+    starts = [_start() for _ in range(runs)]
+
+    ms = sorted(start['seconds'] * 1000 for start in starts)
+    rss = sorted(start['max_rss_kb'] for start in starts)
+    return {
+        'iterations': runs,
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'mean_ms': round(sum(ms) / len(ms), 3),
+        'max_ms': round(ms[-1], 3),
+        'statements': None,
+        'db_ms': None,
+        # The whole process's peak RSS, not traced allocations as for the other cases
+        'peak_memory_kb': float(percentile(rss, 50)),
+        'slowest_imports': slowest_imports(10),
+    }
@@ -0,0 +1,109 @@
+"""
+Benchmark harness: times cases, counts their SQL statements and peak memory,
+and compares results with a baseline
+"""
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sql_instrumentation import SqlInstrumentation
+
+# Differences below these are noise on any machine, whatever the threshold
+MIN_LATENCY_DELTA_MS = 0.5
+MIN_MEMORY_DELTA_KB = 64
+
+
+class Case(NamedTuple):
+    name: str
+    run: Callable[[], object]
+    setup: Optional[Callable[[], object]] = None  # untimed, before every call
+    teardown: Optional[Callable[[], object]] = None  # untimed, after the last call
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return 0.0
+    rank = max(1, -(-len(samples) * pct // 100))
+    return samples[int(rank) - 1]
+
+
+def _call(case: Case, timed: bool = True) -> Optional[float]:
+    from app import db
+
+    if case.setup:
+        case.setup()
+    try:
+        started = time.perf_counter()
+        case.run()
+        return time.perf_counter() - started if timed else None
+    finally:
+        # A new session per call, as each request and bot message gets one
+        db.session.remove()
+
+
+def measure(case: Case, iterations: int, warmup: int) -> Dict:
+    """Latency percentiles, statements per call and peak traced memory of one case"""
+    try:
+        for _ in range(warmup):
+            _call(case)
+
+        timings, statements, db_seconds = [], [], []
+        for _ in range(iterations):
+            with SqlInstrumentation.track(f"benchmark.{case.name}") as stats:
+                timings.append(_call(case))
+            if stats is not None:
+                statements.append(stats.statements)
+                db_seconds.append(stats.seconds)
+
+        # tracemalloc slows Python code down several times, so memory gets its own call
+        tracemalloc.start()
+        try:
+            _call(case, timed=False)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        if case.teardown:
+            case.teardown()
+
+    timings.sort()
+    ms = [seconds * 1000 for seconds in timings]
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'mean_ms': round(sum(ms) / len(ms), 3),
+        'max_ms': round(ms[-1], 3),
+        'statements': round(sum(statements) / len(statements), 2) if statements else None,
+        'db_ms': round(sum(db_seconds) * 1000 / len(db_seconds), 3) if db_seconds else None,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Regressions of results against a baseline, one line each
+
+    p95 latency and peak memory regress when they grow by more than the threshold
+    (a fraction, 0.25 is 25%). Statement counts do not depend on the machine, so
+    any increase is a regression.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+
+        p95, base_p95 = current['p95_ms'], base['p95_ms']
+        if p95 > base_p95 * (1 + threshold) and p95 - base_p95 >= MIN_LATENCY_DELTA_MS:
+            regressions.append(f"{name}: p95 {base_p95:.2f} ms -> {p95:.2f} ms")
+
+        statements, base_statements = current.get('statements'), base.get('statements')
+        if statements is not None and base_statements is not None and statements > base_statements + 0.5:
+            regressions.append(f"{name}: statements per call {base_statements:g} -> {statements:g}")
+
+        memory, base_memory = current['peak_memory_kb'], base['peak_memory_kb']
+        if memory > base_memory * (1 + threshold) and memory - base_memory >= MIN_MEMORY_DELTA_KB:
+            regressions.append(f"{name}: peak memory {base_memory:.0f} KB -> {memory:.0f} KB")
+    return regressions
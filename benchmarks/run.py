@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Run the DriveLink benchmarks against the configured database (DATABASE_URL, or
+the sqlite-bench profile's local file), plus the app's cold start time in fresh
+processes, and compare them with a baseline:
+
+    python -m benchmarks.run --seed-scale 1               # seed an empty database first
+    python -m benchmarks.run --update-baseline            # record benchmarks/baseline.json
+    python -m benchmarks.run --threshold 0.25             # exit 1 on a regression
+
+Baselines are only comparable on the same machine, database and data volume;
+the results file records all three.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+from datetime import datetime
+from typing import Dict, Iterable
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+
+
+def _environment(db) -> Dict:
+    from engine_profiles import engine_profile
+    from models import Lesson, Student, User
+    from sqlalchemy import func, select
+
+    return {
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'db_profile': engine_profile().name,
+        'dialect': db.engine.dialect.name,
+        'rows': {
+            'users': db.session.scalar(select(func.count(User.id))),
+            'students': db.session.scalar(select(func.count(Student.id))),
+            'lessons': db.session.scalar(select(func.count(Lesson.id))),
+        },
+    }
+
+
+class _OncePerMessage(logging.Filter):
+    """Every iteration repeats a case's N+1 warnings; log each one once"""
+
+    def __init__(self):
+        super().__init__()
+        self.seen = set()
+
+    def filter(self, record):
+        message = record.getMessage()
+        if message in self.seen:
+            return False
+        self.seen.add(message)
+        return True
+
+
+def _print_results(results: Dict[str, Dict], baseline: Dict[str, Dict]):
+    print(f"{'case':<36} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'stmts':>7} {'peak KB':>9} {'p95 vs base':>12}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        change = f"{(result['p95_ms'] / base['p95_ms'] - 1) * 100:+.0f}%" if base and base['p95_ms'] else '-'
+        statements = f"{result['statements']:g}" if result['statements'] is not None else '-'
+        print(f"{name:<36} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+              f"{statements:>7} {result['peak_memory_kb']:>9.0f} {change:>12}")
+
+
+def main(argv: Iterable[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the DriveLink hot paths')
+    parser.add_argument('--iterations', type=int, default=50, help='timed calls per case')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed calls per case before timing')
+    parser.add_argument('--only', action='append', default=[], metavar='PREFIX',
+                        help='run only cases whose name starts with PREFIX (repeatable)')
+    parser.add_argument('--output', default=None, help='results file (default benchmarks/results-<time>.json)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline results to compare with')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed p95 latency and peak memory growth over the baseline (0.25 = 25%%)')
+    parser.add_argument('--update-baseline', action='store_true', help='save these results as the baseline')
+    parser.add_argument('--startup-runs', type=int, default=5, help='fresh processes started to time cold start')
+    parser.add_argument('--seed-scale', type=int, default=None, metavar='SCALE',
+                        help='seed the database with synthetic_data.py at SCALE first, if it has no lessons')
+    args = parser.parse_args(argv)
+
+    # Statement counts come from the SQL instrumentation, which is read at app import
+    os.environ['SQL_INSTRUMENTATION'] = '1'
+    from app import create_app, db
+    from benchmarks.cases import build_cases
+    from benchmarks.cold_start import measure_cold_start
+    from benchmarks.harness import compare, measure
+    from models import Lesson
+
+    logging.getLogger('sql_instrumentation').addFilter(_OncePerMessage())
+    app = create_app()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['cases']
+
+    with app.app_context():
+        if args.seed_scale:
+            db.create_all()
+            if not db.session.query(Lesson.id).first():
+                from synthetic_data import SyntheticDataGenerator
+                SyntheticDataGenerator(db.engine, scale=args.seed_scale).run()
+            db.session.remove()
+
+        cases = [case for case in build_cases(app, db)
+                 if not args.only or any(case.name.startswith(prefix) for prefix in args.only)]
+        results, failures = {}, {}
+        if not args.only or any('startup.cold_start'.startswith(prefix) for prefix in args.only):
+            print("  startup.cold_start...", file=sys.stderr)
+            results['startup.cold_start'] = measure_cold_start(args.startup_runs)
+        for case in cases:
+            print(f"  {case.name}...", file=sys.stderr)
+            try:
+                results[case.name] = measure(case, args.iterations, args.warmup)
+            except Exception as e:
+                logging.exception(f"Benchmark {case.name} failed")
+                failures[case.name] = f"{type(e).__name__}: {e}"
+                db.session.remove()
+        environment = _environment(db)
+
+    _print_results(results, baseline)
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), f"results-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    document = {'environment': environment, 'iterations': args.iterations, 'warmup': args.warmup,
+                'cases': results, 'failures': failures}
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if failures:
+        print(f"\n{len(failures)} cases failed:")
+        for name, error in failures.items():
+            print(f"  {name}: {error}")
+        return 1
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("No baseline to compare with (run with --update-baseline to record one)")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressions over {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions over {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s %(name)s: %(message)s')
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,79 @@
+"""
+Shared Cache Versions for DriveLink
+Version stamps kept in system_config so every gunicorn worker can tell when an
+in-process cache built from database rows has gone stale
+"""
+import threading
+import time
+import uuid
+import logging
+from datetime import datetime
+from typing import Iterable, List
+
+logger = logging.getLogger(__name__)
+
+
+class VersionStamp:
+    """A version value stored in system_config and re-read at most every few seconds"""
+
+    def __init__(self, key: str, check_seconds: float = 5.0):
+        self.key = key
+        self.check_seconds = check_seconds
+        self._value = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> str:
+        """Get the current version, reading the database only when the last check is old"""
+        now = time.monotonic()
+        if self._value is None or now - self._checked_at > self.check_seconds:
+            from models import SystemConfig
+            value = SystemConfig.get_config(self.key, '0')
+            with self._lock:
+                self._value = value
+                self._checked_at = now
+        return self._value
+
+    def bump(self) -> str:
+        """Publish a new version so all workers drop their cached copies
+
+        Written on a connection of its own, so it can be called from an
+        after_commit listener and never commits the caller's session.
+        """
+        return VersionStamp.bump_all([self])[0]
+
+    @staticmethod
+    def bump_all(stamps: Iterable['VersionStamp']) -> List[str]:
+        """Publish new versions of several stamps in one transaction of its own"""
+        from app import db
+
+        stamps = list(stamps)
+        values = [uuid.uuid4().hex for _ in stamps]
+        now = datetime.now()
+        try:
+            with db.engine.begin() as connection:
+                for stamp, value in zip(stamps, values):
+                    stamp._write(connection, value, now)
+        except Exception as e:
+            # Another worker inserting a key at the same time is harmless; either
+            # value is new to every worker
+            logger.error(f"Failed to bump cache versions {', '.join(stamp.key for stamp in stamps)}: {str(e)}")
+        checked_at = time.monotonic()
+        for stamp, value in zip(stamps, values):
+            with stamp._lock:
+                stamp._value = value
+                stamp._checked_at = checked_at
+        return values
+
+    def _write(self, connection, value: str, now: datetime):
+        from models import SystemConfig
+
+        table = SystemConfig.__table__
+        result = connection.execute(
+            table.update().where(table.c.key == self.key).values(value=value, updated_at=now)
+        )
+        if not result.rowcount:
+            connection.execute(table.insert().values(
+                key=self.key, value=value, description=f'Cache version for {self.key}',
+                created_at=now, updated_at=now
+            ))
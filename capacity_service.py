@@ -0,0 +1,82 @@
+"""
+Instructor Capacity Service for DriveLink
+Answers "how many more students can this instructor take" for many instructors
+with a single query on instructor_stats, whose student counts are maintained
+from Student mapper events, so every worker sees assignments, switches and
+deletions as soon as they are committed. Instructors without a row yet (before
+schema migration 5 has filled the table) are counted from students.
+"""
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from sqlalchemy import func
+
+import instructor_stats  # noqa: F401  (registers the listeners that maintain student_count)
+from app import db
+from models import InstructorStats, Student, PLAN_STUDENT_LIMITS
+
+
+class Capacity(NamedTuple):
+    """Student capacity for one instructor (limit/remaining of None = unlimited)"""
+    current_students: int
+    limit: Optional[int]
+    remaining: Optional[int]
+
+    @property
+    def has_room(self) -> bool:
+        return self.remaining is None or self.remaining > 0
+
+
+class InstructorCapacity:
+    """Student counts and plan limits for instructors"""
+
+    @staticmethod
+    def get_student_counts(instructor_ids: Iterable[int]) -> Dict[int, int]:
+        """Get current student counts with one primary-key read of instructor_stats
+
+        Instructors with no stats row are counted with one grouped query instead.
+        """
+        instructor_ids = {i for i in instructor_ids if i is not None}
+        if not instructor_ids:
+            return {}
+
+        counts = {instructor_id: 0 for instructor_id in instructor_ids}
+        stored = dict(db.session.query(
+            InstructorStats.instructor_id,
+            InstructorStats.student_count
+        ).filter(
+            InstructorStats.instructor_id.in_(instructor_ids)
+        ).all())
+        counts.update(stored)
+
+        missing = instructor_ids - stored.keys()
+        if missing:
+            counts.update(db.session.query(
+                Student.instructor_id,
+                func.count(Student.id)
+            ).filter(
+                Student.instructor_id.in_(missing)
+            ).group_by(Student.instructor_id).all())
+        return counts
+
+    @staticmethod
+    def get_capacity(instructors) -> Dict[int, Capacity]:
+        """Get (current students, plan limit, remaining slots) keyed by instructor id"""
+        instructors = list(instructors)
+        counts = InstructorCapacity.get_student_counts(i.id for i in instructors)
+
+        capacity = {}
+        for instructor in instructors:
+            current = counts.get(instructor.id, 0)
+            if not instructor.has_active_subscription():
+                capacity[instructor.id] = Capacity(current, 0, 0)
+                continue
+
+            limit = PLAN_STUDENT_LIMITS.get(instructor.subscription_plan, 0)
+            remaining = None if limit is None else max(0, limit - current)
+            capacity[instructor.id] = Capacity(current, limit, remaining)
+        return capacity
+
+    @staticmethod
+    def can_take_students(instructor) -> bool:
+        """Check if a single instructor has room for another student"""
+        return InstructorCapacity.get_capacity([instructor])[instructor.id].has_room
@@ -0,0 +1,159 @@
+"""
+Query Plan Check for DriveLink
+Calls the app code behind each hot query (the listings, dashboards, reports and
+lookups), captures the SELECTs it runs and EXPLAINs them with their parameters
+against the configured (seeded) database. Fails if any of them reads a table
+with a sequential scan, i.e. an index from schema_migrations is missing or no
+longer matches the query.
+
+On PostgreSQL sequential scans are disabled for the session, so the planner
+picks an index whenever one can serve the query and the result does not depend
+on how much data has been seeded.
+
+Run this module directly; the exit status is 1 when a hot query scans a table.
+"""
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from sqlalchemy import event, or_
+from sqlalchemy.engine import Engine
+
+from models import (SystemConfig, User, LESSON_COMPLETED, LESSON_SCHEDULED, ROLE_ADMIN, ROLE_INSTRUCTOR)
+
+
+class HotQuery(NamedTuple):
+    run: Callable  # () -> object, the app code whose SELECTs are explained
+    dialects: Tuple[str, ...] = ('postgresql', 'sqlite')
+
+
+def _hot_queries() -> Dict[str, HotQuery]:
+    from dashboard_stats import SystemStats
+    from exports import commissions_export
+    from listings import lessons_page, payments_page, students_page
+    from routes import due_lesson_reminders, get_instructor_available_timeslots
+    from safety_system import RealTimeTracker, SafetyReporting
+    from student_dashboard import StudentDashboard
+    from subscription_manager import MarketplaceManager
+
+    now = datetime.now()
+    last_month = {'date_from': (now - timedelta(days=30)).date().isoformat()}
+    # Unsaved users: the listings only read their id and role
+    instructor = User(id=1, role=ROLE_INSTRUCTOR)
+    admin = User(id=1, role=ROLE_ADMIN)
+    return {
+        'instructor lessons page': HotQuery(lambda: lessons_page(instructor, {})),
+        'instructor lessons by status': HotQuery(lambda: lessons_page(
+            instructor, {'status': LESSON_SCHEDULED, **last_month})),
+        'lessons page': HotQuery(lambda: lessons_page(admin, {})),
+        'instructor lessons on a day': HotQuery(lambda: get_instructor_available_timeslots(instructor, 2)),
+        'lesson reminders due': HotQuery(lambda: due_lesson_reminders(now)),
+        'student dashboard': HotQuery(lambda: StudentDashboard.load(1)),
+        'student completed lessons': HotQuery(lambda: StudentDashboard.lessons(1, LESSON_COMPLETED)),
+        'student by email': HotQuery(lambda: StudentDashboard.find_student_id(email='student@example.com')),
+        'user by phone': HotQuery(lambda: User.query.filter_by(phone='+263770000000').first()),
+        'verified instructors': HotQuery(lambda: MarketplaceManager.find_nearby_instructors('Harare')),
+        'instructor students page': HotQuery(lambda: students_page(instructor, {})),
+        'students page': HotQuery(lambda: students_page(admin, {})),
+        # No tracker exists for lesson 0, so the lookup finds nothing to update
+        'lesson tracker': HotQuery(lambda: RealTimeTracker.update_location(0, 0.0, 0.0)),
+        'instructor commissions in range': HotQuery(lambda: list(commissions_export(instructor, last_month).rows)),
+        'commissions in range': HotQuery(lambda: list(commissions_export(admin, last_month).rows)),
+        'payments page': HotQuery(lambda: payments_page({})),
+        'student payments': HotQuery(lambda: payments_page({'student_id': '1'})),
+        'active whatsapp sessions': HotQuery(SystemStats.active_whatsapp_sessions),
+        'instructor safety report': HotQuery(lambda: SafetyReporting.generate_safety_report(
+            1, (now - timedelta(days=30), now))),
+        'config key': HotQuery(lambda: SystemConfig.get_config('schema_version')),
+        # SQLite's LIKE is case-insensitive and cannot use a plain index for prefixes
+        'config key prefixes': HotQuery(lambda: SystemConfig.query.filter(or_(
+            SystemConfig.key.like('authenticated_%'), SystemConfig.key.like('auth_state_%')
+        )).all(), dialects=('postgresql',)),
+    }
+
+
+@contextmanager
+def captured_selects():
+    """Collect the (statement, parameters) of every SELECT run on any engine inside the block"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', capture)
+
+
+def explain(connection, statement: str, parameters) -> List[str]:
+    """The plan of a statement as the app ran it, one line per node"""
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)]
+
+
+def sequential_scans(connection, plan: List[str], tables) -> List[str]:
+    """Plan lines that read one of the given tables without an index"""
+    scans = []
+    for line in plan:
+        detail = line.strip().lstrip('->').strip()
+        if connection.dialect.name == 'sqlite':
+            words = detail.split()
+            if len(words) >= 2 and words[0] == 'SCAN' and words[1] in tables and 'USING' not in detail:
+                scans.append(detail)
+        elif detail.startswith('Seq Scan on ') and detail.split()[3] in tables:
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans() -> List[Tuple[str, List[str]]]:
+    """(query name, sequential scans) for every hot query that scans a table"""
+    from app import db
+
+    dialect = db.engine.dialect.name
+    queries = {}
+    for name, query in _hot_queries().items():
+        if dialect not in query.dialects:
+            continue
+        with captured_selects() as statements:
+            try:
+                query.run()
+            finally:
+                db.session.remove()
+        queries[name] = statements
+
+    failures = []
+    tables = set(db.metadata.tables)
+    with db.engine.connect() as connection:
+        if dialect == 'postgresql':
+            connection.exec_driver_sql("SET enable_seqscan = off")
+        for name, statements in queries.items():
+            plans = [explain(connection, statement, parameters) for statement, parameters in statements]
+            scans = [scan for plan in plans for scan in sequential_scans(connection, plan, tables)]
+            print(f"{'SCAN' if scans else 'ok':<5} {name}")
+            for plan in plans:
+                for line in plan:
+                    print(f"        {line}")
+            if scans:
+                failures.append((name, scans))
+        connection.rollback()
+    return failures
+
+
+if __name__ == "__main__":
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        failures = check_query_plans()
+    if failures:
+        print(f"\n{len(failures)} hot queries read a table sequentially "
+              f"(run schema_migrations.py to add missing indexes):")
+        for name, scans in failures:
+            print(f"  {name}: {'; '.join(scans)}")
+        sys.exit(1)
+    print("\nEvery hot query uses an index")
@@ -0,0 +1,126 @@
+"""
+Replica Routing Check for DriveLink
+Points the app at two temporary SQLite files, a primary and a "replica" seeded
+with a different number of users, and checks from the row counts which database
+each read reached: plain reads and reads after a write go to the primary, reads
+inside replica_reads() go to the replica, and a leaderboard load from the
+replica does not save its snapshot to the primary.
+
+Run this module directly; the exit status is 1 when a read reaches the wrong
+database. It never touches the configured DATABASE_URL.
+"""
+import os
+import sys
+import tempfile
+from typing import Callable, List, Tuple
+
+from sqlalchemy import create_engine, func, insert, select
+
+PRIMARY_USERS = 3
+REPLICA_USERS = 7
+
+
+def _seed(url: str, users: int):
+    from app import db
+    from models import User
+
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(User.__table__), [{
+            'username': f'replica-check-{index}',
+            'email': f'replica-check-{index}@example.com',
+            'password_hash': '-',
+        } for index in range(users)])
+    engine.dispose()
+
+
+def _user_count() -> int:
+    from app import db
+    from models import User
+
+    return db.session.scalar(select(func.count(User.id)))
+
+
+def _checks(app) -> List[Tuple[str, Callable[[], bool]]]:
+    from app import db
+    from leaderboards import SNAPSHOT_KEY_PREFIX, LeaderboardService
+    from models import SystemConfig, User
+    from replica_routing import replica_reads
+
+    def plain_read():
+        return _user_count() == PRIMARY_USERS
+
+    def replica_read():
+        with replica_reads():
+            return _user_count() == REPLICA_USERS
+
+    def read_after_write():
+        with replica_reads():
+            db.session.add(User(username='replica-check-new', email='replica-check-new@example.com',
+                                password_hash='-'))
+            db.session.flush()
+            routed = _user_count() == PRIMARY_USERS + 1
+        db.session.rollback()
+        return routed
+
+    def read_after_commit():
+        # The browser session remembers the write, so the user's next reads use the primary
+        with app.test_request_context():
+            db.session.add(User(username='replica-check-committed', email='replica-check-committed@example.com',
+                                password_hash='-'))
+            db.session.commit()
+            db.session.remove()
+            with replica_reads():
+                return _user_count() == PRIMARY_USERS + 1
+
+    def leaderboard_snapshot():
+        LeaderboardService.load()
+        saved = db.session.scalar(select(func.count(SystemConfig.id)).where(
+            SystemConfig.key.startswith(SNAPSHOT_KEY_PREFIX, autoescape=True)))
+        return saved == 0
+
+    return [
+        ('read outside replica_reads() uses the primary', plain_read),
+        ('read inside replica_reads() uses the replica', replica_read),
+        ('read after a flushed write uses the primary', read_after_write),
+        ('read in the request after a commit uses the primary', read_after_commit),
+        ('leaderboard load from the replica saves no snapshot', leaderboard_snapshot),
+    ]
+
+
+def check_replica_routing(app) -> List[str]:
+    """Names of the checks whose reads reached the wrong database"""
+    from app import db
+
+    failures = []
+    with app.app_context():
+        for name, check in _checks(app):
+            try:
+                passed = check()
+            finally:
+                db.session.remove()
+            print(f"{'ok' if passed else 'FAIL':<5} {name}")
+            if not passed:
+                failures.append(name)
+    return failures
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'primary.db')}"
+        os.environ['REPLICA_DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'replica.db')}"
+        os.environ.pop('DB_PROFILE', None)
+        from app import create_app, db
+
+        app = create_app()
+        _seed(os.environ['DATABASE_URL'], PRIMARY_USERS)
+        _seed(os.environ['REPLICA_DATABASE_URL'], REPLICA_USERS)
+        failures = check_replica_routing(app)
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+    if failures:
+        print(f"\n{len(failures)} reads reached the wrong database")
+        sys.exit(1)
+    print("\nReads reach the expected database")
@@ -2,9 +2,12 @@
 """
 Script to create demo users with properly hashed passwords
 """
-from app import app, db
+from app import create_app, db
 from models import User, ROLE_INSTRUCTOR, ROLE_ADMIN, ROLE_SUPER_ADMIN
 
+# Registers the model listeners that keep derived tables up to date
+app = create_app()
+
 def create_demo_users():
     with app.app_context():
         # Clear existing users
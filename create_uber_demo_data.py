@@ -11,9 +11,12 @@ from datetime import datetime, timedelta
 # Add the current directory to the path so we can import our modules
 sys.path.append('.')
 
-from app import app, db
+from app import create_app, db
 from models import User, Student, Lesson
 
+# Registers the model listeners that keep derived tables up to date
+app = create_app()
+
 def create_demo_data():
     """Create demo data for testing the Uber-style instructor selection"""
     
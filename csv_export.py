@@ -0,0 +1,90 @@
+"""
+CSV Export for DriveLink
+Streams report rows as CSV straight from a server-side cursor, so an export of
+any size is written out in batches without loading the result set into memory,
+gzip-compressed on the fly for clients that accept it
+"""
+import csv
+import io
+import zlib
+from datetime import date, datetime
+from typing import Iterable, Sequence
+
+from flask import Response, request, stream_with_context
+
+# Rows fetched from the cursor per round trip
+EXPORT_BATCH_SIZE = 1000
+
+# Bytes of CSV gathered before a chunk is compressed and sent
+CHUNK_SIZE = 64 * 1024
+
+
+def csv_value(value):
+    """Render dates without microseconds and None as an empty cell"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(header: Sequence[str], rows: Iterable[Sequence]) -> Iterable[str]:
+    """Yield the header and then each row as one CSV line"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(header)
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([csv_value(value) for value in row])
+        yield buffer.getvalue()
+
+
+def iter_chunks(lines: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterable[bytes]:
+    """Group lines into chunks of about chunk_size bytes"""
+    pending = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield b''.join(pending)
+
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterable[bytes]:
+    """Gzip a stream of chunks incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_query(query, batch_size: int = EXPORT_BATCH_SIZE):
+    """Iterate a query's rows through a server-side cursor in batches"""
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def csv_response(filename: str, header: Sequence[str], rows: Iterable[Sequence]) -> Response:
+    """A streamed attachment response for the given rows, gzipped if the client accepts it"""
+    body = iter_chunks(iter_csv(header, rows))
+    compress = 'gzip' in request.accept_encodings
+    if compress:
+        body = iter_gzip(body)
+
+    response = Response(stream_with_context(body), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,228 @@
+"""
+Dashboard Statistics for DriveLink
+Computes the admin and super admin dashboards' headline numbers with grouped,
+multi-aggregate queries and caches them per worker for a few seconds
+(DASHBOARD_STATS_TTL)
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import case, func, select, true
+
+from app import db
+from rollups import RollupReports
+from system_totals import LESSONS, STUDENTS, USERS_PREFIX, SystemTotals
+from models import (
+    Student, User, Lesson, DailyRevenueRollup, InstructorStats, SystemConfig, WhatsAppSession,
+    LESSON_SCHEDULED, LESSON_COMPLETED, ROLE_INSTRUCTOR, ROLE_ADMIN, ROLE_SUPER_ADMIN
+)
+
+# system_config keys the WhatsApp bots use to hold per-phone state, and the
+# student dashboard version stamps (student_dashboard.VERSION_KEY_PREFIX)
+STATE_KEY_PREFIXES = ('authenticated_', 'registration_', 'auth_state_', 'student_dashboard_version_')
+
+# A WhatsApp session counts as active if it had a message within this window
+ACTIVE_SESSION_WINDOW = timedelta(hours=24)
+
+USERS_PER_PAGE = 25
+
+# Instructors listed on /admin, most students first
+TOP_INSTRUCTORS = 10
+
+
+def _month_bounds(now: datetime) -> Tuple[datetime, datetime]:
+    """First instant of this month and of the next, for index-friendly range filters"""
+    start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+class TTLCache:
+    """Tiny per-worker cache of computed values keyed by name
+
+    With max_entries, the least recently used entries are dropped beyond it.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[float, object]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, ttl: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry and time.monotonic() - entry[0] <= ttl:
+            return entry[1]
+        return None
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+class AdminDashboardStats:
+    """Headline statistics for /admin"""
+
+    _cache = TTLCache()
+
+    @staticmethod
+    def ttl() -> float:
+        return current_app.config.get('DASHBOARD_STATS_TTL', 10)
+
+    @staticmethod
+    def compute() -> Dict:
+        """Run every dashboard aggregate in a single SELECT over one-row subqueries"""
+        now = datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        month_start, month_end = _month_bounds(now)
+
+        student_totals = select(
+            func.count(Student.id).filter(Student.is_active == True).label('total_students'),
+            func.coalesce(func.sum(case((Student.account_balance < 0, Student.account_balance), else_=0)), 0).label('outstanding'),
+            func.coalesce(func.sum(case((Student.account_balance > 0, Student.account_balance), else_=0)), 0).label('credits')
+        ).subquery()
+
+        lesson_totals = select(
+            func.count(Lesson.id).filter(
+                Lesson.lesson_date >= today,
+                Lesson.lesson_date < today + timedelta(days=1)
+            ).label('todays_lessons'),
+            func.count(Lesson.id).filter(Lesson.status == LESSON_SCHEDULED).label('pending_lessons'),
+            func.count(Lesson.id).filter(Lesson.status == LESSON_COMPLETED).label('completed_lessons')
+        ).subquery()
+
+        # Revenue comes from the daily rollups: at most a few rows per day of history
+        payment_totals = select(
+            func.coalesce(func.sum(DailyRevenueRollup.amount_total), 0).label('total_revenue'),
+            func.coalesce(func.sum(DailyRevenueRollup.amount_total).filter(
+                DailyRevenueRollup.day >= month_start.date(),
+                DailyRevenueRollup.day < month_end.date()
+            ), 0).label('this_month_revenue')
+        ).subquery()
+
+        instructor_total = select(
+            func.count(User.id).label('total_instructors')
+        ).where(User.role == ROLE_INSTRUCTOR).subquery()
+
+        # Each subquery returns exactly one row, so joining them on TRUE yields one row
+        row = db.session.execute(
+            select(student_totals, lesson_totals, payment_totals, instructor_total).select_from(
+                student_totals
+                .join(lesson_totals, true())
+                .join(payment_totals, true())
+                .join(instructor_total, true())
+            )
+        ).one()
+
+        payment_methods = RollupReports.revenue_by_method(month_start.date(), month_end.date())
+
+        # Student counts are maintained in instructor_stats, so no students are counted here
+        student_count = func.coalesce(InstructorStats.student_count, 0)
+        top_instructors = db.session.execute(
+            select(User.id, student_count).outerjoin(
+                InstructorStats, InstructorStats.instructor_id == User.id
+            ).where(User.role == ROLE_INSTRUCTOR).order_by(student_count.desc(), User.id).limit(TOP_INSTRUCTORS)
+        ).all()
+
+        return {
+            'stats': {
+                'total_students': row.total_students,
+                'total_instructors': row.total_instructors,
+                'todays_lessons': row.todays_lessons,
+                'pending_lessons': row.pending_lessons,
+                'completed_lessons': row.completed_lessons,
+                'total_revenue': float(row.total_revenue),
+                'this_month_revenue': float(row.this_month_revenue),
+                'outstanding_balance': abs(float(row.outstanding)),
+                'total_credits': float(row.credits)
+            },
+            'payment_methods': payment_methods,
+            'top_instructors': [(instructor_id, count) for instructor_id, count in top_instructors]
+        }
+
+    @staticmethod
+    def get() -> Dict:
+        """Get cached statistics, recomputing them once the TTL has passed"""
+        cached = AdminDashboardStats._cache.get('admin', AdminDashboardStats.ttl())
+        if cached is not None:
+            return cached
+        return AdminDashboardStats._cache.set('admin', AdminDashboardStats.compute())
+
+    @staticmethod
+    def invalidate():
+        AdminDashboardStats._cache.clear('admin')
+
+
+class SystemStats:
+    """Statistics, user pages and configuration listing for /super-admin"""
+
+    _cache = TTLCache()
+
+    @staticmethod
+    def compute() -> Dict:
+        """Read the maintained totals (system_totals) and count the active WhatsApp sessions"""
+        totals = SystemTotals.get()
+        role_counts = {name[len(USERS_PREFIX):]: count for name, count in totals.items()
+                       if name.startswith(USERS_PREFIX)}
+
+        return {
+            'total_users': sum(role_counts.values()),
+            'instructors': role_counts.get(ROLE_INSTRUCTOR, 0),
+            'admins': role_counts.get(ROLE_ADMIN, 0),
+            'super_admins': role_counts.get(ROLE_SUPER_ADMIN, 0),
+            'total_students': totals.get(STUDENTS, 0),
+            'total_lessons': totals.get(LESSONS, 0),
+            'active_whatsapp_sessions': SystemStats.active_whatsapp_sessions()
+        }
+
+    @staticmethod
+    def active_whatsapp_sessions() -> int:
+        """Sessions with a message within ACTIVE_SESSION_WINDOW, a range read on ix_whatsapp_sessions_last_activity"""
+        active_since = datetime.now() - ACTIVE_SESSION_WINDOW
+        return db.session.scalar(select(func.count(WhatsAppSession.id)).where(
+            WhatsAppSession.is_active == True,
+            WhatsAppSession.last_activity >= active_since
+        ))
+
+    @staticmethod
+    def get() -> Dict:
+        """Get cached statistics, recomputing them once the TTL has passed"""
+        cached = SystemStats._cache.get('system', AdminDashboardStats.ttl())
+        if cached is not None:
+            return cached
+        return SystemStats._cache.set('system', SystemStats.compute())
+
+    @staticmethod
+    def users_page(page: int = 1, per_page: int = USERS_PER_PAGE):
+        """One page of users ordered by id"""
+        return db.paginate(select(User).order_by(User.id), page=page, per_page=per_page,
+                           max_per_page=100, error_out=False)
+
+    @staticmethod
+    def config_entries():
+        """System configuration rows, without the bots' per-phone state keys"""
+        return SystemConfig.query.filter(
+            *[~SystemConfig.key.startswith(prefix, autoescape=True) for prefix in STATE_KEY_PREFIXES]
+        ).order_by(SystemConfig.key).all()
+
+    @staticmethod
+    def invalidate():
+        SystemStats._cache.clear('system')
@@ -0,0 +1,291 @@
+"""
+Demand Signal for DriveLink
+Keeps booked (Lesson) and requested (MarketplaceBooking) counts per area, week
+and (weekday, hour) in demand_buckets, updated incrementally from mapper events,
+and turns a rolling window of them into precomputed surge multipliers
+
+Run this module directly to rebuild demand_buckets from the lesson and
+marketplace tables; schema migration 7 fills it on existing databases.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, select
+
+from rollups import increment_counters, previous_value, track_previous
+
+logger = logging.getLogger(__name__)
+
+SLOTS_PER_WEEK = 7 * 24
+
+# Rolling window of lesson weeks that feeds the multipliers
+WINDOW_WEEKS_BACK = 4
+WINDOW_WEEKS_AHEAD = 2
+
+# A marketplace request signals demand but is weaker evidence than a booking
+BOOKED_WEIGHT = 1.0
+REQUESTED_WEIGHT = 0.5
+
+# Areas with less weighted demand than this in the window use the overall curve
+MIN_AREA_DEMAND = 20.0
+# Share of the slot's excess over the area's average demand turned into surge
+SENSITIVITY = 0.5
+MAX_DEMAND_MULTIPLIER = 1.5
+
+BucketKey = Tuple[str, date, int, int]
+
+
+def _area_key(area: Optional[str]) -> str:
+    return area.strip().lower()[:100] if area else ''
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _bucket_key(area: Optional[str], when: Optional[datetime]) -> Optional[BucketKey]:
+    if when is None:
+        return None
+    return _area_key(area), _week_start(when.date()), when.weekday(), when.hour
+
+
+def _lesson_key(area, lesson_date, status) -> Optional[BucketKey]:
+    from models import LESSON_CANCELLED
+
+    if status == LESSON_CANCELLED:
+        return None
+    return _bucket_key(area, lesson_date)
+
+
+def _request_key(area, preferred_date, preferred_time, status) -> Optional[BucketKey]:
+    if status == 'cancelled' or preferred_date is None or preferred_time is None:
+        return None
+    return _bucket_key(area, datetime.combine(preferred_date, preferred_time))
+
+
+class DemandSignal:
+    """Precomputed demand multipliers per area and (weekday, hour)"""
+
+    RELOAD_SECONDS = 300
+
+    # area key ('' = all areas) -> SLOTS_PER_WEEK multipliers indexed by weekday * 24 + hour
+    _multipliers: Optional[Dict[str, List[float]]] = None
+    _loaded_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def adjust(connection, key: Optional[BucketKey], booked: int = 0, requested: int = 0):
+        """Add to one bucket's counters with an upsert on the given connection"""
+        if key is None or (booked == 0 and requested == 0):
+            return
+        from models import DemandBucket
+
+        area, week_start, weekday, hour = key
+        increment_counters(
+            connection, DemandBucket.__table__,
+            {'area': area, 'week_start': week_start, 'weekday': weekday, 'hour': hour},
+            {'booked_count': booked, 'requested_count': requested},
+            insert_values={'booked_count': max(booked, 0), 'requested_count': max(requested, 0)}
+        )
+
+    @staticmethod
+    def move(connection, old_key: Optional[BucketKey], new_key: Optional[BucketKey], column: str):
+        """Move one count from old_key to new_key (either may be None)"""
+        if old_key == new_key:
+            return
+        DemandSignal.adjust(connection, old_key, **{column: -1})
+        DemandSignal.adjust(connection, new_key, **{column: 1})
+
+    @staticmethod
+    def build_multipliers(rows) -> Dict[str, List[float]]:
+        """Turn (area, weekday, hour, booked, requested) rows into multiplier arrays"""
+        demand: Dict[str, List[float]] = defaultdict(lambda: [0.0] * SLOTS_PER_WEEK)
+        for area, weekday, hour, booked, requested in rows:
+            weighted = (booked or 0) * BOOKED_WEIGHT + (requested or 0) * REQUESTED_WEIGHT
+            slot = weekday * 24 + hour
+            demand[area or ''][slot] += weighted
+            if area:
+                demand[''][slot] += weighted
+
+        multipliers = {}
+        for area, slots in demand.items():
+            total = sum(slots)
+            if total < MIN_AREA_DEMAND:
+                continue
+            # Compare each slot with the average over slots that see any demand, so
+            # quiet night hours do not make every daytime slot look busy
+            active = [value for value in slots if value > 0]
+            average = total / len(active)
+            multipliers[area] = [
+                round(min(max(1.0 + SENSITIVITY * (value / average - 1.0), 1.0), MAX_DEMAND_MULTIPLIER), 4)
+                for value in slots
+            ]
+        return multipliers
+
+    @staticmethod
+    def load():
+        """(Re)load the rolling window of buckets into multiplier arrays"""
+        from app import db
+        from models import DemandBucket
+
+        this_week = _week_start(date.today())
+        rows = db.session.query(
+            DemandBucket.area,
+            DemandBucket.weekday,
+            DemandBucket.hour,
+            func.sum(DemandBucket.booked_count),
+            func.sum(DemandBucket.requested_count)
+        ).filter(
+            DemandBucket.week_start >= this_week - timedelta(weeks=WINDOW_WEEKS_BACK),
+            DemandBucket.week_start <= this_week + timedelta(weeks=WINDOW_WEEKS_AHEAD)
+        ).group_by(DemandBucket.area, DemandBucket.weekday, DemandBucket.hour).all()
+
+        multipliers = DemandSignal.build_multipliers(rows)
+        with DemandSignal._lock:
+            DemandSignal._multipliers = multipliers
+            DemandSignal._loaded_at = time.monotonic()
+        logger.info(f"Loaded demand multipliers for {len(multipliers)} areas")
+
+    @staticmethod
+    def invalidate():
+        """Force a reload on the next lookup"""
+        with DemandSignal._lock:
+            DemandSignal._multipliers = None
+
+    @staticmethod
+    def multiplier(when: datetime, area: Optional[str] = None) -> float:
+        """Look up the demand multiplier for a lesson start time and area"""
+        if (DemandSignal._multipliers is None or
+                time.monotonic() - DemandSignal._loaded_at > DemandSignal.RELOAD_SECONDS):
+            try:
+                DemandSignal.load()
+            except Exception as e:
+                # Without demand data pricing falls back to the rules alone
+                logger.error(f"Error loading demand multipliers: {str(e)}")
+                with DemandSignal._lock:
+                    DemandSignal._multipliers = {}
+                    DemandSignal._loaded_at = time.monotonic()
+
+        multipliers = DemandSignal._multipliers
+        slots = multipliers.get(_area_key(area)) or multipliers.get('')
+        if not slots:
+            return 1.0
+        return slots[when.weekday() * 24 + when.hour]
+
+    @staticmethod
+    def rebuild():
+        """Recompute demand_buckets from scratch for the lesson and marketplace tables"""
+        from app import db
+
+        count = fill_demand_buckets(db.session.connection())
+        db.session.commit()
+
+        DemandSignal.invalidate()
+        logger.info(f"Rebuilt {count} demand buckets")
+        return count
+
+
+def fill_demand_buckets(connection) -> int:
+    """Replace demand_buckets with counts of the source rows (rebuild and schema migration)"""
+    from models import DemandBucket, Lesson, MarketplaceBooking
+
+    counts: Dict[BucketKey, List[int]] = defaultdict(lambda: [0, 0])
+    lessons = connection.execute(
+        select(Lesson.location, Lesson.lesson_date, Lesson.status).execution_options(yield_per=1000))
+    for location, lesson_date, status in lessons:
+        key = _lesson_key(location, lesson_date, status)
+        if key:
+            counts[key][0] += 1
+
+    requests = connection.execute(select(
+        MarketplaceBooking.preferred_location,
+        MarketplaceBooking.preferred_date,
+        MarketplaceBooking.preferred_time,
+        MarketplaceBooking.status
+    ).execution_options(yield_per=1000))
+    for location, preferred_date, preferred_time, status in requests:
+        key = _request_key(location, preferred_date, preferred_time, status)
+        if key:
+            counts[key][1] += 1
+
+    table = DemandBucket.__table__
+    connection.execute(table.delete())
+    if counts:
+        now = datetime.now()
+        connection.execute(table.insert(), [
+            {'area': area, 'week_start': week_start, 'weekday': weekday, 'hour': hour,
+             'booked_count': booked, 'requested_count': requested, 'updated_at': now}
+            for (area, week_start, weekday, hour), (booked, requested) in counts.items()
+        ])
+    return len(counts)
+
+
+def _lesson_inserted(mapper, connection, target):
+    key = _lesson_key(target.location, target.lesson_date, target.status)
+    DemandSignal.adjust(connection, key, booked=1)
+
+
+def _lesson_updated(mapper, connection, target):
+    old_key = _lesson_key(previous_value(target, 'location'), previous_value(target, 'lesson_date'),
+                          previous_value(target, 'status'))
+    new_key = _lesson_key(target.location, target.lesson_date, target.status)
+    DemandSignal.move(connection, old_key, new_key, 'booked')
+
+
+def _lesson_deleted(mapper, connection, target):
+    key = _lesson_key(target.location, target.lesson_date, target.status)
+    DemandSignal.adjust(connection, key, booked=-1)
+
+
+def _request_inserted(mapper, connection, target):
+    key = _request_key(target.preferred_location, target.preferred_date, target.preferred_time, target.status)
+    DemandSignal.adjust(connection, key, requested=1)
+
+
+def _request_updated(mapper, connection, target):
+    old_key = _request_key(previous_value(target, 'preferred_location'), previous_value(target, 'preferred_date'),
+                           previous_value(target, 'preferred_time'), previous_value(target, 'status'))
+    new_key = _request_key(target.preferred_location, target.preferred_date, target.preferred_time, target.status)
+    DemandSignal.move(connection, old_key, new_key, 'requested')
+
+
+def _request_deleted(mapper, connection, target):
+    key = _request_key(target.preferred_location, target.preferred_date, target.preferred_time, target.status)
+    DemandSignal.adjust(connection, key, requested=-1)
+
+
+def register_demand_listeners():
+    """Keep demand_buckets in step with Lesson and MarketplaceBooking writes"""
+    from models import Lesson, MarketplaceBooking
+
+    # The update listeners decrement the bucket of the old values
+    track_previous(Lesson.location, Lesson.lesson_date, Lesson.status,
+                   MarketplaceBooking.preferred_location, MarketplaceBooking.preferred_date,
+                   MarketplaceBooking.preferred_time, MarketplaceBooking.status)
+
+    listeners = [
+        (Lesson, 'after_insert', _lesson_inserted),
+        (Lesson, 'after_update', _lesson_updated),
+        (Lesson, 'after_delete', _lesson_deleted),
+        (MarketplaceBooking, 'after_insert', _request_inserted),
+        (MarketplaceBooking, 'after_update', _request_updated),
+        (MarketplaceBooking, 'after_delete', _request_deleted),
+    ]
+    for model, event_name, listener in listeners:
+        if not event.contains(model, event_name, listener):
+            event.listen(model, event_name, listener)
+
+
+register_demand_listeners()
+
+
+if __name__ == "__main__":
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    with app.app_context():
+        DemandSignal.rebuild()
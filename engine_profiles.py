@@ -0,0 +1,230 @@
+"""
+Engine Profiles for DriveLink
+Named SQLAlchemy engine configurations, picked with DB_PROFILE:
+
+- postgres-prod: a sized QueuePool per worker, for a direct PostgreSQL connection
+- postgres-pgbouncer: no client-side pool (PgBouncer pools the connections) and
+  no server-side prepared statements, which transaction pooling cannot route
+- sqlite-bench: a local SQLite file in WAL mode, so the app and the benchmarks
+  run without PostgreSQL
+
+Without DB_PROFILE the profile follows DATABASE_URL (sqlite-bench for SQLite
+URLs, postgres-prod otherwise). DATABASE_URL is required unless DB_PROFILE is
+sqlite-bench, which then falls back to a local file. Every pool records how long
+requests wait for a connection and how many are in use, see PoolMetrics.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_URL = 'sqlite:///drivelink_bench.db'
+
+# Size the pool to the threads a worker serves (gunicorn --threads); overflow
+# covers bursts such as background jobs running beside requests
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_TIMEOUT = 10
+
+
+class PoolMetrics:
+    """Connection checkout waits and connections in use for one pool, per worker"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'avg_wait_ms': round(self.wait_seconds * 1000 / self.checkouts, 3) if self.checkouts else 0,
+                'max_wait_ms': round(self.max_wait_seconds * 1000, 3),
+                'timeouts': self.timeouts,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.timeouts = 0
+            self.peak_in_use = self.in_use
+
+    @staticmethod
+    def of(engine) -> Optional['PoolMetrics']:
+        """The metrics of an engine's current pool (None unless it is a timed pool)"""
+        return getattr(engine.pool, 'metrics', None)
+
+    @staticmethod
+    def report(engine) -> Dict:
+        """The engine's pool metrics with its pool class and, for queue pools, the pool's own counts"""
+        metrics = PoolMetrics.of(engine)
+        report = metrics.snapshot() if metrics is not None else {}
+        pool = engine.pool
+        report['pool'] = type(pool).__name__
+        if isinstance(pool, QueuePool):
+            report.update(size=pool.size(), checked_in=pool.checkedin(), overflow=pool.overflow())
+        return report
+
+
+class _TimedCheckout:
+    """Times _do_get, the call that waits for (or opens) a connection, into the pool's own metrics
+
+    engine.dispose() replaces the pool, so its metrics start again from zero.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    def _do_return_conn(self, record):
+        try:
+            super()._do_return_conn(record)
+        finally:
+            self.metrics.checked_in()
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedNullPool(_TimedCheckout, NullPool):
+    pass
+
+
+class EngineProfile(NamedTuple):
+    name: str
+    url: str
+    engine_options: Dict
+
+
+def _int_env(env, name: str, default: int) -> int:
+    try:
+        return int(env.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _postgres_prod(url: str, env) -> Dict:
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': _int_env(env, 'DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+        'max_overflow': _int_env(env, 'DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW),
+        'pool_timeout': _int_env(env, 'DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT),
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+        'connect_args': {
+            'connect_timeout': 10,
+            'application_name': 'drivelink_app'
+        }
+    }
+
+
+def _postgres_pgbouncer(url: str, env) -> Dict:
+    connect_args = {
+        'connect_timeout': 10,
+        'application_name': 'drivelink_app'
+    }
+    if url.startswith('postgresql+psycopg:'):
+        # psycopg 3 prepares repeated statements server-side; psycopg2 never does
+        connect_args['prepare_threshold'] = None
+    return {
+        'poolclass': TimedNullPool,
+        'connect_args': connect_args
+    }
+
+
+def _sqlite_bench(url: str, env) -> Dict:
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': _int_env(env, 'DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+        'max_overflow': _int_env(env, 'DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW),
+        'pool_timeout': _int_env(env, 'DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT),
+        'connect_args': {
+            'check_same_thread': False,
+            'timeout': 30
+        }
+    }
+
+
+PROFILES = {
+    'postgres-prod': _postgres_prod,
+    'postgres-pgbouncer': _postgres_pgbouncer,
+    'sqlite-bench': _sqlite_bench,
+}
+
+
+def engine_profile(env=None) -> EngineProfile:
+    """The profile named by DB_PROFILE, or the one matching DATABASE_URL"""
+    env = os.environ if env is None else env
+    url: Optional[str] = env.get('DATABASE_URL')
+    name = env.get('DB_PROFILE')
+    if name and name not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {name!r}; expected one of {', '.join(PROFILES)}")
+    if not url:
+        # Only an explicit sqlite-bench profile may use the local file, so a
+        # deployment missing its DATABASE_URL fails instead of writing to SQLite
+        if name != 'sqlite-bench':
+            raise ValueError("DATABASE_URL is not set (set DB_PROFILE=sqlite-bench to use a local SQLite file)")
+        url = DEFAULT_SQLITE_URL
+    if not name:
+        name = 'sqlite-bench' if url.startswith('sqlite') else 'postgres-prod'
+    # Heroku-style URLs are not accepted by SQLAlchemy 2
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return EngineProfile(name, url, PROFILES[name](url, env))
+
+
+def _sqlite_connected(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers run beside the writer; NORMAL sync is safe with WAL and much faster
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def register_engine_listeners(engine):
+    """Apply the SQLite pragmas to every new connection"""
+    if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', _sqlite_connected):
+        event.listen(engine, 'connect', _sqlite_connected)
+    logger.info(f"Database engine ready ({type(engine.pool).__name__})")
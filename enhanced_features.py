@@ -16,6 +16,9 @@ from typing import List, Dict, Optional, Tuple
 from flask import current_app
 import logging
 
+from pricing_rules import PricingRuleEngine, MAX_SURGE_MULTIPLIER
+from demand_signal import DemandSignal
+
 logger = logging.getLogger(__name__)
 
 class LocationService:
@@ -234,97 +237,110 @@ class DynamicPricingEngine:
     def calculate_lesson_price(student_id: int, instructor_id: int, 
                              duration_minutes: int, lesson_date: datetime) -> Dict:
         """Calculate dynamic price for a lesson"""
-        from models import User, PricingRule
+        return DynamicPricingEngine.calculate_lesson_prices(
+            student_id, [(instructor_id, duration_minutes, lesson_date)]
+        )[0]
+    
+    @staticmethod
+    def calculate_lesson_prices(student, requests: List[Tuple]) -> List[Dict]:
+        """Calculate dynamic prices for many (instructor, duration, start time) requests.
+        
+        student and each instructor may be a model instance or an id. The student,
+        loyalty profile and any instructors passed by id are loaded once for the
+        whole batch.
+        """
+        from models import User, Student, LoyaltyProgram
         
         try:
-            instructor = User.query.get(instructor_id)
-            if not instructor:
-                return {'error': 'Instructor not found'}
-            
-            # Base price
-            if duration_minutes == 30:
-                base_price = float(instructor.hourly_rate_30min or 15)
-            else:
-                base_price = float(instructor.hourly_rate_60min or 25)
-            
-            # Apply dynamic pricing rules
-            surge_multiplier = DynamicPricingEngine._calculate_surge_multiplier(
-                lesson_date, instructor.base_location
-            )
-            
-            # Calculate final price
-            dynamic_price = base_price * surge_multiplier
-            
-            # Check for applicable discounts
-            discount = DynamicPricingEngine._check_applicable_discounts(
-                student_id, dynamic_price, lesson_date
-            )
-            
-            final_price = dynamic_price - discount
-            
-            return {
-                'base_price': base_price,
-                'surge_multiplier': surge_multiplier,
-                'dynamic_price': dynamic_price,
-                'discount': discount,
-                'final_price': final_price,
-                'surge_reason': DynamicPricingEngine._get_surge_reason(surge_multiplier)
-            }
+            if not isinstance(student, Student):
+                student = Student.query.get(student) if student else None
+            loyalty = LoyaltyProgram.query.filter_by(student_id=student.id).first() if student else None
+            
+            # Resolve instructors, querying only those passed by id
+            instructors = {r[0].id: r[0] for r in requests if isinstance(r[0], User)}
+            missing_ids = {r[0] for r in requests if not isinstance(r[0], User)} - set(instructors)
+            if missing_ids:
+                instructors.update({i.id: i for i in User.query.filter(User.id.in_(missing_ids)).all()})
+            
+            rows = [
+                (instructors.get(getattr(instructor, 'id', instructor)), duration_minutes, lesson_date)
+                for instructor, duration_minutes, lesson_date in requests
+            ]
+            
+            # Base prices and pricing rules, one entry per request
+            base_prices = [
+                float((instructor.hourly_rate_30min or 15) if duration_minutes == 30 else (instructor.hourly_rate_60min or 25))
+                if instructor else 0.0
+                for instructor, duration_minutes, _ in rows
+            ]
+            rule_quotes = [
+                PricingRuleEngine.evaluate(lesson_date, instructor.base_location) if instructor else None
+                for instructor, _, lesson_date in rows
+            ]
+            surges = [
+                DynamicPricingEngine._combine_surge(quote.surge_multiplier,
+                                                    DemandSignal.multiplier(lesson_date, instructor.base_location))
+                if instructor else 1.0
+                for (instructor, _, lesson_date), quote in zip(rows, rule_quotes)
+            ]
+            
+            # Surge, then the student's discount rate, applied across the batch
+            dynamic_prices = [
+                base * surge + quote.fixed_amount if quote else 0.0
+                for base, quote, surge in zip(base_prices, rule_quotes, surges)
+            ]
+            discount_rate = DynamicPricingEngine._discount_rate(student, loyalty)
+            discounts = [price * discount_rate for price in dynamic_prices]
+            
+            quotes = []
+            for (instructor, _, _), base, quote, surge, dynamic, discount in zip(
+                    rows, base_prices, rule_quotes, surges, dynamic_prices, discounts):
+                if not instructor:
+                    quotes.append({'error': 'Instructor not found'})
+                    continue
+                quotes.append({
+                    'base_price': base,
+                    'surge_multiplier': surge,
+                    'dynamic_price': dynamic,
+                    'discount': discount,
+                    'final_price': dynamic - discount,
+                    'surge_reason': DynamicPricingEngine._get_surge_reason(surge),
+                    'pricing_rules': list(quote.rule_names) + (['Booking demand'] if surge > quote.surge_multiplier else []),
+                    'loyalty_tier': loyalty.current_tier if loyalty else None
+                })
+            return quotes
             
         except Exception as e:
             logger.error(f"Error calculating dynamic price: {str(e)}")
-            return {'error': 'Price calculation failed'}
+            return [{'error': 'Price calculation failed'} for _ in requests]
+    
+    @staticmethod
+    def _combine_surge(rule_multiplier: float, demand_multiplier: float) -> float:
+        """Stack the booking-demand multiplier on top of the pricing rules"""
+        return round(min(rule_multiplier * demand_multiplier, MAX_SURGE_MULTIPLIER), 4)
     
     @staticmethod
     def _calculate_surge_multiplier(lesson_date: datetime, location: str) -> float:
-        """Calculate surge pricing multiplier based on demand"""
-        multiplier = 1.0
-        
-        # Time-based surge
-        hour = lesson_date.hour
-        day_of_week = lesson_date.weekday()
-        
-        # Peak hours (7-9 AM, 5-7 PM on weekdays)
-        if day_of_week < 5:  # Weekday
-            if (7 <= hour <= 9) or (17 <= hour <= 19):
-                multiplier += 0.3  # 30% surge
-        
-        # Weekend premium
-        if day_of_week >= 5:  # Weekend
-            multiplier += 0.2  # 20% weekend premium
-        
-        # Location-based surge (simplified)
-        high_demand_areas = ['Harare CBD', 'Avondale', 'Mount Pleasant']
-        if location in high_demand_areas:
-            multiplier += 0.1  # 10% location premium
-        
-        # Weather-based surge (mock implementation)
-        # In real app, would integrate with weather API
-        if random.random() < 0.1:  # 10% chance of weather surge
-            multiplier += 0.2  # Bad weather premium
-        
-        return min(multiplier, 2.5)  # Cap at 2.5x
+        """Calculate surge pricing multiplier from the active pricing rules and booking demand"""
+        return DynamicPricingEngine._combine_surge(
+            PricingRuleEngine.evaluate(lesson_date, location).surge_multiplier,
+            DemandSignal.multiplier(lesson_date, location)
+        )
     
     @staticmethod
-    def _check_applicable_discounts(student_id: int, price: float, 
-                                  lesson_date: datetime) -> float:
-        """Check for applicable discounts"""
-        from models import Student, PromoCode, LoyaltyProgram
-        
-        total_discount = 0.0
+    def _discount_rate(student, loyalty) -> float:
+        """Get the student's combined discount rate"""
+        rate = 0.0
         
         # First-time user discount
-        student = Student.query.get(student_id)
         if student and student.lessons_completed == 0:
-            total_discount += price * 0.15  # 15% first-time discount
+            rate += 0.15  # 15% first-time discount
         
         # Loyalty program discount
-        loyalty = LoyaltyProgram.query.filter_by(student_id=student_id).first()
         if loyalty and loyalty.current_tier in ['Gold', 'Platinum']:
-            tier_discount = 0.1 if loyalty.current_tier == 'Gold' else 0.15
-            total_discount += price * tier_discount
+            rate += 0.1 if loyalty.current_tier == 'Gold' else 0.15
         
-        return min(total_discount, price * 0.4)  # Cap discount at 40%
+        return min(rate, 0.4)  # Cap discount at 40%
     
     @staticmethod
     def _get_surge_reason(multiplier: float) -> str:
@@ -649,16 +665,17 @@ class EnhancedFeatures:
                 student_id, limit=10
             )
             
+            # Add dynamic pricing for all recommendations in one batch
+            lesson_date = datetime.now() + timedelta(days=1)
+            pricing_quotes = self.pricing_engine.calculate_lesson_prices(
+                student_id, [(rec['instructor'], 60, lesson_date) for rec in recommendations]
+            )
+            
             # Enhance with real-time data
             enhanced_recommendations = []
-            for rec in recommendations:
+            for rec, pricing in zip(recommendations, pricing_quotes):
                 instructor = rec['instructor']
                 
-                # Add dynamic pricing
-                pricing = self.pricing_engine.calculate_lesson_price(
-                    student_id, instructor.id, 60, datetime.now() + timedelta(days=1)
-                )
-                
                 # Add availability status
                 availability = self._check_real_time_availability(instructor.id)
                 
@@ -5,7 +5,6 @@ import base64
 import uuid
 from datetime import datetime, timedelta
 from flask import request, jsonify
-from twilio.rest import Client
 from twilio.twiml.messaging_response import MessagingResponse
 from sqlalchemy import and_, or_
 from models import (
@@ -13,39 +12,54 @@ from models import (
     LESSON_SCHEDULED, LESSON_COMPLETED, LESSON_CANCELLED,
     ROLE_STUDENT, ROLE_INSTRUCTOR, ROLE_ADMIN, ROLE_SUPER_ADMIN
 )
-import requests
+from recommendation_cache import RecommendationCache
+from promo_codes import PromoCodeService
+from sql_instrumentation import instrumented
 from werkzeug.utils import secure_filename
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class EnhancedWhatsAppBot:
     """Enhanced WhatsApp bot supporting all user roles with document upload capabilities"""
     
     def __init__(self):
-        self.twilio_client = None
-        self.twilio_phone = None
-        self.initialize_twilio()
+        # The Twilio client is created on first use, so importing the bot has no side effects
+        self._twilio_client = None
+        self._twilio_phone = None
+        self._twilio_initialized = False
         
-        # Upload folder for documents
+        # Upload folder for documents (each upload creates its own directory in it)
         self.upload_folder = 'static/uploads'
-        os.makedirs(self.upload_folder, exist_ok=True)
         
         # Allowed file extensions for documents
         self.allowed_extensions = {'png', 'jpg', 'jpeg', 'pdf', 'doc', 'docx'}
+    
+    @property
+    def twilio_client(self):
+        if not self._twilio_initialized:
+            self.initialize_twilio()
+        return self._twilio_client
+    
+    @property
+    def twilio_phone(self):
+        if not self._twilio_initialized:
+            self.initialize_twilio()
+        return self._twilio_phone
         
     def initialize_twilio(self):
         """Initialize Twilio client with credentials"""
+        self._twilio_initialized = True
         try:
+            from twilio.rest import Client
+            
             account_sid = os.getenv('TWILIO_ACCOUNT_SID')
             auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-            self.twilio_phone = os.getenv('TWILIO_PHONE_NUMBER')
+            self._twilio_phone = os.getenv('TWILIO_PHONE_NUMBER')
             
             if account_sid and auth_token:
-                self.twilio_client = Client(account_sid, auth_token)
+                self._twilio_client = Client(account_sid, auth_token)
                 logger.info("✅ Enhanced WhatsApp Bot initialized successfully")
-                logger.info(f"📞 Using Twilio phone: {self.twilio_phone}")
+                logger.info(f"📞 Using Twilio phone: {self._twilio_phone}")
             else:
                 logger.warning("⚠️ Twilio credentials not found")
                 
@@ -113,6 +127,7 @@ class EnhancedWhatsAppBot:
         
         return None, 'unknown'
     
+    @instrumented('whatsapp.process_message')
     def process_message(self, phone_number, message, media_url=None):
         """Main message processing entry point"""
         try:
@@ -272,6 +287,7 @@ class EnhancedWhatsAppBot:
             auth_token = os.getenv('TWILIO_AUTH_TOKEN')
             
             if account_sid and auth_token:
+                import requests  # only needed for uploads, and slow to import
                 response = requests.get(media_url, auth=(account_sid, auth_token))
             else:
                 return None
@@ -358,6 +374,10 @@ class EnhancedWhatsAppBot:
         if session_data.get('booking_lesson'):
             return self.handle_lesson_booking_flow(session, student, message)
         
+        # Promo codes can be entered at any point outside a flow: "promo CODE"
+        if message.startswith('promo '):
+            return self.apply_promo_code(session, student, message[len('promo '):])
+        
         # Enhanced menu options
         if message in ['menu', 'help', 'start']:
             return self.get_student_menu(student)
@@ -455,7 +475,7 @@ class EnhancedWhatsAppBot:
             
             # Show enhanced student stats
             response += f"📚 Lessons completed: {student.lessons_completed or 0}\n"
-            response += f"💰 Balance: ${student.balance:.2f}\n"
+            response += f"💰 Balance: ${float(student.account_balance or 0):.2f}\n"
             
             # Show progress and gamification info
             try:
@@ -562,7 +582,7 @@ class EnhancedWhatsAppBot:
         for lesson in lessons:
             response += f"📅 {lesson.lesson_date.strftime('%Y-%m-%d %H:%M')}\n"
             response += f"👨‍🏫 {lesson.instructor.get_full_name()}\n"
-            response += f"⏱️ {lesson.duration} minutes\n"
+            response += f"⏱️ {lesson.duration_minutes} minutes\n"
             response += f"📍 Status: {lesson.status}\n\n"
         
         return response + "Type 'menu' to return to main menu."
@@ -589,11 +609,9 @@ class EnhancedWhatsAppBot:
             from enhanced_features import enhanced_features
             
             # Get dynamic pricing
-            pricing_30 = enhanced_features.pricing_engine.calculate_lesson_price(
-                student.id, instructor.id, 30, datetime.now() + timedelta(days=1)
-            )
-            pricing_60 = enhanced_features.pricing_engine.calculate_lesson_price(
-                student.id, instructor.id, 60, datetime.now() + timedelta(days=1)
+            lesson_date = datetime.now() + timedelta(days=1)
+            pricing_30, pricing_60 = enhanced_features.pricing_engine.calculate_lesson_prices(
+                student, [(instructor, 30, lesson_date), (instructor, 60, lesson_date)]
             )
             
             session_data = self.get_session_data(session)
@@ -749,7 +767,12 @@ class EnhancedWhatsAppBot:
             # Overall stats
             response += f"🎯 Test Readiness: {progress.test_readiness_score}%\n"
             response += f"📚 Total Lessons: {progress.total_lessons_completed}\n"
-            response += f"⏱️ Hours Driven: {progress.total_hours_driven:.1f}\n\n"
+            response += f"⏱️ Hours Driven: {progress.total_hours_driven:.1f}\n"
+            
+            standing = gamification['leaderboard'].get_student_rank(student.id)
+            if standing:
+                response += f"🏅 Leaderboard: #{standing['rank']} of {standing['out_of']}\n"
+            response += "\n"
             
             # Skills breakdown
             response += "🛣️ Driving Skills:\n"
@@ -815,7 +838,7 @@ class EnhancedWhatsAppBot:
             from models import LoyaltyProgram
             
             response = f"💰 Balance & Rewards\n\n"
-            response += f"💵 Current Balance: ${student.balance:.2f}\n"
+            response += f"💵 Current Balance: ${float(student.account_balance or 0):.2f}\n"
             
             # Loyalty program
             loyalty = LoyaltyProgram.query.filter_by(student_id=student.id).first()
@@ -837,7 +860,7 @@ class EnhancedWhatsAppBot:
             response += "1️⃣ Add Funds ($10, $25, $50, $100)\n"
             response += "2️⃣ Auto-Reload Setup\n"
             response += "3️⃣ Redeem Points\n"
-            response += "4️⃣ Promo Codes\n"
+            response += "4️⃣ Promo Codes (send 'promo CODE')\n"
             response += "5️⃣ Referral Program\n"
             response += "6️⃣ Payment History\n"
             response += "7️⃣ Main Menu"
@@ -846,7 +869,25 @@ class EnhancedWhatsAppBot:
             
         except Exception as e:
             logger.error(f"Error showing balance and rewards: {str(e)}")
-            return f"Balance: ${student.balance:.2f}\nType 'menu' to return."
+            return f"Balance: ${float(student.account_balance or 0):.2f}\nType 'menu' to return."
+    
+    def apply_promo_code(self, session, student, code):
+        """Validate a promo code and hold it for the student's next booking"""
+        lesson_cost = student.get_lesson_price(60)
+        result = PromoCodeService.validate(code, student, lesson_cost)
+        if not result.success:
+            return f"❌ {result.message}\n\nType 'menu' to return to main menu."
+        
+        session_data = self.get_session_data(session)
+        session_data['promo_code'] = result.promo.code
+        self.update_session_data(session, session_data)
+        
+        response = f"🎟️ Promo code {result.promo.code} saved!\n\n"
+        if result.promo.description:
+            response += f"{result.promo.description}\n\n"
+        response += "It will be applied when you confirm your next lesson booking.\n\n"
+        response += "Type '2' to book a lesson or 'menu' for main menu."
+        return response
     
     def show_safety_options(self, student):
         """Show safety and emergency options"""
@@ -1072,6 +1113,17 @@ class EnhancedWhatsAppBot:
             db.session.add(lesson)
             db.session.flush()  # Get lesson ID
             
+            # Redeem a held promo code; a failed redemption leaves the lesson at full price
+            promo_code = session_data.pop('promo_code', None)
+            promo_result = None
+            if promo_code:
+                promo_result = PromoCodeService.redeem(
+                    promo_code, student, float(lesson.cost), lesson_type, lesson=lesson
+                )
+                if promo_result.success:
+                    lesson.cost = float(lesson.cost) - promo_result.discount
+                    lesson.discount_applied = float(lesson.discount_applied or 0) + promo_result.discount
+            
             # Schedule automatic features
             try:
                 # Schedule reminder
@@ -1111,6 +1163,9 @@ class EnhancedWhatsAppBot:
             response += f"• Cost: ${lesson.cost:.0f}\n"
             response += f"• Type: {lesson_type.replace('_', ' ').title()}\n\n"
             
+            if promo_result:
+                response += f"🎟️ {promo_result.message}\n\n"
+            
             if lesson.is_recurring:
                 response += f"🔄 Recurring lessons set up ({lesson.recurring_pattern})\n\n"
             
@@ -1132,7 +1187,7 @@ class EnhancedWhatsAppBot:
             
             response += f"🎉 Enjoy your enhanced driving lesson!"
             
-            logger.info(f"Enhanced lesson booking completed: {lesson.id} for student {student.id}")
+            logger.info("Enhanced lesson booking completed: %s for student %s", lesson.id, student.id)
             return response
             
         except Exception as e:
@@ -1150,11 +1205,9 @@ class EnhancedWhatsAppBot:
             from enhanced_features import enhanced_features
             
             # Get dynamic pricing
-            pricing_30 = enhanced_features.pricing_engine.calculate_lesson_price(
-                student.id, instructor.id, 30, datetime.now() + timedelta(days=1)
-            )
-            pricing_60 = enhanced_features.pricing_engine.calculate_lesson_price(
-                student.id, instructor.id, 60, datetime.now() + timedelta(days=1)
+            lesson_date = datetime.now() + timedelta(days=1)
+            pricing_30, pricing_60 = enhanced_features.pricing_engine.calculate_lesson_prices(
+                student, [(instructor, 30, lesson_date), (instructor, 60, lesson_date)]
             )
             
             response = f"⏱️ Select lesson duration:\n\n"
@@ -1358,54 +1411,89 @@ class EnhancedWhatsAppBot:
     def start_instructor_search(self, session, student):
         """Start the AI-powered instructor search flow"""
         try:
-            from enhanced_features import enhanced_features
+            cursor, ranked = self.get_ranked_recommendations(student)
             
-            # Get smart recommendations using ML algorithm
-            recommendations = enhanced_features.get_smart_instructor_recommendations(
-                student.id, max_distance=15.0
-            )
+            if not ranked:
+                return "❌ No verified instructors available at the moment. Please try again later."
             
-            if not recommendations:
-                # Fallback to basic search
-                instructors = User.query.filter_by(role=ROLE_INSTRUCTOR, active=True, is_verified=True).limit(10).all()
-                if not instructors:
-                    return "❌ No verified instructors available at the moment. Please try again later."
-                
-                # Convert to recommendations format
-                recommendations = []
-                for instructor in instructors:
-                    distance = 0
-                    if student.latitude and instructor.latitude:
-                        distance = self.calculate_distance(
-                            student.latitude, student.longitude,
-                            instructor.latitude, instructor.longitude
-                        )
-                    
-                    recommendations.append({
-                        'instructor': instructor,
-                        'compatibility_score': 0.75,
-                        'match_percentage': 75,
-                        'distance': distance,
-                        'pricing': {'final_price': instructor.hourly_rate_60min or 25},
-                        'availability': {'available_today': True},
-                        'safety_score': 95
-                    })
-            
-            # Store recommendations in session
+            # Keep only a cursor into the recommendation cache in the session
             session_data = self.get_session_data(session)
+            session_data.pop('recommendations', None)
+            session_data.pop('recommendation_data', None)
             session_data['selecting_instructor'] = True
-            session_data['recommendations'] = [r['instructor'].id for r in recommendations]
-            session_data['recommendation_data'] = {r['instructor'].id: r for r in recommendations}
+            session_data['search_cursor'] = cursor
             session_data['current_page'] = 0
             self.update_session_data(session, session_data)
             
-            return self.show_smart_instructor_list(recommendations[:5], student, 0, len(recommendations))
+            return self.show_smart_instructor_list(self.load_recommendation_page(ranked, 0), student, 0, len(ranked))
             
         except Exception as e:
             logger.error(f"Error in smart instructor search: {str(e)}")
             # Fallback to basic search
             return self.start_basic_instructor_search(session, student)
     
+    def get_ranked_recommendations(self, student):
+        """Get (cursor, ranked instructors) for a student from the recommendation cache"""
+        return RecommendationCache.get_or_compute(
+            student.id, lambda: self.compute_recommendations(student), max_distance=15.0
+        )
+    
+    def compute_recommendations(self, student):
+        """Compute full instructor recommendations for a student"""
+        from enhanced_features import enhanced_features
+        
+        # Get smart recommendations using ML algorithm
+        recommendations = enhanced_features.get_smart_instructor_recommendations(
+            student.id, max_distance=15.0
+        )
+        
+        if not recommendations:
+            # Fallback to basic search
+            instructors = User.query.filter_by(role=ROLE_INSTRUCTOR, active=True, is_verified=True).limit(10).all()
+            
+            # Convert to recommendations format
+            recommendations = []
+            for instructor in instructors:
+                distance = 0
+                if student.latitude and instructor.latitude:
+                    distance = self.calculate_distance(
+                        student.latitude, student.longitude,
+                        instructor.latitude, instructor.longitude
+                    )
+                
+                recommendations.append({
+                    'instructor': instructor,
+                    'compatibility_score': 0.75,
+                    'match_percentage': 75,
+                    'distance': distance,
+                    'pricing': {'final_price': instructor.hourly_rate_60min or 25},
+                    'availability': {'available_today': True},
+                    'safety_score': 95
+                })
+        
+        return recommendations
+    
+    def load_recommendation_page(self, ranked, page):
+        """Load one page of ranked instructors (single query) in display format"""
+        rows = RecommendationCache.page(ranked, page)
+        instructors = {
+            instructor.id: instructor
+            for instructor in User.query.filter(User.id.in_([row.instructor_id for row in rows])).all()
+        } if rows else {}
+        
+        return [
+            {
+                'instructor': instructors[row.instructor_id],
+                'compatibility_score': row.compatibility_score,
+                'match_percentage': row.match_percentage,
+                'distance': row.distance,
+                'pricing': {'final_price': row.final_price, 'surge_multiplier': row.surge_multiplier},
+                'availability': {'available_today': row.available_today},
+                'safety_score': row.safety_score
+            }
+            for row in rows if row.instructor_id in instructors
+        ]
+    
     def start_basic_instructor_search(self, session, student):
         """Fallback basic instructor search"""
         instructors = User.query.filter_by(role=ROLE_INSTRUCTOR, active=True, is_verified=True).limit(10).all()
@@ -1532,16 +1620,19 @@ class EnhancedWhatsAppBot:
         """Handle instructor selection during search"""
         session_data = self.get_session_data(session)
         
-        # Check if using smart recommendations or basic list
-        recommendations = session_data.get('recommendations', [])
+        # Check if using smart recommendations (cached, via cursor) or basic list
+        recommendations = []
+        if session_data.get('search_cursor'):
+            # Recomputed only if the cached result set expired or lives in another worker
+            _, ranked = self.get_ranked_recommendations(student)
+            recommendations = [row.instructor_id for row in ranked]
         instructor_list = session_data.get('instructor_list', [])
         current_page = session_data.get('current_page', 0)
         
         if message == 'menu':
             session_data.pop('selecting_instructor', None)
             session_data.pop('instructor_list', None)
-            session_data.pop('recommendations', None)
-            session_data.pop('recommendation_data', None)
+            session_data.pop('search_cursor', None)
             self.update_session_data(session, session_data)
             return self.get_student_menu(student)
         
@@ -1555,13 +1646,7 @@ class EnhancedWhatsAppBot:
                     session_data['current_page'] = next_page
                     self.update_session_data(session, session_data)
                     
-                    # Get recommendation data
-                    rec_data = session_data.get('recommendation_data', {})
-                    page_recommendations = []
-                    for instructor_id in recommendations[start_idx:start_idx+5]:
-                        if instructor_id in rec_data:
-                            page_recommendations.append(rec_data[instructor_id])
-                    
+                    page_recommendations = self.load_recommendation_page(ranked, next_page)
                     return self.show_smart_instructor_list(page_recommendations, student, next_page, len(recommendations))
                 else:
                     return "No more matches to show. Type 'menu' to return."
@@ -1584,12 +1669,7 @@ class EnhancedWhatsAppBot:
                 
                 if recommendations:
                     # Smart recommendations flow
-                    rec_data = session_data.get('recommendation_data', {})
-                    page_recommendations = []
-                    for instructor_id in recommendations[start_idx:start_idx+5]:
-                        if instructor_id in rec_data:
-                            page_recommendations.append(rec_data[instructor_id])
-                    
+                    page_recommendations = self.load_recommendation_page(ranked, prev_page)
                     return self.show_smart_instructor_list(page_recommendations, student, prev_page, len(recommendations))
                 else:
                     # Basic list flow
@@ -1622,8 +1702,12 @@ class EnhancedWhatsAppBot:
             
             # Get recommendation data if available
             session_data = self.get_session_data(session)
-            rec_data = session_data.get('recommendation_data', {})
-            instructor_rec = rec_data.get(instructor.id, {})
+            ranked_row = RecommendationCache.find(session_data.get('search_cursor'), instructor.id)
+            instructor_rec = {
+                'match_percentage': ranked_row.match_percentage,
+                'safety_score': ranked_row.safety_score,
+                'availability': {'available_today': ranked_row.available_today}
+            } if ranked_row else {}
             
             # Calculate distance
             distance_text = ""
@@ -1896,11 +1980,9 @@ class EnhancedWhatsAppBot:
             response = f"💰 Pricing for {instructor.get_full_name()}\n\n"
             
             # Get pricing for different scenarios
-            pricing_30 = enhanced_features.pricing_engine.calculate_lesson_price(
-                student.id, instructor.id, 30, datetime.now() + timedelta(days=1)
-            )
-            pricing_60 = enhanced_features.pricing_engine.calculate_lesson_price(
-                student.id, instructor.id, 60, datetime.now() + timedelta(days=1)
+            lesson_date = datetime.now() + timedelta(days=1)
+            pricing_30, pricing_60 = enhanced_features.pricing_engine.calculate_lesson_prices(
+                student, [(instructor, 30, lesson_date), (instructor, 60, lesson_date)]
             )
             
             # 30-minute lesson
@@ -1929,29 +2011,20 @@ class EnhancedWhatsAppBot:
             
             # Pricing factors
             response += "📊 Pricing Factors:\n"
-            current_hour = datetime.now().hour
-            if 7 <= current_hour <= 9 or 17 <= current_hour <= 19:
-                response += "⬆️ Peak hours (7-9 AM, 5-7 PM)\n"
-            
-            if datetime.now().weekday() >= 5:
-                response += "⬆️ Weekend premium\n"
+            for rule_name in pricing_60.get('pricing_rules', []):
+                response += f"⬆️ {rule_name}\n"
             
             # Your benefits
             response += "\n🎁 Your Benefits:\n"
             if student.lessons_completed == 0:
                 response += "✨ 15% first-time student discount\n"
             
-            # Check loyalty program
-            try:
-                from models import LoyaltyProgram
-                loyalty = LoyaltyProgram.query.filter_by(student_id=student.id).first()
-                if loyalty:
-                    if loyalty.current_tier == 'Gold':
-                        response += "🥇 Gold member: 10% discount\n"
-                    elif loyalty.current_tier == 'Platinum':
-                        response += "🏆 Platinum member: 15% discount\n"
-            except:
-                pass
+            # Loyalty tier comes back with the quotes
+            loyalty_tier = pricing_60.get('loyalty_tier')
+            if loyalty_tier == 'Gold':
+                response += "🥇 Gold member: 10% discount\n"
+            elif loyalty_tier == 'Platinum':
+                response += "🏆 Platinum member: 15% discount\n"
             
             response += "\n💡 Save Money Tips:\n"
             response += "• Book off-peak hours\n"
@@ -2182,7 +2255,7 @@ class EnhancedWhatsAppBot:
         for lesson in lessons:
             response += f"⏰ {lesson.lesson_date.strftime('%H:%M')}\n"
             response += f"👤 {lesson.student.name}\n"
-            response += f"⏱️ {lesson.duration} minutes\n"
+            response += f"⏱️ {lesson.duration_minutes} minutes\n"
             response += f"📍 Status: {lesson.status}\n\n"
         
         return response + "Type 'menu' to return to main menu."
@@ -2200,7 +2273,7 @@ class EnhancedWhatsAppBot:
         for lesson in upcoming_lessons:
             response += f"📅 {lesson.lesson_date.strftime('%Y-%m-%d %H:%M')}\n"
             response += f"👤 {lesson.student.name}\n"
-            response += f"⏱️ {lesson.duration} minutes\n\n"
+            response += f"⏱️ {lesson.duration_minutes} minutes\n\n"
         
         return response + "Type 'menu' to return to main menu."
     
@@ -2272,10 +2345,10 @@ class EnhancedWhatsAppBot:
                     from_=self.twilio_phone,
                     to=f"whatsapp:{to_phone}"
                 )
-                logger.info(f"Message sent to {to_phone}: {message_obj.sid}")
+                logger.debug("WhatsApp message sent to %s", to_phone, extra={'message_sid': message_obj.sid})
                 return True
             else:
-                logger.warning(f"Mock send to {to_phone}: {message}")
+                logger.debug("Twilio not configured; message to %s not sent", to_phone)
                 return False
         except Exception as e:
             logger.error(f"Error sending message: {str(e)}")
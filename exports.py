@@ -0,0 +1,160 @@
+"""
+Exports for DriveLink
+Column-only queries behind the CSV exports of lessons, payments, commission
+records and students. They reuse the listing filters and join in the names a
+spreadsheet needs, and are meant to be iterated with csv_export.stream_query.
+"""
+from typing import Iterable, List, NamedTuple
+
+from sqlalchemy.orm import aliased
+
+from app import db
+from listings import filter_date_range, filter_lessons, filter_payments, filter_students, parse_date, parse_int
+from models import CommissionRecord, Lesson, Payment, Student, User
+from csv_export import stream_query
+
+
+class Export(NamedTuple):
+    filename: str
+    header: List[str]
+    rows: Iterable
+
+
+def _filename(kind: str, args) -> str:
+    """e.g. lessons_2024-01-01_2024-01-31.csv for a filtered range"""
+    date_from = parse_date(args.get('date_from'))
+    date_to = parse_date(args.get('date_to'))
+    if date_from or date_to:
+        return f"{kind}_{date_from or 'start'}_{date_to or 'today'}.csv"
+    return f"{kind}.csv"
+
+
+def lessons_export(user, args) -> Export:
+    """Lessons oldest first with student and instructor names (same filters as /lessons)"""
+    query = db.session.query(
+        Lesson.lesson_date,
+        Lesson.id,
+        Student.name,
+        Student.phone,
+        User.first_name,
+        User.last_name,
+        Lesson.duration_minutes,
+        Lesson.lesson_type,
+        Lesson.location,
+        Lesson.status,
+        Lesson.cost,
+        Lesson.discount_applied,
+        Lesson.promo_code
+    ).join(Student, Student.id == Lesson.student_id).join(User, User.id == Lesson.instructor_id)
+    query = filter_lessons(query, user, args).order_by(Lesson.lesson_date, Lesson.id)
+
+    rows = (
+        (lesson_date, lesson_id, student_name, phone, f"{first_name or ''} {last_name or ''}".strip(),
+         duration, lesson_type, location, status, cost, discount, promo_code)
+        for lesson_date, lesson_id, student_name, phone, first_name, last_name,
+            duration, lesson_type, location, status, cost, discount, promo_code
+        in stream_query(query)
+    )
+    return Export(_filename('lessons', args), [
+        'Date', 'Lesson ID', 'Student', 'Student Phone', 'Instructor', 'Duration (min)',
+        'Type', 'Location', 'Status', 'Cost', 'Discount', 'Promo Code'
+    ], rows)
+
+
+def payments_export(args) -> Export:
+    """Payments oldest first with student and processing admin names (same filters as /payments)"""
+    processor = aliased(User)
+    query = db.session.query(
+        Payment.created_at,
+        Payment.id,
+        Student.name,
+        Student.phone,
+        Payment.amount,
+        Payment.payment_type,
+        Payment.payment_method,
+        Payment.reference_number,
+        processor.first_name,
+        processor.last_name
+    ).join(Student, Student.id == Payment.student_id).outerjoin(processor, processor.id == Payment.processed_by)
+    query = filter_payments(query, args).order_by(Payment.created_at, Payment.id)
+
+    rows = (
+        (created_at, payment_id, student_name, phone, amount, payment_type, payment_method,
+         reference, f"{first_name or ''} {last_name or ''}".strip())
+        for created_at, payment_id, student_name, phone, amount, payment_type, payment_method,
+            reference, first_name, last_name
+        in stream_query(query)
+    )
+    return Export(_filename('payments', args), [
+        'Date', 'Payment ID', 'Student', 'Student Phone', 'Amount', 'Type', 'Method',
+        'Reference', 'Processed By'
+    ], rows)
+
+
+def commissions_export(user, args) -> Export:
+    """Commission records oldest first with lesson date and instructor name"""
+    query = db.session.query(
+        CommissionRecord.created_at,
+        CommissionRecord.id,
+        CommissionRecord.lesson_id,
+        Lesson.lesson_date,
+        User.first_name,
+        User.last_name,
+        CommissionRecord.lesson_amount,
+        CommissionRecord.commission_rate,
+        CommissionRecord.commission_amount,
+        CommissionRecord.instructor_earning,
+        CommissionRecord.paid_to_instructor
+    ).join(User, User.id == CommissionRecord.instructor_id).outerjoin(
+        Lesson, Lesson.id == CommissionRecord.lesson_id
+    )
+    if user.is_instructor():
+        query = query.filter(CommissionRecord.instructor_id == user.id)
+    elif parse_int(args.get('instructor_id')):
+        query = query.filter(CommissionRecord.instructor_id == parse_int(args.get('instructor_id')))
+    query = filter_date_range(query, CommissionRecord.created_at, args).order_by(
+        CommissionRecord.created_at, CommissionRecord.id
+    )
+
+    rows = (
+        (created_at, record_id, lesson_id, lesson_date, f"{first_name or ''} {last_name or ''}".strip(),
+         lesson_amount, commission_rate, commission_amount, instructor_earning, 'yes' if paid else 'no')
+        for created_at, record_id, lesson_id, lesson_date, first_name, last_name,
+            lesson_amount, commission_rate, commission_amount, instructor_earning, paid
+        in stream_query(query)
+    )
+    return Export(_filename('commission_records', args), [
+        'Recorded', 'Record ID', 'Lesson ID', 'Lesson Date', 'Instructor', 'Lesson Amount',
+        'Commission Rate', 'Commission', 'Instructor Earning', 'Paid Out'
+    ], rows)
+
+
+def students_export(user, args) -> Export:
+    """Active students by name with their instructor (same filters as /students, dates on registration)"""
+    query = db.session.query(
+        Student.id,
+        Student.name,
+        Student.phone,
+        Student.email,
+        Student.license_type,
+        User.first_name,
+        User.last_name,
+        Student.registration_date,
+        Student.lessons_completed,
+        Student.total_lessons_required,
+        Student.account_balance
+    ).outerjoin(User, User.id == Student.instructor_id)
+    query = filter_date_range(filter_students(query, user, args), Student.registration_date, args)
+    query = query.order_by(Student.name, Student.id)
+
+    rows = (
+        (student_id, name, phone, email, license_type, f"{first_name or ''} {last_name or ''}".strip(),
+         registered, completed, required, balance)
+        for student_id, name, phone, email, license_type, first_name, last_name,
+            registered, completed, required, balance
+        in stream_query(query)
+    )
+    return Export(_filename('students', args), [
+        'Student ID', 'Name', 'Phone', 'Email', 'License Type', 'Instructor', 'Registered',
+        'Lessons Completed', 'Lessons Required', 'Account Balance'
+    ], rows)
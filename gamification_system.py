@@ -482,80 +482,26 @@ class LeaderboardSystem:
     @staticmethod
     def get_leaderboard(category: str = 'overall', limit: int = 10) -> List[Dict]:
         """Get leaderboard for different categories"""
-        from models import StudentProgress, Student, LoyaltyProgram
+        from leaderboards import LeaderboardService
         
         try:
-            if category == 'overall':
-                # Overall ranking based on test readiness and total points
-                query = db.session.query(
-                    StudentProgress, Student, LoyaltyProgram
-                ).join(
-                    Student, StudentProgress.student_id == Student.id
-                ).outerjoin(
-                    LoyaltyProgram, Student.id == LoyaltyProgram.student_id
-                ).order_by(
-                    StudentProgress.test_readiness_score.desc(),
-                    LoyaltyProgram.total_points.desc()
-                ).limit(limit)
-                
-            elif category == 'test_readiness':
-                query = db.session.query(
-                    StudentProgress, Student
-                ).join(
-                    Student, StudentProgress.student_id == Student.id
-                ).order_by(
-                    StudentProgress.test_readiness_score.desc()
-                ).limit(limit)
-                
-            elif category == 'most_lessons':
-                query = db.session.query(
-                    StudentProgress, Student
-                ).join(
-                    Student, StudentProgress.student_id == Student.id
-                ).order_by(
-                    StudentProgress.total_lessons_completed.desc()
-                ).limit(limit)
-                
-            elif category == 'loyalty_points':
-                query = db.session.query(
-                    LoyaltyProgram, Student
-                ).join(
-                    Student, LoyaltyProgram.student_id == Student.id
-                ).order_by(
-                    LoyaltyProgram.total_points.desc()
-                ).limit(limit)
-            
-            else:
-                return []
-            
-            leaderboard = []
-            for i, result in enumerate(query.all(), 1):
-                if category == 'overall':
-                    progress, student, loyalty = result
-                    score = progress.test_readiness_score
-                    points = loyalty.total_points if loyalty else 0
-                elif category in ['test_readiness', 'most_lessons']:
-                    progress, student = result
-                    score = progress.test_readiness_score if category == 'test_readiness' else progress.total_lessons_completed
-                    points = 0
-                else:  # loyalty_points
-                    loyalty, student = result
-                    score = loyalty.total_points
-                    points = loyalty.total_points
-                
-                leaderboard.append({
-                    'rank': i,
-                    'student_name': student.name,
-                    'score': score,
-                    'points': points,
-                    'tier': getattr(loyalty, 'current_tier', 'Bronze') if category == 'overall' else None
-                })
-            
-            return leaderboard
+            return LeaderboardService.top(category, limit)
             
         except Exception as e:
             logger.error(f"Error getting leaderboard: {str(e)}")
             return []
+    
+    @staticmethod
+    def get_student_rank(student_id: int, category: str = 'overall') -> Optional[Dict]:
+        """Get a student's rank in a category ({'rank', 'out_of'}), or None if unranked"""
+        from leaderboards import LeaderboardService
+        
+        try:
+            return LeaderboardService.rank(student_id, category)
+            
+        except Exception as e:
+            logger.error(f"Error getting leaderboard rank: {str(e)}")
+            return None
 
 # Global instances
 gamification = {
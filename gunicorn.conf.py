@@ -0,0 +1,22 @@
+"""
+Gunicorn hooks for DriveLink. With --preload the master imports and warms the
+app once and every worker is forked from it, so workers start without
+importing or compiling anything.
+"""
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app import warm_up
+        warm_up()
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    # Connections the master opened belong to it; the worker opens its own
+    from app import app, db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
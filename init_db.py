@@ -50,6 +50,11 @@ def init_database():
                 db.session.commit()
                 logger.info("Default lesson pricing added")
             
+            # Add default pricing rules (peak hours, weekends, busy areas) if none exist
+            from pricing_rules import PricingRuleEngine
+            if PricingRuleEngine.seed_default_rules():
+                logger.info("Default pricing rules added")
+            
             # Add default system configurations
             default_configs = [
                 ('app_name', 'DriveLink', 'Application name'),
@@ -0,0 +1,236 @@
+"""
+Instructor Stats for DriveLink
+Keeps one instructor_stats row per instructor holding the current month's
+earnings and lesson count and the number of assigned students, maintained from
+CommissionRecord and Student mapper events, so the instructor stats API is a
+single primary-key read. Student events only adjust existing rows; instructors
+without a row have their students counted directly.
+
+Run this module directly to rebuild the table from commission records and
+student assignments; schema migration 5 fills it on existing databases.
+"""
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from sqlalchemy import case, event, func, select
+
+from rollups import previous_value, track_previous
+
+logger = logging.getLogger(__name__)
+
+
+class MonthlyCounters(NamedTuple):
+    monthly_earnings: float
+    monthly_lessons: int
+    student_count: int
+
+
+def _month_start(value) -> date:
+    day = value.date() if isinstance(value, datetime) else value
+    return day.replace(day=1)
+
+
+def add_commission(connection, instructor_id: Optional[int], created_at, earning, lessons: int):
+    """Add a commission (or, with negative values, remove one) to its instructor's month
+
+    A commission from a later month than the row holds starts that month's counters
+    afresh; removals only apply to the month the row currently holds. A new row
+    counts the instructor's students as they stand.
+    """
+    if instructor_id is None or created_at is None:
+        return
+    from models import InstructorStats, Student
+
+    table = InstructorStats.__table__
+    month = _month_start(created_at)
+    earning = Decimal(str(earning or 0))
+    now = datetime.now()
+
+    if lessons >= 0:
+        updates = {
+            'monthly_earnings': case((table.c.month == month, table.c.monthly_earnings + earning),
+                                     (table.c.month < month, earning), else_=table.c.monthly_earnings),
+            'monthly_lessons': case((table.c.month == month, table.c.monthly_lessons + lessons),
+                                    (table.c.month < month, lessons), else_=table.c.monthly_lessons),
+            'month': case((table.c.month < month, month), else_=table.c.month),
+        }
+    else:
+        updates = {
+            'monthly_earnings': case((table.c.month == month, table.c.monthly_earnings + earning),
+                                     else_=table.c.monthly_earnings),
+            'monthly_lessons': case((table.c.month == month, table.c.monthly_lessons + lessons),
+                                    else_=table.c.monthly_lessons),
+        }
+    updates['updated_at'] = now
+    values = {
+        'instructor_id': instructor_id,
+        'month': month,
+        'monthly_earnings': max(earning, Decimal('0')),
+        'monthly_lessons': max(lessons, 0),
+        'student_count': select(func.count(Student.id)).where(Student.instructor_id == instructor_id).scalar_subquery(),
+        'updated_at': now
+    }
+
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        connection.execute(
+            insert(table).values(**values).on_conflict_do_update(index_elements=['instructor_id'], set_=updates)
+        )
+        return
+
+    result = connection.execute(table.update().where(table.c.instructor_id == instructor_id).values(**updates))
+    if not result.rowcount:
+        connection.execute(table.insert().values(**values))
+
+
+def add_student(connection, instructor_id: Optional[int], delta: int):
+    """Adjust an instructor's student count
+
+    Only an existing row is adjusted: an instructor without one is counted from
+    students (see capacity_service), and a delta would not make a correct row.
+    """
+    if instructor_id is None or delta == 0:
+        return
+    from models import InstructorStats
+
+    table = InstructorStats.__table__
+    connection.execute(table.update().where(table.c.instructor_id == instructor_id).values(
+        student_count=table.c.student_count + delta, updated_at=datetime.now()
+    ))
+
+
+class InstructorStatsService:
+    """Read and rebuild the per-instructor counters"""
+
+    @staticmethod
+    def get(instructor_id: int) -> MonthlyCounters:
+        """The instructor's counters for the current month (students counted directly if there is no row yet)"""
+        from app import db
+        from models import InstructorStats, Student
+
+        row = db.session.get(InstructorStats, instructor_id)
+        if row is None:
+            students = db.session.scalar(select(func.count(Student.id)).where(Student.instructor_id == instructor_id))
+            return MonthlyCounters(0.0, 0, students)
+        if row.month != _month_start(date.today()):
+            # Nothing has been recorded this month yet
+            return MonthlyCounters(0.0, 0, row.student_count)
+        return MonthlyCounters(float(row.monthly_earnings), row.monthly_lessons, row.student_count)
+
+    @staticmethod
+    def rebuild() -> int:
+        """Recompute every instructor's row from commission records and students"""
+        from app import db
+
+        count = fill_instructor_stats(db.session.connection())
+        db.session.commit()
+
+        logger.info(f"Rebuilt stats for {count} instructors")
+        return count
+
+
+def fill_instructor_stats(connection) -> int:
+    """Replace every instructor's row with counts from the source tables (rebuild and schema migration)"""
+    from models import CommissionRecord, InstructorStats, Student, User, ROLE_INSTRUCTOR
+
+    month = _month_start(date.today())
+    student_counts = dict(connection.execute(
+        select(Student.instructor_id, func.count(Student.id))
+        .where(Student.instructor_id.isnot(None)).group_by(Student.instructor_id)
+    ).all())
+    monthly = {
+        instructor_id: (earnings, lessons)
+        for instructor_id, earnings, lessons in connection.execute(
+            select(CommissionRecord.instructor_id, func.sum(CommissionRecord.instructor_earning),
+                   func.count(CommissionRecord.id))
+            .where(CommissionRecord.created_at >= datetime.combine(month, datetime.min.time()))
+            .group_by(CommissionRecord.instructor_id)
+        )
+    }
+    instructor_ids = set(connection.execute(select(User.id).where(User.role == ROLE_INSTRUCTOR)).scalars())
+    instructor_ids |= set(student_counts) | set(monthly)
+
+    table = InstructorStats.__table__
+    connection.execute(table.delete())
+    now = datetime.now()
+    if instructor_ids:
+        connection.execute(table.insert(), [
+            {'instructor_id': instructor_id, 'month': month,
+             'monthly_earnings': monthly.get(instructor_id, (0, 0))[0] or 0,
+             'monthly_lessons': monthly.get(instructor_id, (0, 0))[1],
+             'student_count': student_counts.get(instructor_id, 0),
+             'updated_at': now}
+            for instructor_id in instructor_ids
+        ])
+    return len(instructor_ids)
+
+
+def _commission_inserted(mapper, connection, target):
+    add_commission(connection, target.instructor_id, target.created_at, target.instructor_earning, 1)
+
+
+def _commission_updated(mapper, connection, target):
+    old = (previous_value(target, 'instructor_id'), previous_value(target, 'created_at'),
+           previous_value(target, 'instructor_earning'))
+    new = (target.instructor_id, target.created_at, target.instructor_earning)
+    if old != new:
+        add_commission(connection, old[0], old[1], -Decimal(str(old[2] or 0)), -1)
+        add_commission(connection, *new, 1)
+
+
+def _commission_deleted(mapper, connection, target):
+    add_commission(connection, target.instructor_id, target.created_at,
+                   -Decimal(str(target.instructor_earning or 0)), -1)
+
+
+def _student_inserted(mapper, connection, target):
+    add_student(connection, target.instructor_id, 1)
+
+
+def _student_updated(mapper, connection, target):
+    old_instructor_id = previous_value(target, 'instructor_id')
+    if old_instructor_id != target.instructor_id:
+        add_student(connection, old_instructor_id, -1)
+        add_student(connection, target.instructor_id, 1)
+
+
+def _student_deleted(mapper, connection, target):
+    add_student(connection, target.instructor_id, -1)
+
+
+def register_instructor_stats_listeners():
+    """Keep instructor_stats in step with commission records and student assignments"""
+    from models import CommissionRecord, Student
+
+    # The update listeners reverse the old values
+    track_previous(CommissionRecord.instructor_id, CommissionRecord.created_at,
+                   CommissionRecord.instructor_earning, Student.instructor_id)
+
+    listeners = [
+        (CommissionRecord, 'after_insert', _commission_inserted),
+        (CommissionRecord, 'after_update', _commission_updated),
+        (CommissionRecord, 'after_delete', _commission_deleted),
+        (Student, 'after_insert', _student_inserted),
+        (Student, 'after_update', _student_updated),
+        (Student, 'after_delete', _student_deleted),
+    ]
+    for model, event_name, listener in listeners:
+        if not event.contains(model, event_name, listener):
+            event.listen(model, event_name, listener)
+
+
+register_instructor_stats_listeners()
+
+
+if __name__ == "__main__":
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    with app.app_context():
+        InstructorStatsService.rebuild()
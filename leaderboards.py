@@ -0,0 +1,368 @@
+"""
+Leaderboards for DriveLink
+Keeps every leaderboard category as an in-memory sorted list per worker,
+updated in place when StudentProgress or LoyaltyProgram rows are committed, so
+top-N and "what is my rank" are answered with a slice and a binary search
+instead of sorting every student. The top entries of each category are also
+saved to system_config, letting a worker that has not loaded the boards serve
+the usual top-N request from one row.
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from replica_routing import replica_reads
+
+logger = logging.getLogger(__name__)
+
+# Entries kept in the persisted snapshot of each category
+SNAPSHOT_SIZE = 50
+SNAPSHOT_KEY_PREFIX = 'leaderboard_top_'
+
+# (test readiness or None without a progress row, lessons completed, loyalty points or None)
+Scores = Tuple[Optional[int], int, Optional[int]]
+
+# category -> sort key (ascending) for a student's scores, or None when the student is not ranked
+CATEGORIES: Dict[str, Callable[[Scores], Optional[tuple]]] = {
+    'overall': lambda s: (-s[0], -(s[2] or 0)) if s[0] is not None else None,
+    'test_readiness': lambda s: (-s[0],) if s[0] is not None else None,
+    'most_lessons': lambda s: (-s[1],) if s[0] is not None else None,
+    'loyalty_points': lambda s: (-s[2],) if s[2] is not None else None,
+}
+
+
+class SortedBoard:
+    """Students ordered by sort key (ties by student id) with O(log n) position lookups"""
+
+    def __init__(self):
+        self._entries: List[tuple] = []
+        self._keys: Dict[int, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set(self, student_id: int, key: Optional[tuple]):
+        """Place a student at key, or take them off the board when key is None"""
+        old = self._keys.pop(student_id, None)
+        if old is not None:
+            index = bisect_left(self._entries, old + (student_id,))
+            del self._entries[index]
+        if key is not None:
+            self._keys[student_id] = key
+            insort(self._entries, key + (student_id,))
+
+    @classmethod
+    def from_keys(cls, keys: Dict[int, tuple]) -> 'SortedBoard':
+        """A board of every student in keys, built with one sort"""
+        board = cls()
+        board._keys = keys
+        board._entries = sorted(key + (student_id,) for student_id, key in keys.items())
+        return board
+
+    def top(self, limit: int) -> List[int]:
+        return [entry[-1] for entry in self._entries[:limit]]
+
+    def position(self, student_id: int) -> Optional[int]:
+        """1-based position of a student, or None if they are not on the board"""
+        key = self._keys.get(student_id)
+        if key is None:
+            return None
+        return bisect_left(self._entries, key + (student_id,)) + 1
+
+
+class LeaderboardService:
+    """Per-worker leaderboards, reloaded from the database every RELOAD_SECONDS"""
+
+    # Boards are updated in place for this worker's commits; the reload picks up
+    # changes committed by other workers
+    RELOAD_SECONDS = 60
+
+    _scores: Dict[int, Scores] = {}
+    _boards: Optional[Dict[str, SortedBoard]] = None
+    _loaded_at = 0.0
+    _lock = threading.RLock()
+    # Held by the one thread rebuilding the boards
+    _reload_lock = threading.Lock()
+
+    @staticmethod
+    def _fresh(loaded_at: float) -> bool:
+        return time.monotonic() - loaded_at <= LeaderboardService.RELOAD_SECONDS
+
+    @staticmethod
+    @replica_reads()
+    def load() -> Tuple[Dict[str, SortedBoard], Dict[int, Scores]]:
+        """Build every board from two narrow scans and save the top entries
+
+        The snapshot other workers serve is only saved from primary reads; a
+        replica may lag, and its top entries would stand for RELOAD_SECONDS.
+        """
+        from app import db
+        from models import LoyaltyProgram, StudentProgress
+
+        from_replica = db.session().reads_replica()
+
+        progress: Dict[int, Tuple[int, int]] = {}
+        for student_id, readiness, lessons in db.session.query(
+            StudentProgress.student_id, StudentProgress.test_readiness_score,
+            StudentProgress.total_lessons_completed
+        ).yield_per(1000):
+            progress[student_id] = (readiness or 0, lessons or 0)
+
+        points: Dict[int, int] = {}
+        for student_id, total_points in db.session.query(
+            LoyaltyProgram.student_id, LoyaltyProgram.total_points
+        ).yield_per(1000):
+            points[student_id] = total_points or 0
+
+        scores: Dict[int, Scores] = {}
+        for student_id in progress.keys() | points.keys():
+            readiness, lessons = progress.get(student_id, (None, 0))
+            scores[student_id] = (readiness, lessons, points.get(student_id))
+
+        boards = {}
+        for category, sort_key in CATEGORIES.items():
+            keys = {}
+            for student_id, student_scores in scores.items():
+                key = sort_key(student_scores)
+                if key is not None:
+                    keys[student_id] = key
+            boards[category] = SortedBoard.from_keys(keys)
+
+        with LeaderboardService._lock:
+            LeaderboardService._scores = scores
+            LeaderboardService._boards = boards
+            LeaderboardService._loaded_at = time.monotonic()
+        logger.info(f"Loaded leaderboards for {len(scores)} students")
+
+        if not from_replica:
+            for category in CATEGORIES:
+                LeaderboardService._save_snapshot(
+                    category, LeaderboardService._entries(category, SNAPSHOT_SIZE, boards, scores))
+        return boards, scores
+
+    @staticmethod
+    def _ensure_loaded() -> Tuple[Dict[str, SortedBoard], Dict[int, Scores]]:
+        """The loaded boards and scores, rebuilt by one thread at a time
+
+        Once boards are loaded, the request that finds them stale rebuilds them
+        while concurrent requests keep answering from the previous boards.
+        """
+        with LeaderboardService._lock:
+            boards, scores = LeaderboardService._boards, LeaderboardService._scores
+            fresh = LeaderboardService._fresh(LeaderboardService._loaded_at)
+        if boards is not None:
+            if not fresh and LeaderboardService._reload_lock.acquire(blocking=False):
+                try:
+                    boards, scores = LeaderboardService.load()
+                finally:
+                    LeaderboardService._reload_lock.release()
+            return boards, scores
+
+        with LeaderboardService._reload_lock:
+            # Another thread may have loaded them while this one waited
+            with LeaderboardService._lock:
+                boards, scores = LeaderboardService._boards, LeaderboardService._scores
+            if boards is None:
+                boards, scores = LeaderboardService.load()
+        return boards, scores
+
+    @staticmethod
+    def _entries(category: str, limit: int, boards: Dict[str, SortedBoard],
+                 all_scores: Dict[int, Scores]) -> List[Dict]:
+        """Leaderboard rows for the top students of a loaded board"""
+        from app import db
+        from models import LoyaltyProgram, Student
+
+        with LeaderboardService._lock:
+            student_ids = boards[category].top(limit)
+            scores = {student_id: all_scores[student_id] for student_id in student_ids}
+        if not student_ids:
+            return []
+
+        details = {
+            student_id: (name, tier)
+            for student_id, name, tier in db.session.query(
+                Student.id, Student.name, LoyaltyProgram.current_tier
+            ).outerjoin(
+                LoyaltyProgram, LoyaltyProgram.student_id == Student.id
+            ).filter(Student.id.in_(student_ids))
+        }
+
+        entries = []
+        for rank, student_id in enumerate(student_ids, 1):
+            readiness, lessons, points = scores[student_id]
+            name, tier = details.get(student_id, (None, None))
+            if category == 'overall':
+                score, shown_points = readiness, points or 0
+            elif category == 'test_readiness':
+                score, shown_points = readiness, 0
+            elif category == 'most_lessons':
+                score, shown_points = lessons, 0
+            else:
+                score, shown_points = points, points
+            entries.append({
+                'rank': rank,
+                'student_name': name,
+                'score': score,
+                'points': shown_points,
+                'tier': (tier or 'Bronze') if category == 'overall' else None
+            })
+        return entries
+
+    @staticmethod
+    def _save_snapshot(category: str, entries: List[Dict]):
+        """Store the top entries in system_config on a connection of its own"""
+        from app import db
+        from models import SystemConfig
+
+        table = SystemConfig.__table__
+        key = SNAPSHOT_KEY_PREFIX + category
+        value = json.dumps({'built_at': time.time(), 'entries': entries})
+        now = datetime.now()
+        try:
+            with db.engine.begin() as connection:
+                result = connection.execute(
+                    table.update().where(table.c.key == key).values(value=value, updated_at=now)
+                )
+                if not result.rowcount:
+                    connection.execute(table.insert().values(
+                        key=key, value=value, description=f'Top {SNAPSHOT_SIZE} of the {category} leaderboard',
+                        created_at=now, updated_at=now
+                    ))
+        except Exception as e:
+            # Another worker saving the same snapshot first is harmless
+            logger.error(f"Error saving {category} leaderboard snapshot: {str(e)}")
+
+    @staticmethod
+    def _load_snapshot(category: str) -> Optional[List[Dict]]:
+        """Saved top entries of a category, or None if missing or older than RELOAD_SECONDS"""
+        from models import SystemConfig
+
+        raw = SystemConfig.get_config(SNAPSHOT_KEY_PREFIX + category)
+        if not raw:
+            return None
+        try:
+            snapshot = json.loads(raw)
+        except ValueError:
+            return None
+        if time.time() - snapshot.get('built_at', 0) > LeaderboardService.RELOAD_SECONDS:
+            return None
+        return snapshot.get('entries')
+
+    @staticmethod
+    def top(category: str = 'overall', limit: int = 10) -> List[Dict]:
+        """The top students of a category"""
+        if category not in CATEGORIES:
+            return []
+
+        boards_loaded = (LeaderboardService._boards is not None and
+                         LeaderboardService._fresh(LeaderboardService._loaded_at))
+        if not boards_loaded and limit <= SNAPSHOT_SIZE:
+            entries = LeaderboardService._load_snapshot(category)
+            if entries is not None:
+                return entries[:limit]
+
+        boards, scores = LeaderboardService._ensure_loaded()
+        return LeaderboardService._entries(category, limit, boards, scores)
+
+    @staticmethod
+    def rank(student_id: int, category: str = 'overall') -> Optional[Dict]:
+        """A student's position in a category, or None if they are not ranked in it"""
+        if category not in CATEGORIES:
+            return None
+
+        boards, _ = LeaderboardService._ensure_loaded()
+        with LeaderboardService._lock:
+            board = boards[category]
+            position = board.position(student_id)
+            if position is None:
+                return None
+            return {'rank': position, 'out_of': len(board)}
+
+    @staticmethod
+    def apply(changes: List[Tuple[str, int, Optional[tuple]]]):
+        """Apply committed progress/loyalty changes to the loaded boards"""
+        with LeaderboardService._lock:
+            if LeaderboardService._boards is None:
+                return
+            for source, student_id, values in changes:
+                readiness, lessons, points = LeaderboardService._scores.get(student_id, (None, 0, None))
+                if source == 'progress':
+                    readiness, lessons = values if values is not None else (None, 0)
+                else:
+                    points = values[0] if values is not None else None
+
+                scores = (readiness, lessons, points)
+                if readiness is None and points is None:
+                    LeaderboardService._scores.pop(student_id, None)
+                else:
+                    LeaderboardService._scores[student_id] = scores
+                for category, sort_key in CATEGORIES.items():
+                    LeaderboardService._boards[category].set(student_id, sort_key(scores))
+
+    @staticmethod
+    def invalidate():
+        """Force a reload on the next lookup"""
+        with LeaderboardService._lock:
+            LeaderboardService._boards = None
+
+
+def _record(target, source: str, values: Optional[tuple]):
+    session = object_session(target)
+    if session is not None and target.student_id is not None:
+        session.info.setdefault('leaderboard_changes', []).append((source, target.student_id, values))
+
+
+def _progress_saved(mapper, connection, target):
+    _record(target, 'progress', (target.test_readiness_score or 0, target.total_lessons_completed or 0))
+
+
+def _progress_deleted(mapper, connection, target):
+    _record(target, 'progress', None)
+
+
+def _loyalty_saved(mapper, connection, target):
+    _record(target, 'loyalty', (target.total_points or 0,))
+
+
+def _loyalty_deleted(mapper, connection, target):
+    _record(target, 'loyalty', None)
+
+
+def _session_committed(session):
+    changes = session.info.pop('leaderboard_changes', None)
+    if changes:
+        LeaderboardService.apply(changes)
+
+
+def _session_rolled_back(session):
+    session.info.pop('leaderboard_changes', None)
+
+
+def register_leaderboard_listeners():
+    """Feed committed StudentProgress and LoyaltyProgram writes into the boards"""
+    from models import LoyaltyProgram, StudentProgress
+
+    listeners = [
+        (StudentProgress, 'after_insert', _progress_saved),
+        (StudentProgress, 'after_update', _progress_saved),
+        (StudentProgress, 'after_delete', _progress_deleted),
+        (LoyaltyProgram, 'after_insert', _loyalty_saved),
+        (LoyaltyProgram, 'after_update', _loyalty_saved),
+        (LoyaltyProgram, 'after_delete', _loyalty_deleted),
+        (Session, 'after_commit', _session_committed),
+        (Session, 'after_rollback', _session_rolled_back),
+    ]
+    for target, event_name, listener in listeners:
+        if not event.contains(target, event_name, listener):
+            event.listen(target, event_name, listener)
+
+
+register_leaderboard_listeners()
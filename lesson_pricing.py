@@ -0,0 +1,65 @@
+"""
+Lesson Pricing Table for DriveLink
+Process-wide copy of the lesson_pricing table (license class -> 30/60 minute
+price), invalidated across workers through a version stamp in system_config
+"""
+import threading
+import logging
+from typing import Dict, Optional, Tuple
+
+from cache_versions import VersionStamp
+
+logger = logging.getLogger(__name__)
+
+_version_stamp = VersionStamp('lesson_pricing_version')
+
+
+class LessonPriceTable:
+    """Cached license class -> (30 minute price, 60 minute price) lookups"""
+
+    _prices: Optional[Dict[str, Tuple[float, float]]] = None
+    _version: Optional[str] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def load():
+        """(Re)load all lesson pricing rows"""
+        from models import LessonPricing
+
+        # Read the version first so a change made while loading triggers another reload
+        version = _version_stamp.current()
+        prices = {
+            pricing.license_class: (float(pricing.price_per_30min), float(pricing.price_per_60min))
+            for pricing in LessonPricing.query.all()
+        }
+
+        with LessonPriceTable._lock:
+            LessonPriceTable._prices = prices
+            LessonPriceTable._version = version
+        logger.info(f"Loaded lesson pricing for {len(prices)} license classes")
+        return prices
+
+    @staticmethod
+    def get_prices() -> Dict[str, Tuple[float, float]]:
+        """Get the whole pricing table, reloading it if another worker changed it"""
+        prices = LessonPriceTable._prices
+        if prices is None or LessonPriceTable._version != _version_stamp.current():
+            prices = LessonPriceTable.load()
+        return prices
+
+    @staticmethod
+    def get_price(license_class: str, duration_minutes: int) -> float:
+        """Get the price of a lesson for a license class and duration"""
+        prices = LessonPriceTable.get_prices().get(license_class)
+        if not prices:
+            return 0
+
+        return prices[0] if duration_minutes <= 30 else prices[1]
+
+    @staticmethod
+    def invalidate():
+        """Drop this worker's copy and tell the other workers to drop theirs"""
+        _version_stamp.bump()
+        with LessonPriceTable._lock:
+            LessonPriceTable._prices = None
+            LessonPriceTable._version = None
@@ -0,0 +1,250 @@
+"""
+Listings for DriveLink
+Filtered, keyset-paginated queries behind the lessons, students and payments
+pages and their JSON variants. A page is located by the sort key of the last
+row shown, so its cost depends on the page size rather than on how much
+history sits in front of it.
+"""
+import base64
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import or_, select, tuple_
+
+from app import db
+from models import Lesson, Payment, Student, User, ROLE_INSTRUCTOR
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class KeysetPage(NamedTuple):
+    """One page of rows plus the cursor for the page after it (None on the last page)"""
+    items: List
+    next_cursor: Optional[str]
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Encode a row's sort key as an opaque URL-safe token"""
+    payload = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str], columns: Sequence) -> Optional[List]:
+    """Decode a cursor for the given sort columns, or None if it is missing or malformed"""
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            return None
+        values = []
+        for column, value in zip(columns, payload):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            # A tampered cursor could compare a string with an id; JSON true is an int too
+            if not isinstance(value, python_type) or (isinstance(value, bool) and python_type is not bool):
+                return None
+            values.append(value)
+        return values
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def page_size(value) -> int:
+    """Clamp a requested page size"""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+
+
+def keyset_page(query, columns: Sequence, cursor: Optional[str] = None,
+                limit: int = PAGE_SIZE, descending: bool = False) -> KeysetPage:
+    """Fetch the page of query after cursor, ordered by columns (the last must be unique)"""
+    after = decode_cursor(cursor, columns)
+    if after is not None:
+        key = tuple_(*columns)
+        query = query.filter(key < tuple_(*after) if descending else key > tuple_(*after))
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+    return KeysetPage(rows, next_cursor)
+
+
+def listing_filters(args) -> Dict[str, str]:
+    """The non-empty filter arguments of a request, without the cursor, for building page links"""
+    return {key: value for key, value in args.items() if value and key != 'after'}
+
+
+def parse_date(value: Optional[str]) -> Optional[date]:
+    """Parse a YYYY-MM-DD argument, or None if it is missing or malformed"""
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_int(value) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def filter_date_range(query, column, args):
+    """Filter column to the inclusive date_from/date_to days of args"""
+    date_from = parse_date(args.get('date_from'))
+    date_to = parse_date(args.get('date_to'))
+    if date_from:
+        query = query.filter(column >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        query = query.filter(column < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    return query
+
+
+def filter_lessons(query, user, args):
+    """Apply the lesson listing filters (and an instructor's own-lessons restriction) to a query on Lesson"""
+    if user.is_instructor():
+        query = query.filter(Lesson.instructor_id == user.id)
+    elif parse_int(args.get('instructor_id')):
+        query = query.filter(Lesson.instructor_id == parse_int(args.get('instructor_id')))
+
+    if args.get('status'):
+        query = query.filter(Lesson.status == args.get('status'))
+    if parse_int(args.get('student_id')):
+        query = query.filter(Lesson.student_id == parse_int(args.get('student_id')))
+
+    return filter_date_range(query, Lesson.lesson_date, args)
+
+
+def filter_students(query, user, args):
+    """Apply the student listing filters (and an instructor's own-students restriction) to a query on Student"""
+    query = query.filter(Student.is_active == True)
+
+    if user.is_instructor():
+        query = query.filter(Student.instructor_id == user.id)
+    elif parse_int(args.get('instructor_id')):
+        query = query.filter(Student.instructor_id == parse_int(args.get('instructor_id')))
+
+    if args.get('license_type'):
+        query = query.filter(Student.license_type == args.get('license_type'))
+    if args.get('q'):
+        pattern = f"%{args.get('q').strip()}%"
+        query = query.filter(or_(Student.name.ilike(pattern), Student.phone.ilike(pattern)))
+
+    return query
+
+
+def filter_payments(query, args):
+    """Apply the payment listing filters to a query on Payment"""
+    if args.get('payment_type'):
+        query = query.filter(Payment.payment_type == args.get('payment_type'))
+    if args.get('payment_method'):
+        query = query.filter(Payment.payment_method == args.get('payment_method'))
+    if parse_int(args.get('student_id')):
+        query = query.filter(Payment.student_id == parse_int(args.get('student_id')))
+    if parse_int(args.get('instructor_id')):
+        query = query.filter(Payment.student_id.in_(
+            select(Student.id).where(Student.instructor_id == parse_int(args.get('instructor_id')))
+        ))
+
+    return filter_date_range(query, Payment.created_at, args)
+
+
+def lessons_page(user, args) -> KeysetPage:
+    """Lessons newest first, filtered by status, date range, instructor and student"""
+    query = Lesson.query.options(db.joinedload(Lesson.student), db.joinedload(Lesson.instructor))
+    return keyset_page(filter_lessons(query, user, args), [Lesson.lesson_date, Lesson.id], args.get('after'),
+                       page_size(args.get('limit', PAGE_SIZE)), descending=True)
+
+
+def students_page(user, args) -> KeysetPage:
+    """Active students by name, filtered by instructor, license type and a name/phone search"""
+    query = Student.query.options(db.joinedload(Student.instructor))
+    return keyset_page(filter_students(query, user, args), [Student.name, Student.id], args.get('after'),
+                       page_size(args.get('limit', PAGE_SIZE)))
+
+
+def payments_page(args) -> KeysetPage:
+    """Payments newest first, filtered by date range, type, method, student and instructor"""
+    query = Payment.query.options(db.joinedload(Payment.student))
+    return keyset_page(filter_payments(query, args), [Payment.created_at, Payment.id], args.get('after'),
+                       page_size(args.get('limit', PAGE_SIZE)), descending=True)
+
+
+def instructors_page(args) -> KeysetPage:
+    """Instructors by username, filtered by a name/username search"""
+    query = User.query.filter(User.role == ROLE_INSTRUCTOR)
+    if args.get('q'):
+        pattern = f"%{args.get('q').strip()}%"
+        query = query.filter(or_(User.username.ilike(pattern), User.first_name.ilike(pattern),
+                                 User.last_name.ilike(pattern)))
+    return keyset_page(query, [User.username, User.id], args.get('after'), page_size(args.get('limit', PAGE_SIZE)))
+
+
+def lesson_to_dict(lesson: Lesson) -> Dict:
+    return {
+        'id': lesson.id,
+        'student_id': lesson.student_id,
+        'student_name': lesson.student.name if lesson.student else None,
+        'instructor_id': lesson.instructor_id,
+        'instructor_name': lesson.instructor.get_full_name() if lesson.instructor else None,
+        'scheduled_date': lesson.lesson_date.isoformat() if lesson.lesson_date else None,
+        'duration_minutes': lesson.duration_minutes,
+        'lesson_type': lesson.lesson_type,
+        'location': lesson.location,
+        'status': lesson.status,
+        'cost': float(lesson.cost or 0)
+    }
+
+
+def student_to_dict(student: Student) -> Dict:
+    return {
+        'id': student.id,
+        'name': student.name,
+        'phone': student.phone,
+        'email': student.email,
+        'license_type': student.license_type,
+        'account_balance': float(student.account_balance or 0),
+        'lessons_completed': student.lessons_completed,
+        'instructor_id': student.instructor_id,
+        'instructor_name': student.instructor.get_full_name() if student.instructor else None
+    }
+
+
+def payment_to_dict(payment: Payment) -> Dict:
+    return {
+        'id': payment.id,
+        'student_id': payment.student_id,
+        'student_name': payment.student.name if payment.student else None,
+        'amount': float(payment.amount),
+        'payment_type': payment.payment_type,
+        'payment_method': payment.payment_method,
+        'reference_number': payment.reference_number,
+        'created_at': payment.created_at.isoformat() if payment.created_at else None
+    }
+
+
+def instructor_to_dict(instructor: User) -> Dict:
+    return {
+        'id': instructor.id,
+        'name': instructor.get_full_name()
+    }
+
+
+def page_json(page: KeysetPage, serializer) -> Dict:
+    return {
+        'items': [serializer(item) for item in page.items],
+        'next_cursor': page.next_cursor
+    }
@@ -25,6 +25,13 @@ SUBSCRIPTION_CANCELLED = 'cancelled'
 SUBSCRIPTION_EXPIRED = 'expired'
 SUBSCRIPTION_SUSPENDED = 'suspended'
 
+# Maximum assigned students per subscription plan (None = unlimited)
+PLAN_STUDENT_LIMITS = {
+    SUBSCRIPTION_BASIC: 10,
+    SUBSCRIPTION_PREMIUM: 25,
+    SUBSCRIPTION_PRO: None
+}
+
 # Payment statuses
 PAYMENT_PENDING = 'pending'
 PAYMENT_COMPLETED = 'completed'
@@ -33,6 +40,12 @@ PAYMENT_REFUNDED = 'refunded'
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Sender lookups for WhatsApp messages and registration checks
+        db.Index('ix_user_phone', 'phone'),
+        # Instructor lists filter on role, active and is_verified together
+        db.Index('ix_user_role_active_verified', 'role', 'active', 'is_verified'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -146,16 +159,8 @@ class User(UserMixin, db.Model):
     
     def can_take_students(self):
         """Check if instructor can take new students based on subscription plan"""
-        if not self.has_active_subscription():
-            return False
-        
-        current_students = Student.query.filter_by(instructor_id=self.id).count()
-        limits = {
-            SUBSCRIPTION_BASIC: 10,
-            SUBSCRIPTION_PREMIUM: 25,
-            SUBSCRIPTION_PRO: float('inf')
-        }
-        return current_students < limits.get(self.subscription_plan, 0)
+        from capacity_service import InstructorCapacity
+        return InstructorCapacity.can_take_students(self)
     
     def get_commission_rate(self):
         """Get commission rate based on subscription plan"""
@@ -189,10 +194,16 @@ class User(UserMixin, db.Model):
 
 class Student(db.Model):
     __tablename__ = 'students'
+    __table_args__ = (
+        # An instructor's active students
+        db.Index('ix_student_instructor_active', 'instructor_id', 'is_active'),
+        # Students page order
+        db.Index('ix_student_name', 'name', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), unique=True, nullable=False)
-    email = db.Column(db.String(120), nullable=True)
+    email = db.Column(db.String(120), nullable=True, index=True)
     address = db.Column(db.Text, nullable=True)
     date_of_birth = db.Column(db.Date, nullable=True)
     license_type = db.Column(db.String(10), default='Class 4')
@@ -229,14 +240,8 @@ class Student(db.Model):
     
     def get_lesson_price(self, duration_minutes):
         """Get the price for a lesson based on duration and license class"""
-        pricing = LessonPricing.query.filter_by(license_class=self.license_type).first()
-        if not pricing:
-            return 0
-        
-        if duration_minutes <= 30:
-            return float(pricing.price_per_30min)
-        else:
-            return float(pricing.price_per_60min)
+        from lesson_pricing import LessonPriceTable
+        return LessonPriceTable.get_price(self.license_type, duration_minutes)
     
     def has_sufficient_balance(self, duration_minutes):
         """Check if student has enough balance for the lesson"""
@@ -276,6 +281,14 @@ class Student(db.Model):
 
 class Lesson(db.Model):
     __tablename__ = 'lessons'
+    __table_args__ = (
+        # Schedules, dashboards and conflict checks filter one instructor or student
+        # by status and a lesson_date range
+        db.Index('ix_lesson_instructor_status_date', 'instructor_id', 'status', 'lesson_date'),
+        db.Index('ix_lesson_student_status_date', 'student_id', 'status', 'lesson_date'),
+        # Lessons page order and date-range reports across instructors
+        db.Index('ix_lesson_date', 'lesson_date', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     
     # Foreign keys
@@ -285,6 +298,7 @@ class Lesson(db.Model):
     
     # Lesson details
     lesson_date = db.Column(db.DateTime, nullable=False)
+    scheduled_date = db.synonym('lesson_date')  # name used by the web routes and templates
     duration_minutes = db.Column(db.Integer, default=60)
     lesson_type = db.Column(db.String(50), default='practical')  # practical, theory, test
     location = db.Column(db.String(200), nullable=True)
@@ -355,7 +369,7 @@ class WhatsAppSession(db.Model):
     session_id = db.Column(db.String(100), unique=True, nullable=False)
     session_data = db.Column(db.Text, nullable=True)  # JSON data for registration/booking flows
     last_message = db.Column(db.Text, nullable=True)
-    last_activity = db.Column(db.DateTime, default=datetime.now)
+    last_activity = db.Column(db.DateTime, default=datetime.now, index=True)
     is_active = db.Column(db.Boolean, default=True)
     
     created_at = db.Column(db.DateTime, default=datetime.now)
@@ -391,6 +405,11 @@ class LessonPricing(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Payments page order, recent payments and date-range reports
+        db.Index('ix_payment_created', 'created_at', 'id'),
+        db.Index('ix_payment_student_created', 'student_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
@@ -401,7 +420,8 @@ class Payment(db.Model):
     # Admin who processed the payment
     processed_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    # Not nullable: the payments page pages by (created_at, id), which skips NULLs
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
     
     # Relationships
     student = db.relationship('Student', backref='payments')
@@ -409,6 +429,12 @@ class Payment(db.Model):
 
 class SystemConfig(db.Model):
     __tablename__ = 'system_config'
+    __table_args__ = (
+        # Prefix searches (key LIKE 'auth_state_%') cannot use the unique index under a
+        # non-C collation; pattern ops make them index range scans on PostgreSQL
+        db.Index('ix_system_config_key_pattern', 'key',
+                 postgresql_ops={'key': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(100), unique=True, nullable=False)
     value = db.Column(db.Text, nullable=True)
@@ -467,6 +493,11 @@ class InstructorSubscription(db.Model):
 class CommissionRecord(db.Model):
     """Tracks commission taken from each lesson"""
     __tablename__ = 'commission_records'
+    __table_args__ = (
+        # Instructor earnings over a created_at range, and the same range across instructors
+        db.Index('ix_commission_record_instructor_created', 'instructor_id', 'created_at'),
+        db.Index('ix_commission_record_created', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     instructor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     lesson_id = db.Column(db.Integer, db.ForeignKey('lessons.id'), nullable=False)
@@ -486,6 +517,68 @@ class CommissionRecord(db.Model):
     # Relationships
     lesson = db.relationship('Lesson', backref='commission_record')
 
+class DailyRevenueRollup(db.Model):
+    """Payments received per day, payment type and payment method"""
+    __tablename__ = 'daily_revenue_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'payment_type', 'payment_method', name='uq_daily_revenue_rollup'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    
+    day = db.Column(db.Date, nullable=False, index=True)
+    payment_type = db.Column(db.String(20), nullable=False, default='')
+    payment_method = db.Column(db.String(50), nullable=False, default='')  # '' when not recorded
+    
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    amount_total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+class DailyInstructorRollup(db.Model):
+    """Lessons (by lesson day) and commissions (by record day) per instructor per day"""
+    __tablename__ = 'daily_instructor_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'instructor_id', name='uq_daily_instructor_rollup'),
+        db.Index('ix_daily_instructor_rollup_instructor_day', 'instructor_id', 'day'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    
+    day = db.Column(db.Date, nullable=False, index=True)
+    instructor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    
+    lessons_scheduled = db.Column(db.Integer, nullable=False, default=0)
+    lessons_completed = db.Column(db.Integer, nullable=False, default=0)
+    lessons_cancelled = db.Column(db.Integer, nullable=False, default=0)
+    completed_lesson_value = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    
+    commission_count = db.Column(db.Integer, nullable=False, default=0)
+    lesson_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    commission_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    instructor_earning = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+class InstructorStats(db.Model):
+    """Current-month earnings and lessons plus student count, one row per instructor"""
+    __tablename__ = 'instructor_stats'
+    instructor_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    
+    # First day of the month the monthly counters belong to; older means they read as zero
+    month = db.Column(db.Date, nullable=False)
+    monthly_earnings = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    monthly_lessons = db.Column(db.Integer, nullable=False, default=0)
+    student_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+class SystemTotal(db.Model):
+    """A maintained row count for the super admin dashboard, one row per counted set"""
+    __tablename__ = 'system_totals'
+    name = db.Column(db.String(50), primary_key=True)  # 'students', 'lessons' or 'users:<role>', '#<slot>' for slots
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
 class InstructorReview(db.Model):
     """Student reviews and ratings for instructors"""
     __tablename__ = 'instructor_reviews'
@@ -702,6 +795,24 @@ class PricingRule(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
 
+class DemandBucket(db.Model):
+    """Booked and requested lesson counts for one area, week and (weekday, hour) slot"""
+    __tablename__ = 'demand_buckets'
+    __table_args__ = (
+        db.UniqueConstraint('area', 'week_start', 'weekday', 'hour', name='uq_demand_bucket'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    
+    area = db.Column(db.String(100), nullable=False, default='')  # normalized location, '' if unknown
+    week_start = db.Column(db.Date, nullable=False)  # Monday of the lesson's week
+    weekday = db.Column(db.SmallInteger, nullable=False)  # 0 = Monday
+    hour = db.Column(db.SmallInteger, nullable=False)
+    
+    booked_count = db.Column(db.Integer, nullable=False, default=0)
+    requested_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
 # Promo Codes and Discounts
 class PromoCode(db.Model):
     __tablename__ = 'promo_codes'
@@ -732,9 +843,34 @@ class PromoCode(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
 
+class PromoRedemption(db.Model):
+    __tablename__ = 'promo_redemptions'
+    # use_number runs 1..max_uses_per_user, so the unique constraint is what stops
+    # a student redeeming a code more often than allowed under concurrent requests
+    __table_args__ = (
+        db.UniqueConstraint('promo_code_id', 'student_id', 'use_number', name='uq_promo_redemption_use'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    
+    promo_code_id = db.Column(db.Integer, db.ForeignKey('promo_codes.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    lesson_id = db.Column(db.Integer, db.ForeignKey('lessons.id'), nullable=True)
+    use_number = db.Column(db.Integer, nullable=False, default=1)
+    
+    discount_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0.00)
+    redeemed_at = db.Column(db.DateTime, default=datetime.now)
+    
+    # Relationships
+    promo_code = db.relationship('PromoCode', backref='redemptions')
+    student = db.relationship('Student', backref='promo_redemptions')
+    lesson = db.relationship('Lesson', backref='promo_redemptions')
+
 # Real-time Location Tracking
 class LocationTracker(db.Model):
     __tablename__ = 'location_tracker'
+    __table_args__ = (
+        db.Index('ix_location_tracker_lesson_status', 'lesson_id', 'tracking_status'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     
     lesson_id = db.Column(db.Integer, db.ForeignKey('lessons.id'), nullable=False)
@@ -799,6 +935,10 @@ class StudentProgress(db.Model):
 # Safety and Verification
 class SafetyIncident(db.Model):
     __tablename__ = 'safety_incidents'
+    __table_args__ = (
+        # Per-instructor safety reports filter on the instructor and a reported_at range
+        db.Index('ix_safety_incident_instructor_reported', 'instructor_id', 'reported_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     
     lesson_id = db.Column(db.Integer, db.ForeignKey('lessons.id'), nullable=True)
@@ -820,7 +960,7 @@ class SafetyIncident(db.Model):
     resolved = db.Column(db.Boolean, default=False)
     resolution_notes = db.Column(db.Text, nullable=True)
     
-    reported_at = db.Column(db.DateTime, default=datetime.now)
+    reported_at = db.Column(db.DateTime, default=datetime.now, index=True)
     resolved_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
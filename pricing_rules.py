@@ -0,0 +1,293 @@
+"""
+Pricing Rule Engine for DriveLink
+Compiles active rows of the pricing_rules table into an index by weekday, hour
+and area so a quote only evaluates the rules that can match it
+
+Every matching rule adds (multiplier - 1.0) to the surge multiplier and its
+fixed_amount to the lesson price, whatever its rule_type (surge, discount, base)
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from cache_versions import VersionStamp
+
+logger = logging.getLogger(__name__)
+
+_version_stamp = VersionStamp('pricing_rules_version')
+
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DAY_ALIASES = {
+    'weekday': (0, 1, 2, 3, 4),
+    'weekend': (5, 6)
+}
+
+MIN_SURGE_MULTIPLIER = 0.5
+MAX_SURGE_MULTIPLIER = 2.5
+
+# Rules used when the pricing_rules table has no active rows; they reproduce
+# the previous hardcoded peak-hour, weekend and area premiums
+DEFAULT_RULES = [
+    {'rule_name': 'Weekday morning peak', 'rule_type': 'surge', 'day_of_week': 'weekday',
+     'start_time': '07:00', 'end_time': '10:00', 'multiplier': 1.3},
+    {'rule_name': 'Weekday evening peak', 'rule_type': 'surge', 'day_of_week': 'weekday',
+     'start_time': '17:00', 'end_time': '20:00', 'multiplier': 1.3},
+    {'rule_name': 'Weekend premium', 'rule_type': 'surge', 'day_of_week': 'weekend',
+     'multiplier': 1.2},
+    {'rule_name': 'Harare CBD demand', 'rule_type': 'surge', 'location_area': 'Harare CBD',
+     'multiplier': 1.1},
+    {'rule_name': 'Avondale demand', 'rule_type': 'surge', 'location_area': 'Avondale',
+     'multiplier': 1.1},
+    {'rule_name': 'Mount Pleasant demand', 'rule_type': 'surge', 'location_area': 'Mount Pleasant',
+     'multiplier': 1.1},
+]
+
+
+class CompiledRule(NamedTuple):
+    """A pricing rule reduced to what evaluation needs"""
+    rule_id: Optional[int]
+    rule_name: str
+    start_minute: int  # minute of day, inclusive
+    end_minute: int  # minute of day, exclusive; < start_minute wraps past midnight
+    min_distance_km: Optional[float]
+    max_distance_km: Optional[float]
+    multiplier_delta: float
+    fixed_amount: float
+
+    def matches(self, minute_of_day: int, distance_km: Optional[float]) -> bool:
+        if self.start_minute <= self.end_minute:
+            if not self.start_minute <= minute_of_day < self.end_minute:
+                return False
+        elif self.end_minute <= minute_of_day < self.start_minute:
+            return False
+
+        if self.min_distance_km is not None or self.max_distance_km is not None:
+            if distance_km is None:
+                return False
+            if self.min_distance_km is not None and distance_km < self.min_distance_km:
+                return False
+            if self.max_distance_km is not None and distance_km >= self.max_distance_km:
+                return False
+        return True
+
+
+class RuleQuote(NamedTuple):
+    """Result of evaluating the rules for one slot"""
+    surge_multiplier: float
+    fixed_amount: float
+    rule_names: Tuple[str, ...]
+
+
+def _parse_days(day_of_week: Optional[str]) -> Iterable[int]:
+    if not day_of_week:
+        return range(7)
+    key = day_of_week.strip().lower()
+    if key in DAY_ALIASES:
+        return DAY_ALIASES[key]
+    if key in DAY_NAMES:
+        return (DAY_NAMES.index(key),)
+    logger.warning(f"Ignoring pricing rule with unknown day_of_week {day_of_week!r}")
+    return ()
+
+
+def _minute_of_day(value, default: int) -> int:
+    if value is None:
+        return default
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%H:%M').time()
+    return value.hour * 60 + value.minute
+
+
+def _area_key(area: Optional[str]) -> Optional[str]:
+    return area.strip().lower() if area else None
+
+
+class PricingRuleEngine:
+    """Indexed, cached evaluator for pricing rules"""
+
+    # Rule edits made through the app reach every worker through the version
+    # stamp; edits made directly in the database are picked up after this many seconds
+    RELOAD_SECONDS = 300
+    QUOTE_CACHE_SIZE = 10000
+
+    # _index[weekday][hour] -> {area key or None: [CompiledRule, ...]}
+    _index: Optional[List[List[Dict[Optional[str], List[CompiledRule]]]]] = None
+    _version: Optional[str] = None
+    _loaded_at = 0.0
+    # Quotes computed from _index; replaced, never cleared, when the index changes
+    _quote_cache: Dict[tuple, RuleQuote] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def compile_rule(rule) -> Tuple[CompiledRule, Iterable[int], Optional[str]]:
+        """Compile a PricingRule row (or rule dict) into (rule, weekdays, area key)"""
+        if isinstance(rule, dict):
+            rule = SimpleNamespace(**{'id': None, 'day_of_week': None, 'start_time': None, 'end_time': None,
+                                      'min_distance_km': None, 'max_distance_km': None,
+                                      'location_area': None, 'multiplier': 1.0, 'fixed_amount': 0, **rule})
+
+        compiled = CompiledRule(
+            rule_id=rule.id,
+            rule_name=rule.rule_name,
+            start_minute=_minute_of_day(rule.start_time, 0),
+            end_minute=_minute_of_day(rule.end_time, 24 * 60),
+            min_distance_km=rule.min_distance_km,
+            max_distance_km=rule.max_distance_km,
+            multiplier_delta=float(rule.multiplier if rule.multiplier is not None else 1.0) - 1.0,
+            fixed_amount=float(rule.fixed_amount or 0)
+        )
+        return compiled, _parse_days(rule.day_of_week), _area_key(rule.location_area)
+
+    @staticmethod
+    def build_index(rules) -> List[List[Dict[Optional[str], List[CompiledRule]]]]:
+        """Place each compiled rule in every (weekday, hour) bucket it overlaps"""
+        index = [[{} for _ in range(24)] for _ in range(7)]
+        for rule in rules:
+            compiled, days, area = PricingRuleEngine.compile_rule(rule)
+            if compiled.start_minute <= compiled.end_minute:
+                hours = range(compiled.start_minute // 60, (compiled.end_minute + 59) // 60)
+            else:
+                hours = list(range(compiled.start_minute // 60, 24)) + list(range(0, (compiled.end_minute + 59) // 60))
+            for day in days:
+                for hour in hours:
+                    index[day][hour].setdefault(area, []).append(compiled)
+        return index
+
+    @staticmethod
+    def load():
+        """(Re)load active rules from the database; returns the new index and its quote cache"""
+        from models import PricingRule
+
+        # Read the version first so a change made while loading triggers another reload
+        version = _version_stamp.current()
+        rules = PricingRule.query.filter_by(is_active=True).all()
+        index = PricingRuleEngine.build_index(rules or DEFAULT_RULES)
+        quote_cache = {}
+
+        with PricingRuleEngine._lock:
+            PricingRuleEngine._index = index
+            PricingRuleEngine._version = version
+            PricingRuleEngine._loaded_at = time.monotonic()
+            PricingRuleEngine._quote_cache = quote_cache
+        logger.info(f"Loaded {len(rules) or len(DEFAULT_RULES)} pricing rules"
+                    f"{'' if rules else ' (defaults)'}")
+        return index, quote_cache
+
+    @staticmethod
+    def invalidate():
+        """Drop this worker's index and tell the other workers to drop theirs"""
+        _version_stamp.bump()
+        with PricingRuleEngine._lock:
+            PricingRuleEngine._index = None
+            PricingRuleEngine._version = None
+            PricingRuleEngine._quote_cache = {}
+
+    @staticmethod
+    def _ensure_loaded():
+        """The current index and its quote cache, reloaded if rules changed or RELOAD_SECONDS passed"""
+        with PricingRuleEngine._lock:
+            index, quote_cache = PricingRuleEngine._index, PricingRuleEngine._quote_cache
+            version, loaded_at = PricingRuleEngine._version, PricingRuleEngine._loaded_at
+        if (index is None or version != _version_stamp.current() or
+                time.monotonic() - loaded_at > PricingRuleEngine.RELOAD_SECONDS):
+            index, quote_cache = PricingRuleEngine.load()
+        return index, quote_cache
+
+    @staticmethod
+    def evaluate(when: datetime, area: Optional[str] = None,
+                 distance_km: Optional[float] = None) -> RuleQuote:
+        """Evaluate the rules that apply to one lesson start time"""
+        # Local references: an invalidate() in another thread swaps the class
+        # attributes, and a quote from the old index must not land in the new cache
+        index, quote_cache = PricingRuleEngine._ensure_loaded()
+
+        weekday = when.weekday()
+        minute_of_day = when.hour * 60 + when.minute
+        area = _area_key(area)
+        if distance_km is not None:
+            distance_km = round(distance_km, 1)
+
+        key = (weekday, minute_of_day, area, distance_km)
+        quote = quote_cache.get(key)
+        if quote is not None:
+            return quote
+
+        bucket = index[weekday][when.hour]
+        candidates = bucket.get(None, []) + (bucket.get(area, []) if area else [])
+
+        delta = 0.0
+        fixed = 0.0
+        names = []
+        for rule in candidates:
+            if rule.matches(minute_of_day, distance_km):
+                delta += rule.multiplier_delta
+                fixed += rule.fixed_amount
+                names.append(rule.rule_name)
+
+        multiplier = min(max(1.0 + delta, MIN_SURGE_MULTIPLIER), MAX_SURGE_MULTIPLIER)
+        quote = RuleQuote(round(multiplier, 4), round(fixed, 2), tuple(names))
+
+        with PricingRuleEngine._lock:
+            if len(quote_cache) >= PricingRuleEngine.QUOTE_CACHE_SIZE:
+                quote_cache.clear()
+            quote_cache[key] = quote
+        return quote
+
+    @staticmethod
+    def seed_default_rules():
+        """Insert DEFAULT_RULES into pricing_rules if the table is empty"""
+        from app import db
+        from models import PricingRule
+
+        if PricingRule.query.first():
+            return False
+
+        for rule_data in DEFAULT_RULES:
+            rule = PricingRule()
+            for key, value in rule_data.items():
+                if key in ('start_time', 'end_time'):
+                    value = datetime.strptime(value, '%H:%M').time()
+                setattr(rule, key, value)
+            db.session.add(rule)
+        db.session.commit()
+        return True
+
+
+def _pricing_rules_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['pricing_rules_changed'] = True
+
+
+def _session_committed(session):
+    if session.info.pop('pricing_rules_changed', False):
+        PricingRuleEngine.invalidate()
+
+
+def _session_rolled_back(session):
+    session.info.pop('pricing_rules_changed', None)
+
+
+def register_pricing_rule_listeners():
+    """Invalidate the compiled index in every worker once a PricingRule change is committed"""
+    from models import PricingRule
+
+    listeners = [
+        (PricingRule, 'after_insert', _pricing_rules_changed),
+        (PricingRule, 'after_update', _pricing_rules_changed),
+        (PricingRule, 'after_delete', _pricing_rules_changed),
+        (Session, 'after_commit', _session_committed),
+        (Session, 'after_rollback', _session_rolled_back),
+    ]
+    for target, event_name, listener in listeners:
+        if not event.contains(target, event_name, listener):
+            event.listen(target, event_name, listener)
+
+
+register_pricing_rule_listeners()
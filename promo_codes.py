@@ -0,0 +1,231 @@
+"""
+Promo Code Redemption for DriveLink
+Validates codes against a cached lookup and consumes uses with a conditional
+UPDATE plus a per-student redemption row, so concurrent redemptions of a
+campaign code neither oversell it nor lock the promo_codes table
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import PromoCode, PromoRedemption
+
+logger = logging.getLogger(__name__)
+
+
+class PromoSnapshot(NamedTuple):
+    """The immutable parts of a promo code needed to validate it"""
+    id: int
+    code: str
+    description: Optional[str]
+    discount_type: str
+    discount_value: float
+    max_discount: Optional[float]
+    max_uses_per_user: int
+    valid_from: datetime
+    valid_until: datetime
+    min_lesson_cost: Optional[float]
+    lesson_types: Optional[Tuple[str, ...]]
+    first_time_users_only: bool
+
+
+class PromoResult(NamedTuple):
+    """Outcome of validating or redeeming a code"""
+    success: bool
+    discount: float
+    message: str
+    promo: Optional[PromoSnapshot] = None
+
+
+def _normalize(code: str) -> str:
+    return (code or '').strip().upper()
+
+
+class PromoCodeService:
+    """Cached promo code lookups and atomic redemption"""
+
+    CACHE_TTL_SECONDS = 60
+
+    # code -> (loaded at, snapshot or None for unknown/inactive codes)
+    _codes: Dict[str, Tuple[float, Optional[PromoSnapshot]]] = {}
+    # ids of codes this worker has seen run out; cleared with the code cache
+    _exhausted: Dict[int, float] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _snapshot(promo: PromoCode) -> PromoSnapshot:
+        lesson_types = None
+        if promo.applicable_lesson_types:
+            try:
+                lesson_types = tuple(json.loads(promo.applicable_lesson_types))
+            except (ValueError, TypeError):
+                logger.warning(f"Ignoring malformed applicable_lesson_types on promo {promo.code}")
+
+        return PromoSnapshot(
+            id=promo.id,
+            code=promo.code,
+            description=promo.description,
+            discount_type=promo.discount_type,
+            discount_value=float(promo.discount_value),
+            max_discount=float(promo.max_discount) if promo.max_discount is not None else None,
+            max_uses_per_user=promo.max_uses_per_user or 1,
+            valid_from=promo.valid_from,
+            valid_until=promo.valid_until,
+            min_lesson_cost=float(promo.min_lesson_cost) if promo.min_lesson_cost is not None else None,
+            lesson_types=lesson_types,
+            first_time_users_only=bool(promo.first_time_users_only)
+        )
+
+    @staticmethod
+    def lookup(code: str) -> Optional[PromoSnapshot]:
+        """Get an active code from the cache, loading it on a miss"""
+        code = _normalize(code)
+        if not code:
+            return None
+
+        now = time.monotonic()
+        entry = PromoCodeService._codes.get(code)
+        if entry and now - entry[0] <= PromoCodeService.CACHE_TTL_SECONDS:
+            return entry[1]
+
+        promo = PromoCode.query.filter(
+            func.upper(PromoCode.code) == code,
+            PromoCode.is_active == True
+        ).first()
+        snapshot = PromoCodeService._snapshot(promo) if promo else None
+
+        with PromoCodeService._lock:
+            PromoCodeService._codes[code] = (now, snapshot)
+        return snapshot
+
+    @staticmethod
+    def calculate_discount(promo: PromoSnapshot, lesson_cost: float) -> float:
+        """Get the discount a code gives on a lesson cost"""
+        if promo.discount_type == 'percentage':
+            discount = lesson_cost * promo.discount_value / 100
+            if promo.max_discount is not None:
+                discount = min(discount, promo.max_discount)
+        else:
+            discount = promo.discount_value
+        return round(min(max(discount, 0), lesson_cost), 2)
+
+    @staticmethod
+    def validate(code: str, student, lesson_cost: float, lesson_type: Optional[str] = None) -> PromoResult:
+        """Check a code against everything that does not need a usage count"""
+        promo = PromoCodeService.lookup(code)
+        if not promo:
+            return PromoResult(False, 0, "This promo code is not valid.")
+
+        now = datetime.now()
+        if now < promo.valid_from:
+            return PromoResult(False, 0, "This promo code is not active yet.", promo)
+        if now > promo.valid_until:
+            return PromoResult(False, 0, "This promo code has expired.", promo)
+
+        exhausted_at = PromoCodeService._exhausted.get(promo.id)
+        if exhausted_at and time.monotonic() - exhausted_at <= PromoCodeService.CACHE_TTL_SECONDS:
+            return PromoResult(False, 0, "This promo code has been fully redeemed.", promo)
+
+        if promo.min_lesson_cost is not None and lesson_cost < promo.min_lesson_cost:
+            return PromoResult(False, 0, f"This promo code needs a lesson of at least ${promo.min_lesson_cost:.2f}.", promo)
+        if promo.lesson_types and lesson_type and lesson_type not in promo.lesson_types:
+            return PromoResult(False, 0, "This promo code does not apply to this lesson type.", promo)
+        if promo.first_time_users_only and (student.lessons_completed or 0) > 0:
+            return PromoResult(False, 0, "This promo code is for first-time students only.", promo)
+
+        discount = PromoCodeService.calculate_discount(promo, lesson_cost)
+        return PromoResult(True, discount, f"Promo {promo.code} applied: ${discount:.2f} off.", promo)
+
+    @staticmethod
+    def redeem(code: str, student, lesson_cost: float, lesson_type: Optional[str] = None,
+               lesson=None) -> PromoResult:
+        """Consume one use of a code for a student inside a savepoint (the caller commits)
+
+        The redemption row is inserted first so per-student limits are enforced by
+        the unique constraint, then the global counter is taken with
+        UPDATE ... WHERE current_uses < max_uses. Only the promo row is locked, and
+        only until the caller's commit. A use number taken by a concurrent
+        redemption of the same student moves on to the next free one.
+        """
+        result = PromoCodeService.validate(code, student, lesson_cost, lesson_type)
+        if not result.success:
+            return result
+        promo = result.promo
+
+        taken = set(db.session.scalars(select(PromoRedemption.use_number).where(
+            PromoRedemption.promo_code_id == promo.id,
+            PromoRedemption.student_id == student.id
+        )))
+        for use_number in range(1, promo.max_uses_per_user + 1):
+            if use_number in taken:
+                continue
+            savepoint = db.session.begin_nested()
+            try:
+                redemption = PromoRedemption()
+                redemption.promo_code_id = promo.id
+                redemption.student_id = student.id
+                redemption.lesson_id = lesson.id if lesson is not None else None
+                redemption.use_number = use_number
+                redemption.discount_amount = result.discount
+                db.session.add(redemption)
+                db.session.flush()
+            except IntegrityError:
+                savepoint.rollback()
+                continue
+            break
+        else:
+            return PromoResult(False, 0, "You have already used this promo code.", promo)
+
+        consumed = db.session.execute(
+            update(PromoCode)
+            .where(
+                PromoCode.id == promo.id,
+                PromoCode.is_active == True,
+                or_(PromoCode.max_uses.is_(None), PromoCode.current_uses < PromoCode.max_uses)
+            )
+            .values(current_uses=func.coalesce(PromoCode.current_uses, 0) + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        if not consumed:
+            savepoint.rollback()
+            with PromoCodeService._lock:
+                PromoCodeService._exhausted[promo.id] = time.monotonic()
+            return PromoResult(False, 0, "This promo code has been fully redeemed.", promo)
+
+        savepoint.commit()
+        if lesson is not None:
+            lesson.promo_code = promo.code
+        return result
+
+    @staticmethod
+    def invalidate(code: Optional[str] = None):
+        """Drop cached lookups for one code, or all of them"""
+        with PromoCodeService._lock:
+            if code is None:
+                PromoCodeService._codes.clear()
+                PromoCodeService._exhausted.clear()
+            else:
+                PromoCodeService._codes.pop(_normalize(code), None)
+
+
+def _promo_code_changed(mapper, connection, target):
+    # Admin edits (including raising max_uses) also reset the exhausted markers
+    PromoCodeService.invalidate()
+
+
+def register_promo_code_listeners():
+    """Invalidate cached lookups whenever a PromoCode row is changed through the ORM"""
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        if not event.contains(PromoCode, event_name, _promo_code_changed):
+            event.listen(PromoCode, event_name, _promo_code_changed)
+
+
+register_promo_code_listeners()
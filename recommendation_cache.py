@@ -0,0 +1,123 @@
+"""
+Recommendation Cache for DriveLink
+Keeps ranked instructor search results per (student, search parameters) so the
+WhatsApp bot can page through them without recomputing or storing them in the
+session
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+PAGE_SIZE = 5
+
+
+class RankedInstructor(NamedTuple):
+    """Compact, JSON-safe row for one ranked instructor"""
+    instructor_id: int
+    compatibility_score: float
+    match_percentage: int
+    distance: float
+    final_price: float
+    surge_multiplier: float
+    available_today: bool
+    safety_score: int
+
+
+class RecommendationCache:
+    """In-process TTL cache of ranked recommendation result sets"""
+
+    TTL_SECONDS = 600
+
+    _entries: Dict[str, Tuple[float, List[RankedInstructor]]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def make_cursor(student_id: int, **params) -> str:
+        """Build a deterministic cursor token for a student's search parameters"""
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:12]
+        return f"rec:{student_id}:{digest}"
+
+    @staticmethod
+    def to_ranked(recommendation: Dict) -> RankedInstructor:
+        """Reduce a full recommendation dict to the fields needed for display"""
+        instructor = recommendation['instructor']
+        pricing = recommendation.get('pricing') or {}
+        availability = recommendation.get('availability') or {}
+        return RankedInstructor(
+            instructor_id=instructor.id,
+            compatibility_score=float(recommendation.get('compatibility_score', 0.75)),
+            match_percentage=int(recommendation.get('match_percentage', 75)),
+            distance=float(recommendation.get('distance') or 0),
+            final_price=float(pricing.get('final_price', instructor.hourly_rate_60min or 25)),
+            surge_multiplier=float(pricing.get('surge_multiplier', 1.0)),
+            available_today=bool(availability.get('available_today')),
+            safety_score=int(recommendation.get('safety_score', 95))
+        )
+
+    @staticmethod
+    def get(cursor: str) -> Optional[List[RankedInstructor]]:
+        """Get a cached result set, or None if it is missing or expired"""
+        with RecommendationCache._lock:
+            entry = RecommendationCache._entries.get(cursor)
+            if not entry:
+                return None
+            created_at, ranked = entry
+            if time.monotonic() - created_at > RecommendationCache.TTL_SECONDS:
+                del RecommendationCache._entries[cursor]
+                return None
+            return ranked
+
+    @staticmethod
+    def store(cursor: str, recommendations: List[Dict]) -> List[RankedInstructor]:
+        """Rank and cache full recommendation dicts under a cursor"""
+        ranked = [RecommendationCache.to_ranked(r) for r in recommendations]
+        now = time.monotonic()
+
+        with RecommendationCache._lock:
+            # Drop expired result sets so the cache cannot grow without bound
+            expired = [key for key, (created_at, _) in RecommendationCache._entries.items()
+                       if now - created_at > RecommendationCache.TTL_SECONDS]
+            for key in expired:
+                del RecommendationCache._entries[key]
+            RecommendationCache._entries[cursor] = (now, ranked)
+        return ranked
+
+    @staticmethod
+    def get_or_compute(student_id: int, compute: Callable[[], List[Dict]],
+                       **params) -> Tuple[str, List[RankedInstructor]]:
+        """Return (cursor, ranked results), computing and caching on a miss"""
+        cursor = RecommendationCache.make_cursor(student_id, **params)
+        ranked = RecommendationCache.get(cursor)
+        if ranked is None:
+            # Empty results are not cached so newly verified instructors show up at once
+            recommendations = compute()
+            ranked = RecommendationCache.store(cursor, recommendations) if recommendations else []
+        return cursor, ranked
+
+    @staticmethod
+    def page(ranked: List[RankedInstructor], page: int) -> List[RankedInstructor]:
+        """Slice one page out of a ranked result set"""
+        start = page * PAGE_SIZE
+        return ranked[start:start + PAGE_SIZE]
+
+    @staticmethod
+    def find(cursor: Optional[str], instructor_id: int) -> Optional[RankedInstructor]:
+        """Find one instructor's row in a cached result set"""
+        ranked = RecommendationCache.get(cursor) if cursor else None
+        for row in ranked or []:
+            if row.instructor_id == instructor_id:
+                return row
+        return None
+
+    @staticmethod
+    def invalidate(student_id: Optional[int] = None):
+        """Drop cached result sets for one student, or all of them"""
+        with RecommendationCache._lock:
+            if student_id is None:
+                RecommendationCache._entries.clear()
+                return
+            prefix = f"rec:{student_id}:"
+            for key in [k for k in RecommendationCache._entries if k.startswith(prefix)]:
+                del RecommendationCache._entries[key]
@@ -0,0 +1,94 @@
+"""
+Read Replica Routing for DriveLink
+Sends the SELECTs of reports and dashboards to a read replica (the 'replica'
+bind, configured with REPLICA_DATABASE_URL) so report load stays off the
+primary that serves bookings and the WhatsApp webhook. Everything else, and all
+reads when no replica is configured, goes to the primary.
+
+Reads stay on the primary when replica data could be stale for the caller:
+- once the current session has written anything, for the rest of the request
+- for REPLICA_READ_YOUR_WRITES_SECONDS after a browser session committed a write
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_KEY = 'replica'
+
+# Browser session key holding the time of the user's last committed write
+LAST_WRITE_KEY = '_db_last_write'
+
+DEFAULT_READ_YOUR_WRITES_SECONDS = 5
+
+_use_replica: ContextVar[bool] = ContextVar('use_replica', default=False)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that routes plain SELECTs to the replica inside replica_reads()"""
+
+    def reads_replica(self) -> bool:
+        """Whether plain SELECTs of this session go to the replica at this point"""
+        return (_use_replica.get() and not self.info.get('wrote')
+                and self._db.engines.get(REPLICA_BIND_KEY) is not None)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and getattr(clause, 'is_select', False)
+                and getattr(clause, '_for_update_arg', None) is None and self.reads_replica()):
+            return self._db.engines[REPLICA_BIND_KEY]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _recently_wrote() -> bool:
+    if not has_request_context():
+        return False
+    last_write = flask_session.get(LAST_WRITE_KEY)
+    if not last_write:
+        return False
+    window = current_app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', DEFAULT_READ_YOUR_WRITES_SECONDS)
+    return time.time() - last_write < window
+
+
+@contextmanager
+def replica_reads():
+    """Route SELECTs inside the block (or decorated function) to the replica when it is safe"""
+    if _use_replica.get() or _recently_wrote():
+        yield
+        return
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+
+def _executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+def _committed(session):
+    if session.info.get('wrote') and has_request_context():
+        flask_session[LAST_WRITE_KEY] = time.time()
+
+
+def register_replica_listeners():
+    """Note writes so later reads in the request, and the user's next requests, use the primary"""
+    listeners = [
+        (RoutingSession, 'after_flush', _flushed),
+        (RoutingSession, 'do_orm_execute', _executed),
+        (RoutingSession, 'after_commit', _committed),
+    ]
+    for target, event_name, listener in listeners:
+        if not event.contains(target, event_name, listener):
+            event.listen(target, event_name, listener)
+
+
+register_replica_listeners()
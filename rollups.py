@@ -0,0 +1,323 @@
+"""
+Daily Rollups for DriveLink
+Maintains daily_revenue_rollups (per day, payment type and method) and
+daily_instructor_rollups (per day and instructor) from Payment, Lesson and
+CommissionRecord writes, in the same transaction as the write, so revenue and
+commission reports sum a few rollup rows instead of scanning history
+
+Run this module directly to rebuild both tables from the source rows; schema
+migration 6 fills them on existing databases.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, inspect, select
+
+logger = logging.getLogger(__name__)
+
+# (table, key column values, column deltas)
+Contribution = Tuple[object, Dict, Dict]
+
+
+def increment_counters(connection, table, key: Dict, deltas: Dict, insert_values: Optional[Dict] = None):
+    """Add deltas to the row of table identified by key, creating it if needed
+
+    Uses INSERT ... ON CONFLICT DO UPDATE on PostgreSQL and SQLite (the key columns
+    must carry a unique constraint) and UPDATE-then-INSERT elsewhere.
+    """
+    now = datetime.now()
+    values = {**key, **(insert_values if insert_values is not None else deltas), 'updated_at': now}
+    increments = {column: table.c[column] + delta for column, delta in deltas.items()}
+    increments['updated_at'] = now
+
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        connection.execute(
+            insert(table).values(**values).on_conflict_do_update(index_elements=list(key), set_=increments)
+        )
+        return
+
+    result = connection.execute(
+        table.update().where(*[table.c[column] == value for column, value in key.items()]).values(**increments)
+    )
+    if not result.rowcount:
+        connection.execute(table.insert().values(**values))
+
+
+def _keep_value(target, value, oldvalue, initiator):
+    return value
+
+
+def track_previous(*attributes):
+    """Keep the loaded old value of each attribute in its history when it is set
+
+    Attributes are expired after commit, so without active_history a later
+    assignment records no old value and update listeners cannot reverse it.
+    The one shared listener registers each attribute once, whichever module
+    asks for it.
+    """
+    for attribute in attributes:
+        if not event.contains(attribute, 'set', _keep_value):
+            event.listen(attribute, 'set', _keep_value, active_history=True, retval=True)
+
+
+def previous_value(target, attr: str):
+    """The value of a tracked attribute before the pending change (its current value if unchanged)"""
+    history = inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attr)
+
+
+def _day(value) -> Optional[date]:
+    if value is None:
+        return None
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else Decimal('0')
+
+
+def payment_contributions(created_at, payment_type, payment_method, amount) -> List[Contribution]:
+    from models import DailyRevenueRollup
+
+    day = _day(created_at)
+    if day is None:
+        return []
+    key = {'day': day, 'payment_type': payment_type or '', 'payment_method': payment_method or ''}
+    return [(DailyRevenueRollup.__table__, key, {'payment_count': 1, 'amount_total': _money(amount)})]
+
+
+def lesson_contributions(lesson_date, instructor_id, status, cost) -> List[Contribution]:
+    from models import DailyInstructorRollup, LESSON_COMPLETED, LESSON_CANCELLED
+
+    day = _day(lesson_date)
+    if day is None or instructor_id is None:
+        return []
+    if status == LESSON_COMPLETED:
+        deltas = {'lessons_completed': 1, 'completed_lesson_value': _money(cost)}
+    elif status == LESSON_CANCELLED:
+        deltas = {'lessons_cancelled': 1}
+    else:
+        deltas = {'lessons_scheduled': 1}
+    return [(DailyInstructorRollup.__table__, {'day': day, 'instructor_id': instructor_id}, deltas)]
+
+
+def commission_contributions(created_at, instructor_id, lesson_amount, commission_amount,
+                             instructor_earning) -> List[Contribution]:
+    from models import DailyInstructorRollup
+
+    day = _day(created_at)
+    if day is None or instructor_id is None:
+        return []
+    return [(DailyInstructorRollup.__table__, {'day': day, 'instructor_id': instructor_id}, {
+        'commission_count': 1,
+        'lesson_amount': _money(lesson_amount),
+        'commission_amount': _money(commission_amount),
+        'instructor_earning': _money(instructor_earning)
+    })]
+
+
+# model name -> (attributes passed to the contribution function, in order, and the function)
+SOURCES = {
+    'Payment': (('created_at', 'payment_type', 'payment_method', 'amount'), payment_contributions),
+    'Lesson': (('lesson_date', 'instructor_id', 'status', 'cost'), lesson_contributions),
+    'CommissionRecord': (('created_at', 'instructor_id', 'lesson_amount', 'commission_amount',
+                          'instructor_earning'), commission_contributions),
+}
+
+
+def _apply(connection, contributions: List[Contribution], sign: int):
+    for table, key, deltas in contributions:
+        increment_counters(connection, table, key, {column: delta * sign for column, delta in deltas.items()})
+
+
+def _contributions(target, use_previous: bool = False) -> List[Contribution]:
+    attrs, contribute = SOURCES[type(target).__name__]
+    if use_previous:
+        return contribute(*[previous_value(target, attr) for attr in attrs])
+    return contribute(*[getattr(target, attr) for attr in attrs])
+
+
+def _row_inserted(mapper, connection, target):
+    _apply(connection, _contributions(target), 1)
+
+
+def _row_updated(mapper, connection, target):
+    old = _contributions(target, use_previous=True)
+    new = _contributions(target)
+    if old != new:
+        _apply(connection, old, -1)
+        _apply(connection, new, 1)
+
+
+def _row_deleted(mapper, connection, target):
+    _apply(connection, _contributions(target), -1)
+
+
+def register_rollup_listeners():
+    """Keep the rollup tables in step with Payment, Lesson and CommissionRecord writes"""
+    import models
+
+    for model_name, (attrs, _) in SOURCES.items():
+        model = getattr(models, model_name)
+        # Updates are subtracted from the row the old values belong to
+        track_previous(*[getattr(model, attr) for attr in attrs])
+        for event_name, listener in (('after_insert', _row_inserted), ('after_update', _row_updated),
+                                     ('after_delete', _row_deleted)):
+            if not event.contains(model, event_name, listener):
+                event.listen(model, event_name, listener)
+
+
+def fill_rollups(connection) -> int:
+    """Replace both rollup tables with sums of the source rows (rebuild and schema migration)"""
+    import models
+
+    totals: Dict[Tuple[object, tuple], Dict[str, object]] = {}
+    keys: Dict[Tuple[object, tuple], Dict] = {}
+    for model_name, (attrs, contribute) in SOURCES.items():
+        model = getattr(models, model_name)
+        rows = connection.execute(select(*[getattr(model, attr) for attr in attrs]).execution_options(yield_per=1000))
+        for row in rows:
+            for table, key, deltas in contribute(*row):
+                bucket = (table, tuple(key.values()))
+                keys[bucket] = key
+                sums = totals.setdefault(bucket, defaultdict(int))
+                for column, delta in deltas.items():
+                    sums[column] += delta
+
+    tables = [models.DailyRevenueRollup.__table__, models.DailyInstructorRollup.__table__]
+    for table in tables:
+        connection.execute(table.delete())
+
+    now = datetime.now()
+    for table in tables:
+        rows = [{**keys[bucket], **sums, 'updated_at': now}
+                for bucket, sums in totals.items() if bucket[0] is table]
+        if rows:
+            # executemany needs the same columns in every row
+            columns = {column for row in rows for column in row}
+            connection.execute(table.insert(), [
+                {column: row.get(column, 0) for column in columns} for row in rows
+            ])
+    return len(totals)
+
+
+def rebuild():
+    """Recompute both rollup tables from the source rows"""
+    from app import db
+
+    count = fill_rollups(db.session.connection())
+    db.session.commit()
+
+    logger.info(f"Rebuilt {count} rollup rows")
+    return count
+
+
+class RollupReports:
+    """Report queries answered from the rollup tables (ranges are start inclusive, end exclusive)"""
+
+    @staticmethod
+    def _in_range(column, start: Optional[date], end: Optional[date]) -> list:
+        criteria = []
+        if start is not None:
+            criteria.append(column >= start)
+        if end is not None:
+            criteria.append(column < end)
+        return criteria
+
+    @staticmethod
+    def revenue_total(start: Optional[date] = None, end: Optional[date] = None) -> float:
+        from app import db
+        from models import DailyRevenueRollup
+
+        total = db.session.query(func.sum(DailyRevenueRollup.amount_total)).filter(
+            *RollupReports._in_range(DailyRevenueRollup.day, start, end)
+        ).scalar()
+        return float(total or 0)
+
+    @staticmethod
+    def revenue_by_method(start: Optional[date] = None, end: Optional[date] = None) -> List[Tuple[str, float]]:
+        from app import db
+        from models import DailyRevenueRollup
+
+        rows = db.session.query(
+            DailyRevenueRollup.payment_method,
+            func.sum(DailyRevenueRollup.amount_total)
+        ).filter(
+            *RollupReports._in_range(DailyRevenueRollup.day, start, end)
+        ).group_by(DailyRevenueRollup.payment_method).all()
+        return [(method or None, float(total or 0)) for method, total in rows]
+
+    @staticmethod
+    def commission_totals(start: Optional[date] = None, end: Optional[date] = None,
+                          instructor_id: Optional[int] = None):
+        """Sums of the commission and lesson columns over a range"""
+        from app import db
+        from models import DailyInstructorRollup as R
+
+        query = db.session.query(
+            func.coalesce(func.sum(R.commission_amount), 0).label('total_commission'),
+            func.coalesce(func.sum(R.instructor_earning), 0).label('total_instructor_earnings'),
+            func.coalesce(func.sum(R.lesson_amount), 0).label('total_lesson_amount'),
+            func.coalesce(func.sum(R.commission_count), 0).label('total_lessons'),
+            func.coalesce(func.sum(R.lessons_completed), 0).label('lessons_completed')
+        ).filter(*RollupReports._in_range(R.day, start, end))
+        if instructor_id is not None:
+            query = query.filter(R.instructor_id == instructor_id)
+        return query.one()
+
+    @staticmethod
+    def monthly_commissions(start: Optional[date] = None, end: Optional[date] = None):
+        """(year, month, commission, lessons) rows, oldest first"""
+        from app import db
+        from models import DailyInstructorRollup as R
+
+        year = func.extract('year', R.day)
+        month = func.extract('month', R.day)
+        return db.session.query(
+            year.label('year'),
+            month.label('month'),
+            func.sum(R.commission_amount).label('commission'),
+            func.sum(R.commission_count).label('lessons')
+        ).filter(
+            *RollupReports._in_range(R.day, start, end),
+            R.commission_count != 0
+        ).group_by(year, month).order_by(year, month).all()
+
+    @staticmethod
+    def top_instructors(limit: int = 10, start: Optional[date] = None, end: Optional[date] = None):
+        """(id, first_name, last_name, total_earnings, total_lessons) for the highest earners"""
+        from app import db
+        from models import DailyInstructorRollup as R, User
+
+        total_earnings = func.sum(R.instructor_earning).label('total_earnings')
+        return db.session.query(
+            User.id,
+            User.first_name,
+            User.last_name,
+            total_earnings,
+            func.sum(R.commission_count).label('total_lessons')
+        ).join(R, R.instructor_id == User.id).filter(
+            *RollupReports._in_range(R.day, start, end),
+            R.commission_count != 0
+        ).group_by(User.id, User.first_name, User.last_name).order_by(total_earnings.desc()).limit(limit).all()
+
+
+register_rollup_listeners()
+
+
+if __name__ == "__main__":
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    with app.app_context():
+        rebuild()
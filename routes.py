@@ -1,11 +1,23 @@
 from datetime import datetime, timedelta
 from flask import render_template, request, redirect, url_for, flash, session, jsonify
 from flask_login import current_user, login_user, logout_user
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, func
 
 from app import app, db
 from models import User, Student, Lesson, WhatsAppSession, SystemConfig, Vehicle, Payment, LessonPricing, LESSON_SCHEDULED, LESSON_COMPLETED, LESSON_CANCELLED, ROLE_STUDENT, ROLE_INSTRUCTOR, ROLE_ADMIN, ROLE_SUPER_ADMIN, InstructorSubscription, SubscriptionPlan, SUBSCRIPTION_ACTIVE
 from auth import require_login, require_role
+from lesson_pricing import LessonPriceTable
+from dashboard_stats import AdminDashboardStats, SystemStats
+from student_dashboard import StudentDashboard
+from listings import (
+    lessons_page, students_page, payments_page, instructors_page, page_json, listing_filters,
+    lesson_to_dict, student_to_dict, payment_to_dict, instructor_to_dict
+)
+from exports import lessons_export, payments_export, commissions_export, students_export
+from csv_export import csv_response
+from sql_instrumentation import SqlInstrumentation
+from engine_profiles import PoolMetrics
+from replica_routing import replica_reads
 from file_utils import save_uploaded_file, allowed_file
 import os
 # WhatsApp functionality will be imported when needed
@@ -389,162 +401,108 @@ def student_dashboard():
     
     # For students, find their Student record by phone number or email
     if current_user.is_student():
-        student = Student.query.filter(
-            or_(
-                Student.email == current_user.email,
-                Student.phone == current_user.phone
-            )
-        ).first()
+        student_id = StudentDashboard.find_student_id(current_user.phone, current_user.email)
         
-        if not student:
+        if student_id is None:
             flash('Student profile not found. Please contact admin to set up your profile.', 'error')
             return redirect(url_for('index'))
     else:
         # For admin/super_admin viewing a specific student (can be extended later)
-        student = Student.query.first()  # Placeholder - in real app would get from URL parameter
-    
-    # Get student's upcoming lessons
-    upcoming_lessons = Lesson.query.filter(
-        and_(
-            Lesson.student_id == student.id,
-            Lesson.status == LESSON_SCHEDULED,
-            Lesson.scheduled_date >= datetime.now()
-        )
-    ).order_by(Lesson.scheduled_date).limit(10).all()
+        student_id = db.session.query(Student.id).limit(1).scalar()  # Placeholder - in real app would get from URL parameter
     
-    # Get student's recent completed lessons
-    recent_lessons = Lesson.query.filter(
-        and_(
-            Lesson.student_id == student.id,
-            Lesson.status == LESSON_COMPLETED
-        )
-    ).order_by(Lesson.completed_date.desc()).limit(5).all()
+    # Profile, upcoming and recent lessons with instructor names, cached per student
+    view = StudentDashboard.get(student_id) if student_id is not None else None
+    if view is None:
+        flash('Student profile not found.', 'error')
+        return redirect(url_for('index'))
     
     return render_template('student_dashboard.html', 
-                         student=student,
-                         upcoming_lessons=upcoming_lessons,
-                         recent_lessons=recent_lessons)
+                         student=view.student,
+                         upcoming_lessons=view.upcoming_lessons,
+                         recent_lessons=view.recent_lessons)
 
 @app.route('/admin')
 @require_role('admin')
+@replica_reads()
 def admin_dashboard():
     """Admin dashboard for managing school operations"""
-    # Get all students
-    students = Student.query.filter_by(is_active=True).all()
-    
-    # Get all instructors with vehicle assignments
-    instructors = User.query.filter_by(role='instructor').all()
-    for instructor in instructors:
-        instructor.assigned_vehicles = Vehicle.query.filter_by(instructor_id=instructor.id, is_active=True).all()
-    
-    # Get vehicles with instructor relationships loaded
-    vehicles = Vehicle.query.options(db.joinedload(Vehicle.instructor)).filter_by(is_active=True).all()
-    
-    # Get recent payments
-    recent_payments = Payment.query.order_by(Payment.created_at.desc()).limit(5).all()
-    
-    # Get today's lessons
-    today_lessons = Lesson.query.filter(
-        Lesson.scheduled_date >= datetime.now().date(),
-        Lesson.scheduled_date < datetime.now().date() + timedelta(days=1)
-    ).all()
-    
-    # Get pending lessons
-    pending_lessons = Lesson.query.filter_by(status=LESSON_SCHEDULED).count()
-    
-    # Revenue calculations
-    from sqlalchemy import func
-    total_revenue = db.session.query(func.sum(Payment.amount)).scalar() or 0
-    
-    # This month's revenue
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-    this_month_revenue = db.session.query(func.sum(Payment.amount)).filter(
-        func.extract('month', Payment.created_at) == current_month,
-        func.extract('year', Payment.created_at) == current_year
-    ).scalar() or 0
-    
-    # Outstanding balances (negative account balances)
-    outstanding_balance = db.session.query(func.sum(Student.account_balance)).filter(
-        Student.account_balance < 0
-    ).scalar() or 0
-    outstanding_balance = abs(outstanding_balance)
-    
-    # Total account credits (positive balances)
-    total_credits = db.session.query(func.sum(Student.account_balance)).filter(
-        Student.account_balance > 0
-    ).scalar() or 0
-    
-    # Revenue by payment method this month
-    payment_methods = db.session.query(
-        Payment.payment_method,
-        func.sum(Payment.amount).label('total')
+    dashboard = AdminDashboardStats.get()
+    
+    # Only the first page of each list is loaded; totals come from the stats query
+    students = Student.query.options(
+        db.joinedload(Student.instructor)
+    ).filter_by(is_active=True).order_by(Student.id).limit(10).all()
+    
+    # Instructors with the most students (ranked in the cached stats), with their
+    # active vehicles loaded in one query
+    instructor_student_counts = dict(dashboard['top_instructors'])
+    ranking = list(instructor_student_counts)
+    instructors = sorted(User.query.options(
+        db.selectinload(User.assigned_vehicles.and_(Vehicle.is_active == True))
+    ).filter(User.id.in_(ranking)).all(), key=lambda instructor: ranking.index(instructor.id))
+    
+    vehicles = Vehicle.query.options(
+        db.joinedload(Vehicle.instructor)
+    ).filter_by(is_active=True).order_by(Vehicle.id).limit(10).all()
+    
+    recent_payments = Payment.query.options(
+        db.joinedload(Payment.student)
+    ).order_by(Payment.created_at.desc()).limit(5).all()
+    
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    today_lessons = Lesson.query.options(
+        db.joinedload(Lesson.student), db.joinedload(Lesson.instructor)
     ).filter(
-        func.extract('month', Payment.created_at) == current_month,
-        func.extract('year', Payment.created_at) == current_year
-    ).group_by(Payment.payment_method).all()
-    
-    stats = {
-        'total_students': len(students),
-        'total_instructors': len(instructors),
-        'todays_lessons': len(today_lessons),
-        'pending_lessons': pending_lessons,
-        'completed_lessons': Lesson.query.filter_by(status=LESSON_COMPLETED).count(),
-        'total_revenue': total_revenue,
-        'this_month_revenue': this_month_revenue,
-        'outstanding_balance': outstanding_balance,
-        'total_credits': total_credits
-    }
+        Lesson.scheduled_date >= today,
+        Lesson.scheduled_date < today + timedelta(days=1)
+    ).order_by(Lesson.scheduled_date).limit(10).all()
     
     return render_template('admin_dashboard.html', 
-                         students=students[:10],  # Show first 10
+                         students=students,
                          instructors=instructors,
+                         instructor_student_counts=instructor_student_counts,
                          vehicles=vehicles,
                          recent_payments=recent_payments,
                          today_lessons=today_lessons,
-                         payment_methods=payment_methods,
-                         stats=stats)
+                         payment_methods=dashboard['payment_methods'],
+                         stats=dashboard['stats'])
 
 @app.route('/super-admin')
 @require_role('super_admin')
 def super_admin_dashboard():
     """Super Admin dashboard for system configuration"""
-    # Get all users
-    all_users = User.query.all()
-    
-    # Get system statistics
-    stats = {
-        'total_users': len(all_users),
-        'instructors': len([u for u in all_users if u.is_instructor()]),
-        'admins': len([u for u in all_users if u.is_admin()]),
-        'super_admins': len([u for u in all_users if u.is_super_admin()]),
-        'total_students': Student.query.count(),
-        'total_lessons': Lesson.query.count(),
-        'active_whatsapp_sessions': WhatsAppSession.query.filter_by(is_active=True).count()
-    }
-    
-    # Get system configurations
-    configs = SystemConfig.query.all()
+    page = request.args.get('page', 1, type=int)
+    users_page = SystemStats.users_page(page)
     
     return render_template('super_admin_dashboard.html', 
-                         users=all_users,
-                         stats=stats,
-                         configs=configs)
+                         users=users_page.items,
+                         users_page=users_page,
+                         stats=SystemStats.get(),
+                         configs=SystemStats.config_entries())
 
 @app.route('/students')
 @require_login
 def students():
     """Student management page"""
-    if current_user.is_instructor():
-        # Instructors can only see their assigned students
-        students_list = Student.query.filter_by(instructor_id=current_user.id, is_active=True).all()
-    else:
-        # Admins and Super Admins can see all students
-        students_list = Student.query.filter_by(is_active=True).all()
+    # Instructors only ever see their assigned students (enforced in students_page)
+    page = students_page(current_user, request.args)
     
-    instructors = User.query.filter_by(role='instructor').all() if not current_user.is_instructor() else []
+    instructors = User.query.filter_by(role='instructor').order_by(User.first_name, User.last_name).all() if not current_user.is_instructor() else []
     
-    return render_template('students.html', students=students_list, instructors=instructors)
+    return render_template('students.html', students=page.items, next_cursor=page.next_cursor,
+                           filters=listing_filters(request.args), instructors=instructors)
+
+@app.route('/api/students')
+@require_login
+def api_students():
+    """One keyset page of students as JSON (same filters as /students)"""
+    return jsonify(page_json(students_page(current_user, request.args), student_to_dict))
+
+@app.route('/api/instructors')
+@require_role('admin')
+def api_instructors():
+    """One keyset page of instructors as JSON, for the vehicle assignment search"""
+    return jsonify(page_json(instructors_page(request.args), instructor_to_dict))
 
 @app.route('/students/add', methods=['POST'])
 @require_role('admin')
@@ -620,7 +578,7 @@ def assign_instructor(student_id):
     if instructor_id:
         instructor = User.query.get(instructor_id)
         if instructor and instructor.is_instructor():
-            student.instructor_id = instructor_id
+            student.instructor_id = instructor.id
             db.session.commit()
             flash(f'Instructor assigned to {student.name} successfully!', 'success')
         else:
@@ -655,25 +613,25 @@ def delete_student(student_id):
 @require_login
 def lessons():
     """Lesson management page"""
-    if current_user.is_instructor():
-        # Instructors see only their lessons
-        lessons_list = Lesson.query.filter_by(instructor_id=current_user.id).order_by(Lesson.scheduled_date.desc()).all()
-        # Get instructor's assigned vehicles
-        current_user.assigned_vehicles = Vehicle.query.filter_by(instructor_id=current_user.id, is_active=True).all()
-    else:
-        # Admins and Super Admins see all lessons
-        lessons_list = Lesson.query.order_by(Lesson.scheduled_date.desc()).all()
+    # Instructors only ever see their own lessons (enforced in lessons_page)
+    page = lessons_page(current_user, request.args)
     
-    # Get students for lesson booking (based on user role)
+    # The scheduling modal searches students through /api/students, so only check some exist
+    bookable = Student.query.filter_by(is_active=True)
     if current_user.is_instructor():
-        students_list = Student.query.filter_by(instructor_id=current_user.id, is_active=True).all()
-    else:
-        students_list = Student.query.filter_by(is_active=True).all()
+        bookable = bookable.filter_by(instructor_id=current_user.id)
+    has_students = db.session.query(bookable.exists()).scalar()
     
-    # Get all vehicles for admins
-    vehicles = Vehicle.query.filter_by(is_active=True).all() if not current_user.is_instructor() else []
+    instructors = User.query.filter_by(role='instructor').order_by(User.first_name, User.last_name).all() if not current_user.is_instructor() else []
     
-    return render_template('lessons.html', lessons=lessons_list, students=students_list, vehicles=vehicles)
+    return render_template('lessons.html', lessons=page.items, next_cursor=page.next_cursor,
+                           filters=listing_filters(request.args), has_students=has_students, instructors=instructors)
+
+@app.route('/api/lessons')
+@require_login
+def api_lessons():
+    """One keyset page of lessons as JSON (same filters as /lessons)"""
+    return jsonify(page_json(lessons_page(current_user, request.args), lesson_to_dict))
 
 @app.route('/api/check_lesson_limit')
 @require_login
@@ -978,10 +936,60 @@ def add_payment():
 @require_role('admin')
 def payments():
     """Payment management page"""
-    payments_list = Payment.query.order_by(Payment.created_at.desc()).all()
-    students_list = Student.query.filter_by(is_active=True).all()
+    page = payments_page(request.args)
+    
+    return render_template('payments.html', payments=page.items, next_cursor=page.next_cursor,
+                           filters=listing_filters(request.args))
+
+@app.route('/api/payments')
+@require_role('admin')
+def api_payments():
+    """One keyset page of payments as JSON (same filters as /payments)"""
+    return jsonify(page_json(payments_page(request.args), payment_to_dict))
+
+@app.route('/admin/sql-stats', methods=['GET', 'DELETE'])
+@require_role('admin')
+def admin_sql_stats():
+    """Statement counts and database time per endpoint for this worker (DELETE resets them)"""
+    if request.method == 'DELETE':
+        SqlInstrumentation.reset()
+    return jsonify(SqlInstrumentation.snapshot())
+
+@app.route('/admin/db-pool', methods=['GET', 'DELETE'])
+@require_role('admin')
+def admin_db_pool():
+    """Connection checkout waits and connections in use per engine for this worker (DELETE resets the counters)"""
+    if request.method == 'DELETE':
+        for engine in db.engines.values():
+            metrics = PoolMetrics.of(engine)
+            if metrics is not None:
+                metrics.reset()
+    return jsonify({
+        'profile': app.config.get('DB_PROFILE'),
+        'engines': {bind_key or 'primary': PoolMetrics.report(engine) for bind_key, engine in db.engines.items()},
+    })
+
+@app.route('/export/<kind>.csv')
+@require_login
+def export_csv(kind):
+    """Stream lessons, students, payments or commission records as CSV (same filters as the pages)"""
+    # Instructors may export their own lessons and students (enforced by the listing filters)
+    if kind == 'lessons':
+        export = lessons_export(current_user, request.args)
+    elif kind == 'students':
+        export = students_export(current_user, request.args)
+    elif kind in ('payments', 'commissions'):
+        if not (current_user.is_admin() or current_user.is_super_admin()):
+            flash('Access denied. Admin privileges required.', 'error')
+            return redirect(url_for('dashboard'))
+        if kind == 'payments':
+            export = payments_export(request.args)
+        else:
+            export = commissions_export(current_user, request.args)
+    else:
+        return jsonify({'error': 'Unknown export'}), 404
     
-    return render_template('payments.html', payments=payments_list, students=students_list)
+    return csv_response(export.filename, export.header, export.rows)
 
 @app.route('/pricing')
 def pricing():
@@ -1016,6 +1024,7 @@ def add_pricing():
         
         db.session.add(pricing)
         db.session.commit()
+        LessonPriceTable.invalidate()
         flash(f'Pricing added for {license_class} successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -1035,6 +1044,7 @@ def update_pricing(pricing_id):
         pricing.updated_at = datetime.now()
         
         db.session.commit()
+        LessonPriceTable.invalidate()
         flash(f'Pricing updated for {pricing.license_class} successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -1052,6 +1062,7 @@ def delete_pricing(pricing_id):
         
         db.session.delete(pricing)
         db.session.commit()
+        LessonPriceTable.invalidate()
         flash(f'Pricing deleted for {license_class} successfully!', 'success')
         return jsonify({'success': True})
     except Exception as e:
@@ -1074,38 +1085,37 @@ def complete_lesson(lesson_id):
     
 
 
+def due_lesson_reminders(current_time):
+    """Scheduled lessons due a 24-hour and a 2-hour reminder, with student and instructor loaded"""
+    def scheduled_between(start, end):
+        return Lesson.query.options(
+            db.joinedload(Lesson.student), db.joinedload(Lesson.instructor)
+        ).filter(
+            Lesson.status == LESSON_SCHEDULED,
+            Lesson.scheduled_date >= start,
+            Lesson.scheduled_date <= end
+        ).all()
+
+    # 24-hour reminders
+    tomorrow_start = current_time + timedelta(hours=24)
+    lessons_24h = scheduled_between(tomorrow_start, tomorrow_start + timedelta(hours=1))
+
+    # 2-hour reminders
+    soon_start = current_time + timedelta(hours=2)
+    lessons_2h = scheduled_between(soon_start, soon_start + timedelta(minutes=30))
+    return lessons_24h, lessons_2h
+
 @app.route('/api/send-lesson-reminders')
 @require_role('admin')
 def send_lesson_reminders():
     """Send automated lesson reminders"""
     from whatsappbot import whatsapp_bot
-    from datetime import timedelta
     
     try:
         # Initialize bot
         whatsapp_bot.initialize_twilio()
         
-        current_time = datetime.now()
-        
-        # 24-hour reminders
-        tomorrow_start = current_time + timedelta(hours=24)
-        tomorrow_end = tomorrow_start + timedelta(hours=1)
-        
-        lessons_24h = Lesson.query.filter(
-            Lesson.status == LESSON_SCHEDULED,
-            Lesson.scheduled_date >= tomorrow_start,
-            Lesson.scheduled_date <= tomorrow_end
-        ).all()
-        
-        # 2-hour reminders
-        soon_start = current_time + timedelta(hours=2)
-        soon_end = soon_start + timedelta(minutes=30)
-        
-        lessons_2h = Lesson.query.filter(
-            Lesson.status == LESSON_SCHEDULED,
-            Lesson.scheduled_date >= soon_start,
-            Lesson.scheduled_date <= soon_end
-        ).all()
+        lessons_24h, lessons_2h = due_lesson_reminders(datetime.now())
         
         sent_count = 0
         
@@ -1730,29 +1740,16 @@ def student_pin_dashboard():
         flash('Please log in to access your dashboard.', 'error')
         return redirect(url_for('student_login'))
     
-    student = Student.query.get(session['student_id'])
-    if not student or not student.is_active:
+    view = StudentDashboard.get(session['student_id'])
+    if not view or not view.student.is_active:
         session.clear()
         flash('Student account not found or inactive.', 'error')
         return redirect(url_for('student_login'))
     
-    # Get upcoming lessons
-    upcoming_lessons = Lesson.query.filter(
-        Lesson.student_id == student.id,
-        Lesson.status == LESSON_SCHEDULED,
-        Lesson.scheduled_date >= datetime.now()
-    ).order_by(Lesson.scheduled_date).limit(5).all()
-    
-    # Get recent completed lessons
-    recent_lessons = Lesson.query.filter(
-        Lesson.student_id == student.id,
-        Lesson.status == LESSON_COMPLETED
-    ).order_by(Lesson.completed_date.desc()).limit(5).all()
-    
     return render_template('student_dashboard.html', 
-                         student=student,
-                         upcoming_lessons=upcoming_lessons,
-                         recent_lessons=recent_lessons)
+                         student=view.student,
+                         upcoming_lessons=view.upcoming_lessons[:5],
+                         recent_lessons=view.recent_lessons)
 
 @app.route('/student-logout')
 def student_logout():
@@ -1767,14 +1764,14 @@ def student_lessons():
     if not session.get('student_logged_in') or not session.get('student_id'):
         return redirect(url_for('student_login'))
     
-    student = Student.query.get(session['student_id'])
-    if not student:
+    view = StudentDashboard.get(session['student_id'])
+    if not view:
         return redirect(url_for('student_login'))
     
     # Get all student lessons
-    all_lessons = Lesson.query.filter_by(student_id=student.id).order_by(Lesson.scheduled_date.desc()).all()
+    all_lessons = StudentDashboard.lessons(view.student.id)
     
-    return render_template('student_lessons.html', student=student, lessons=all_lessons)
+    return render_template('student_lessons.html', student=view.student, lessons=all_lessons)
 
 @app.route('/student-progress')
 def student_progress():
@@ -1782,17 +1779,14 @@ def student_progress():
     if not session.get('student_logged_in') or not session.get('student_id'):
         return redirect(url_for('student_login'))
     
-    student = Student.query.get(session['student_id'])
-    if not student:
+    view = StudentDashboard.get(session['student_id'])
+    if not view:
         return redirect(url_for('student_login'))
     
     # Get completed lessons with details
-    completed_lessons = Lesson.query.filter(
-        Lesson.student_id == student.id,
-        Lesson.status == LESSON_COMPLETED
-    ).order_by(Lesson.completed_date.desc()).all()
+    completed_lessons = StudentDashboard.lessons(view.student.id, LESSON_COMPLETED)
     
-    return render_template('student_progress.html', student=student, completed_lessons=completed_lessons)
+    return render_template('student_progress.html', student=view.student, completed_lessons=completed_lessons)
 
 @app.route('/student-profile')
 def student_profile():
@@ -1800,11 +1794,11 @@ def student_profile():
     if not session.get('student_logged_in') or not session.get('student_id'):
         return redirect(url_for('student_login'))
     
-    student = Student.query.get(session['student_id'])
-    if not student:
+    view = StudentDashboard.get(session['student_id'])
+    if not view:
         return redirect(url_for('student_login'))
     
-    return render_template('student_profile.html', student=student)
+    return render_template('student_profile.html', student=view.student)
 
 @app.route('/student-payments')
 def student_payments():
@@ -1812,14 +1806,14 @@ def student_payments():
     if not session.get('student_logged_in') or not session.get('student_id'):
         return redirect(url_for('student_login'))
     
-    student = Student.query.get(session['student_id'])
-    if not student:
+    view = StudentDashboard.get(session['student_id'])
+    if not view:
         return redirect(url_for('student_login'))
     
     # Get payment history
-    payments = Payment.query.filter_by(student_id=student.id).order_by(Payment.created_at.desc()).all()
+    payments = Payment.query.filter_by(student_id=view.student.id).order_by(Payment.created_at.desc()).all()
     
-    return render_template('student_payments.html', student=student, payments=payments)
+    return render_template('student_payments.html', student=view.student, payments=payments)
 
 @app.route('/cancel-student-lesson/<int:lesson_id>', methods=['POST'])
 def cancel_student_lesson(lesson_id):
@@ -13,8 +13,13 @@ import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
+from replica_routing import replica_reads
+
 logger = logging.getLogger(__name__)
 
+# Safety score deduction per incident, by severity (anything else counts as low)
+SEVERITY_DEDUCTIONS = {'critical': 20, 'high': 10, 'medium': 5, 'low': 2}
+
 class EmergencyProtocol:
     """Emergency response and safety protocols"""
     
@@ -454,16 +459,41 @@ class SafetyReporting:
     """Safety reporting and analytics"""
     
     @staticmethod
+    def _minutes_between(start, end):
+        """SQL expression for the minutes from start to end on the session's database"""
+        from sqlalchemy import func
+        from app import db
+        
+        if db.session.get_bind().dialect.name == 'sqlite':
+            return (func.julianday(end) - func.julianday(start)) * 1440
+        return func.extract('epoch', end - start) / 60
+    
+    @staticmethod
+    @replica_reads()
     def generate_safety_report(instructor_id: int = None, 
                              date_range: Tuple[datetime, datetime] = None) -> Dict:
         """Generate comprehensive safety report"""
-        from models import SafetyIncident, Lesson, User
+        from sqlalchemy import func
+        from app import db
+        from models import SafetyIncident
         
         try:
-            query = SafetyIncident.query
+            # One row per (type, severity) pair, so memory does not grow with the
+            # number of incidents; filters use ix_safety_incident_instructor_reported
+            resolution_minutes = SafetyReporting._minutes_between(
+                SafetyIncident.reported_at, SafetyIncident.resolved_at
+            )
+            query = db.session.query(
+                SafetyIncident.incident_type,
+                SafetyIncident.severity,
+                func.count(SafetyIncident.id),
+                func.count(SafetyIncident.id).filter(SafetyIncident.resolved == True),
+                func.count(SafetyIncident.resolved_at),
+                func.sum(resolution_minutes)
+            )
             
             if instructor_id:
-                query = query.filter_by(instructor_id=instructor_id)
+                query = query.filter(SafetyIncident.instructor_id == instructor_id)
             
             if date_range:
                 start_date, end_date = date_range
@@ -472,26 +502,25 @@ class SafetyReporting:
                     SafetyIncident.reported_at <= end_date
                 )
             
-            incidents = query.all()
+            groups = query.group_by(SafetyIncident.incident_type, SafetyIncident.severity).all()
             
-            # Calculate statistics
-            total_incidents = len(incidents)
-            critical_incidents = len([i for i in incidents if i.severity == 'critical'])
-            resolved_incidents = len([i for i in incidents if i.resolved])
-            
-            # Incident breakdown by type
+            # Fold the groups into the report totals
+            total_incidents = 0
+            resolved_incidents = 0
+            timed_incidents = 0
+            total_response_minutes = 0.0
             incident_types = {}
-            for incident in incidents:
-                incident_types[incident.incident_type] = incident_types.get(incident.incident_type, 0) + 1
-            
-            # Response time analysis
-            response_times = []
-            for incident in incidents:
-                if incident.resolved_at:
-                    response_time = (incident.resolved_at - incident.reported_at).total_seconds() / 60
-                    response_times.append(response_time)
-            
-            avg_response_time = sum(response_times) / len(response_times) if response_times else 0
+            severity_counts = {}
+            for incident_type, severity, count, resolved, timed, minutes in groups:
+                total_incidents += count
+                resolved_incidents += resolved
+                timed_incidents += timed
+                total_response_minutes += float(minutes or 0)
+                incident_types[incident_type] = incident_types.get(incident_type, 0) + count
+                severity_counts[severity] = severity_counts.get(severity, 0) + count
+            
+            critical_incidents = severity_counts.get('critical', 0)
+            avg_response_time = total_response_minutes / timed_incidents if timed_incidents else 0
             
             return {
                 'total_incidents': total_incidents,
@@ -500,8 +529,8 @@ class SafetyReporting:
                 'resolution_rate': resolved_incidents / total_incidents if total_incidents > 0 else 100,
                 'incident_types': incident_types,
                 'avg_response_time_minutes': avg_response_time,
-                'safety_score': SafetyReporting._calculate_safety_score(incidents),
-                'recommendations': SafetyReporting._generate_recommendations(incidents)
+                'safety_score': SafetyReporting._calculate_safety_score(severity_counts),
+                'recommendations': SafetyReporting._generate_recommendations(incident_types)
             }
             
         except Exception as e:
@@ -509,37 +538,19 @@ class SafetyReporting:
             return {}
     
     @staticmethod
-    def _calculate_safety_score(incidents: List) -> int:
-        """Calculate overall safety score (0-100)"""
-        if not incidents:
-            return 100
-        
-        # Base score
-        base_score = 100
-        
-        # Deductions based on incident severity
-        for incident in incidents:
-            if incident.severity == 'critical':
-                base_score -= 20
-            elif incident.severity == 'high':
-                base_score -= 10
-            elif incident.severity == 'medium':
-                base_score -= 5
-            else:
-                base_score -= 2
-        
-        return max(0, base_score)
+    def _calculate_safety_score(severity_counts: Dict[str, int]) -> int:
+        """Calculate overall safety score (0-100) from incident counts per severity"""
+        deductions = sum(
+            SEVERITY_DEDUCTIONS.get(severity, SEVERITY_DEDUCTIONS['low']) * count
+            for severity, count in severity_counts.items()
+        )
+        return max(0, 100 - deductions)
     
     @staticmethod
-    def _generate_recommendations(incidents: List) -> List[str]:
-        """Generate safety recommendations based on incident patterns"""
+    def _generate_recommendations(incident_types: Dict[str, int]) -> List[str]:
+        """Generate safety recommendations from incident counts per type"""
         recommendations = []
         
-        # Analyze incident patterns
-        incident_types = {}
-        for incident in incidents:
-            incident_types[incident.incident_type] = incident_types.get(incident.incident_type, 0) + 1
-        
         # Generate targeted recommendations
         if incident_types.get('panic_button', 0) > 2:
             recommendations.append("Consider additional safety training for instructors")
@@ -0,0 +1,214 @@
+"""
+Schema Migrations for DriveLink
+Numbered, forward-only schema changes for databases created before a model
+change (db.create_all() only adds missing tables, never indexes or columns on
+existing ones). The highest applied version is kept in system_config under
+schema_version, and every migration is written to be safe to re-run.
+
+Run this module directly to apply pending migrations, or with --status to list
+them.
+"""
+import logging
+import sys
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import func, select, text
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'schema_version'
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable  # (connection) -> None, run on an autocommit connection
+
+
+# (name, table, columns) for the hot query filters, mirrored by __table_args__ in models.py
+QUERY_INDEXES = [
+    ('ix_lesson_instructor_status_date', 'lessons', 'instructor_id, status, lesson_date'),
+    ('ix_lesson_student_status_date', 'lessons', 'student_id, status, lesson_date'),
+    ('ix_lesson_date', 'lessons', 'lesson_date, id'),
+    ('ix_user_phone', 'users', 'phone'),
+    ('ix_user_role_active_verified', 'users', 'role, active, is_verified'),
+    ('ix_student_instructor_active', 'students', 'instructor_id, is_active'),
+    ('ix_student_name', 'students', 'name, id'),
+    ('ix_location_tracker_lesson_status', 'location_tracker', 'lesson_id, tracking_status'),
+    ('ix_commission_record_instructor_created', 'commission_records', 'instructor_id, created_at'),
+    ('ix_commission_record_created', 'commission_records', 'created_at'),
+    ('ix_payment_created', 'payments', 'created_at, id'),
+    ('ix_payment_student_created', 'payments', 'student_id, created_at'),
+]
+
+# Indexes declared on existing tables after migration 1 (index=True columns get SQLAlchemy's ix_<table>_<column> names)
+FOLLOW_UP_INDEXES = [
+    ('ix_students_email', 'students', 'email'),
+    ('ix_whatsapp_sessions_last_activity', 'whatsapp_sessions', 'last_activity'),
+    ('ix_safety_incidents_reported_at', 'safety_incidents', 'reported_at'),
+    ('ix_safety_incident_instructor_reported', 'safety_incidents', 'instructor_id, reported_at'),
+]
+
+POSTGRES_QUERY_INDEXES = [
+    ('ix_system_config_key_pattern', 'system_config', 'key varchar_pattern_ops'),
+]
+
+
+def _drop_invalid_index(connection, name: str):
+    """Drop an index left invalid by an interrupted CREATE INDEX CONCURRENTLY so it is rebuilt"""
+    invalid = connection.execute(text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {'name': name}).first()
+    if invalid:
+        logger.warning(f"Rebuilding invalid index {name}")
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def create_indexes(connection, indexes):
+    """Create indexes that do not exist yet, without blocking writes on PostgreSQL"""
+    postgres = connection.dialect.name == 'postgresql'
+    for name, table, columns in indexes:
+        if postgres:
+            _drop_invalid_index(connection, name)
+        concurrently = 'CONCURRENTLY ' if postgres else ''
+        connection.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})"))
+        logger.info(f"Index {name} on {table} ({columns}) is in place")
+
+
+def add_query_indexes(connection):
+    create_indexes(connection, QUERY_INDEXES)
+    if connection.dialect.name == 'postgresql':
+        create_indexes(connection, POSTGRES_QUERY_INDEXES)
+    # Refresh planner statistics so the new indexes are costed straight away
+    connection.execute(text("ANALYZE"))
+
+
+def add_follow_up_indexes(connection):
+    create_indexes(connection, FOLLOW_UP_INDEXES)
+    connection.execute(text("ANALYZE"))
+
+
+def add_system_totals(connection):
+    from models import SystemTotal
+    from system_totals import fill_system_totals
+
+    SystemTotal.__table__.create(connection, checkfirst=True)
+    fill_system_totals(connection)
+
+
+def add_instructor_stats(connection):
+    from instructor_stats import fill_instructor_stats
+    from models import InstructorStats
+
+    InstructorStats.__table__.create(connection, checkfirst=True)
+    fill_instructor_stats(connection)
+
+
+def add_daily_rollups(connection):
+    from models import DailyInstructorRollup, DailyRevenueRollup
+    from rollups import fill_rollups
+
+    for model in (DailyRevenueRollup, DailyInstructorRollup):
+        model.__table__.create(connection, checkfirst=True)
+    # The source rows are streamed, which needs a transaction (a server-side cursor on PostgreSQL)
+    with connection.engine.begin() as source:
+        fill_rollups(source)
+
+
+def add_demand_buckets(connection):
+    from demand_signal import fill_demand_buckets
+    from models import DemandBucket
+
+    DemandBucket.__table__.create(connection, checkfirst=True)
+    with connection.engine.begin() as source:
+        fill_demand_buckets(source)
+
+
+def require_payment_created_at(connection):
+    """Date undated payments as the oldest one, so they stay last in the payments page, then forbid NULLs"""
+    from models import Payment
+
+    table = Payment.__table__
+    oldest = connection.execute(select(func.min(table.c.created_at))).scalar() or datetime.now()
+    result = connection.execute(table.update().where(table.c.created_at.is_(None)).values(created_at=oldest))
+    logger.info(f"Dated {result.rowcount} payments without created_at")
+    # SQLite cannot alter a column; the model's nullable=False covers new databases there
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("ALTER TABLE payments ALTER COLUMN created_at SET NOT NULL"))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'Composite indexes for hot query filters', add_query_indexes),
+    Migration(2, 'Indexes for student email, active WhatsApp session and safety report lookups',
+              add_follow_up_indexes),
+    Migration(3, 'Count existing users, students and lessons into system_totals', add_system_totals),
+    Migration(4, 'Date payments without created_at and make the column NOT NULL', require_payment_created_at),
+    Migration(5, 'Count existing student assignments and monthly commissions into instructor_stats',
+              add_instructor_stats),
+    Migration(6, 'Sum existing payments, lessons and commissions into the daily rollups', add_daily_rollups),
+    Migration(7, 'Count existing lessons and marketplace requests into demand_buckets', add_demand_buckets),
+]
+
+
+def current_version(connection) -> int:
+    from models import SystemConfig
+
+    table = SystemConfig.__table__
+    value = connection.execute(select(table.c.value).where(table.c.key == VERSION_KEY)).scalar()
+    try:
+        return int(value or 0)
+    except ValueError:
+        return 0
+
+
+def _record_version(connection, migration: Migration):
+    from models import SystemConfig
+
+    table = SystemConfig.__table__
+    now = datetime.now()
+    result = connection.execute(
+        table.update().where(table.c.key == VERSION_KEY).values(value=str(migration.version), updated_at=now)
+    )
+    if not result.rowcount:
+        connection.execute(table.insert().values(
+            key=VERSION_KEY, value=str(migration.version), description='Last applied schema migration',
+            created_at=now, updated_at=now
+        ))
+
+
+def pending_migrations(connection) -> List[Migration]:
+    version = current_version(connection)
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def migrate() -> int:
+    """Apply every pending migration in order; returns how many were applied"""
+    from app import db
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        pending = pending_migrations(connection)
+        for migration in pending:
+            logger.info(f"Applying migration {migration.version}: {migration.description}")
+            migration.apply(connection)
+            _record_version(connection, migration)
+    if not pending:
+        logger.info("Schema is up to date")
+    return len(pending)
+
+
+if __name__ == "__main__":
+    from app import app, db
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    with app.app_context():
+        if '--status' in sys.argv[1:]:
+            with db.engine.connect() as connection:
+                version = current_version(connection)
+            for migration in MIGRATIONS:
+                state = 'applied' if migration.version <= version else 'pending'
+                print(f"{migration.version:>4}  {state:<8} {migration.description}")
+        else:
+            migrate()
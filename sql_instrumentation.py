@@ -0,0 +1,223 @@
+"""
+SQL Instrumentation for DriveLink
+Counts the statements each Flask request and each WhatsApp message issues, with
+their total database time, and logs a warning when one statement shape repeats
+more than SQL_REPEAT_THRESHOLD times in a unit of work (the usual sign of an
+N+1 query). Totals per endpoint are kept per worker for the admin JSON view.
+
+Enabled with SQL_INSTRUMENTATION=1. When it is off no engine or request hooks
+are registered, and instrumented functions cost one flag check per call.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Repeats of one statement shape in a unit of work before it is reported
+DEFAULT_REPEAT_THRESHOLD = 10
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """A statement's shape: literals and IN lists of any length collapse to one placeholder"""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryStats:
+    """Statements issued by one unit of work (a request or a bot message)"""
+
+    __slots__ = ('name', 'statements', 'seconds', 'shapes')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+
+    def add(self, other: 'QueryStats'):
+        self.statements += other.statements
+        self.seconds += other.seconds
+        self.shapes.update(other.shapes)
+
+
+class EndpointTotals:
+    __slots__ = ('calls', 'statements', 'seconds', 'max_statements', 'repeat_warnings')
+
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.seconds = 0.0
+        self.max_statements = 0
+        self.repeat_warnings = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'statements': self.statements,
+            'db_ms': round(self.seconds * 1000, 2),
+            'avg_statements': round(self.statements / self.calls, 2) if self.calls else 0,
+            'avg_db_ms': round(self.seconds * 1000 / self.calls, 2) if self.calls else 0,
+            'max_statements': self.max_statements,
+            'repeat_warnings': self.repeat_warnings,
+        }
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar('sql_query_stats', default=None)
+
+
+class SqlInstrumentation:
+    """Per-worker switch and per-endpoint totals"""
+
+    enabled = False
+    repeat_threshold = DEFAULT_REPEAT_THRESHOLD
+
+    _totals: Dict[str, EndpointTotals] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def start(name: str):
+        """Begin counting statements for a unit of work; returns the token for finish()"""
+        return _current.set(QueryStats(name))
+
+    @staticmethod
+    def finish(token) -> Optional[QueryStats]:
+        """Stop counting, report repeated statements and fold the unit into its endpoint totals"""
+        stats = _current.get()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Finished in another context (e.g. after a streamed response); nothing is nested here
+            _current.set(None)
+        if stats is None:
+            return None
+
+        repeated = [(shape, count) for shape, count in stats.shapes.items()
+                    if count > SqlInstrumentation.repeat_threshold]
+        for shape, count in repeated:
+            logger.warning(f"{stats.name}: same statement issued {count} times (possible N+1): {shape[:300]}")
+
+        with SqlInstrumentation._lock:
+            totals = SqlInstrumentation._totals.get(stats.name)
+            if totals is None:
+                totals = SqlInstrumentation._totals[stats.name] = EndpointTotals()
+            totals.calls += 1
+            totals.statements += stats.statements
+            totals.seconds += stats.seconds
+            totals.max_statements = max(totals.max_statements, stats.statements)
+            totals.repeat_warnings += len(repeated)
+
+        # A bot message handled inside a request also counts towards that request
+        parent = _current.get()
+        if parent is not None:
+            parent.add(stats)
+        return stats
+
+    @staticmethod
+    @contextmanager
+    def track(name: str):
+        if not SqlInstrumentation.enabled:
+            yield None
+            return
+        token = SqlInstrumentation.start(name)
+        try:
+            yield _current.get()
+        finally:
+            SqlInstrumentation.finish(token)
+
+    @staticmethod
+    def snapshot() -> Dict:
+        """Endpoint totals, most database time first"""
+        with SqlInstrumentation._lock:
+            endpoints = sorted(SqlInstrumentation._totals.items(), key=lambda item: item[1].seconds, reverse=True)
+            return {
+                'enabled': SqlInstrumentation.enabled,
+                'repeat_threshold': SqlInstrumentation.repeat_threshold,
+                'endpoints': {name: totals.to_dict() for name, totals in endpoints},
+            }
+
+    @staticmethod
+    def reset():
+        with SqlInstrumentation._lock:
+            SqlInstrumentation._totals = {}
+
+
+def instrumented(name: str):
+    """Count the statements of each call of the decorated function as one unit of work"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not SqlInstrumentation.enabled:
+                return f(*args, **kwargs)
+            with SqlInstrumentation.track(name):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('sql_instrumentation_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get('sql_instrumentation_started')
+    if not started:
+        return
+    stats.statements += 1
+    stats.seconds += time.perf_counter() - started.pop()
+    stats.shapes[fingerprint(statement)] += 1
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('sql_instrumentation_started'):
+        conn.info['sql_instrumentation_started'].pop()
+
+
+def _request_started():
+    g.sql_instrumentation_token = SqlInstrumentation.start(request.endpoint or request.path)
+
+
+def _request_finished(exc=None):
+    token = g.pop('sql_instrumentation_token', None)
+    if token is not None:
+        SqlInstrumentation.finish(token)
+
+
+def init_sql_instrumentation(app):
+    """Register the engine and request hooks when SQL_INSTRUMENTATION is on"""
+    SqlInstrumentation.enabled = bool(app.config.get('SQL_INSTRUMENTATION'))
+    SqlInstrumentation.repeat_threshold = app.config.get('SQL_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+    if not SqlInstrumentation.enabled:
+        return
+
+    for event_name, listener in (('before_cursor_execute', _before_cursor_execute),
+                                 ('after_cursor_execute', _after_cursor_execute),
+                                 ('handle_error', _handle_error)):
+        if not event.contains(Engine, event_name, listener):
+            event.listen(Engine, event_name, listener)
+    app.before_request(_request_started)
+    app.teardown_request(_request_finished)
+    logger.info(f"SQL instrumentation enabled (repeat threshold {SqlInstrumentation.repeat_threshold})")
@@ -0,0 +1,160 @@
+"""
+Structured Logging for DriveLink
+The calling thread only puts log records on an in-memory queue; a background
+listener thread formats and writes them, so requests and webhooks never wait on
+log I/O. Records are written to stderr as one JSON object per line, with any
+extra= fields as keys (LOG_FORMAT=text for readable development output).
+
+Configured from the app config:
+- LOG_LEVEL: the root level (default INFO)
+- LOG_LEVELS: per-logger levels, e.g. "enhanced_whatsapp_bot=DEBUG,sqlalchemy.pool=DEBUG"
+- LOG_DEBUG_SAMPLE_EVERY: keep the first and then one in this many DEBUG records
+  from each call site (default 100; 1 keeps them all)
+
+Hot paths log with %-style arguments, which are only formatted on the listener
+thread and only for records that pass the level check and sampling; pass values
+that will not change after the call. Scripts that configure logging before
+importing the app keep their own configuration.
+"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# Libraries that are noisy below these levels
+DEFAULT_LEVELS = {
+    'sqlalchemy': 'WARNING',
+    'urllib3': 'WARNING',
+    'twilio.http_client': 'WARNING',
+}
+
+DEFAULT_DEBUG_SAMPLE_EVERY = 100
+
+# Attributes every LogRecord has; any other attribute came from extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, extra fields and any traceback"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """Passes the first and then every Nth DEBUG record of each call site, and every other record"""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._counters: Dict[tuple, itertools.count] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every <= 1:
+            return True
+        site = (record.pathname, record.lineno)
+        counter = self._counters.get(site) or self._counters.setdefault(site, itertools.count())
+        if next(counter) % self.every:
+            return False
+        record.sampled_one_in = self.every
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Queues records unformatted; QueueHandler would format them on the calling thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_lock = threading.Lock()
+_handler: Optional[_DeferredQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def parse_levels(levels: str) -> Dict[str, str]:
+    """{'logger': 'LEVEL'} from "logger=LEVEL,other.logger=LEVEL" """
+    parsed = {}
+    for entry in filter(None, (part.strip() for part in levels.split(','))):
+        name, separator, level = entry.partition('=')
+        if not separator or not name.strip() or not level.strip():
+            raise ValueError(f"Invalid LOG_LEVELS entry {entry!r}; expected logger=LEVEL")
+        parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def _output(log_format: str) -> logging.Handler:
+    output = logging.StreamHandler(sys.stderr)
+    if log_format == 'text':
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    else:
+        output.setFormatter(JsonFormatter())
+    return output
+
+
+def configure_logging(config):
+    """Send all logging through the queue to the background writer, with levels from config"""
+    global _handler, _listener
+
+    levels = {**DEFAULT_LEVELS, **parse_levels(config.get('LOG_LEVELS', ''))}
+    root = logging.getLogger()
+    with _lock:
+        if _handler is None and root.handlers:
+            # Configured by the script that imported the app
+            return
+        if _listener is not None:
+            _listener.stop()
+            root.removeHandler(_handler)
+
+        log_queue = queue.SimpleQueue()
+        _listener = QueueListener(log_queue, _output(config.get('LOG_FORMAT', 'json')))
+        _listener.start()
+
+        _handler = _DeferredQueueHandler(log_queue)
+        _handler.addFilter(DebugSampler(int(config.get('LOG_DEBUG_SAMPLE_EVERY', DEFAULT_DEBUG_SAMPLE_EVERY))))
+        root.addHandler(_handler)
+        root.setLevel(config.get('LOG_LEVEL', 'INFO').upper())
+        for name, level in levels.items():
+            logging.getLogger(name).setLevel(level)
+
+
+def _restart_in_child():
+    # The listener thread does not survive a fork (gunicorn --preload), and the
+    # queue may have been locked by it; give the child its own of both
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    _handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_listener.handlers)
+    _listener.start()
+
+
+def _stop():
+    # Writes out the records still queued
+    if _listener is not None:
+        _listener.stop()
+
+
+os.register_at_fork(after_in_child=_restart_in_child)
+atexit.register(_stop)
@@ -0,0 +1,257 @@
+"""
+Student Dashboard Read Model for DriveLink
+Loads a student's profile, instructor, upcoming lessons and recent lessons with
+one projected query, and caches the result per student until a lesson or the
+student row changes. A committed change bumps the version stamp of the
+student's bucket (one of STAMP_BUCKETS), so every worker drops its copy of that
+bucket's dashboards. Serves /student and the PIN portal pages.
+"""
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from flask import current_app
+from sqlalchemy import event, literal, select, true, union_all
+from sqlalchemy.orm import Session, aliased, object_session
+
+from app import db
+from cache_versions import VersionStamp
+from dashboard_stats import TTLCache
+from models import Lesson, Student, User, LESSON_SCHEDULED, LESSON_COMPLETED
+from rollups import previous_value, track_previous
+
+UPCOMING_LIMIT = 10
+RECENT_LIMIT = 5
+
+# system_config key prefix of the bucket version stamps (kept off the config page)
+VERSION_KEY_PREFIX = 'student_dashboard_version_'
+# Students share a version stamp with the others of their bucket (student id modulo this)
+STAMP_BUCKETS = 64
+# Dashboards each worker keeps, least recently used dropped first
+CACHE_SIZE = 5000
+
+
+def _full_name(first_name, last_name, username=None) -> Optional[str]:
+    """Same rule as User.get_full_name, for projected columns"""
+    if first_name and last_name:
+        return f"{first_name} {last_name}"
+    return username
+
+
+class StudentProfile(NamedTuple):
+    id: int
+    name: str
+    phone: str
+    email: Optional[str]
+    current_location: Optional[str]
+    license_type: Optional[str]
+    registration_date: Optional[datetime]
+    is_active: bool
+    lessons_completed: int
+    total_lessons_required: int
+    account_balance: float
+    instructor_id: Optional[int]
+    instructor_name: Optional[str]
+
+    def get_progress_percentage(self):
+        if self.total_lessons_required == 0:
+            return 0
+        return min(100, (self.lessons_completed / self.total_lessons_required) * 100)
+
+
+class LessonSummary(NamedTuple):
+    id: int
+    scheduled_date: datetime
+    completed_date: Optional[datetime]
+    duration_minutes: int
+    location: Optional[str]
+    cost: float
+    status: str
+    rating: Optional[int]
+    notes: Optional[str]
+    instructor_name: Optional[str]
+
+
+class StudentDashboardView(NamedTuple):
+    student: StudentProfile
+    upcoming_lessons: List[LessonSummary]
+    recent_lessons: List[LessonSummary]
+
+
+_LESSON_COLUMNS = (Lesson.id, Lesson.lesson_date, Lesson.completed_date, Lesson.duration_minutes,
+                   Lesson.location, Lesson.cost, Lesson.status, Lesson.rating, Lesson.notes,
+                   Lesson.instructor_id)
+
+_PROFILE_COLUMNS = (Student.id, Student.name, Student.phone, Student.email, Student.current_location,
+                    Student.license_type, Student.registration_date, Student.is_active,
+                    Student.lessons_completed, Student.total_lessons_required, Student.account_balance,
+                    Student.instructor_id)
+
+
+class StudentDashboard:
+    """Per-student dashboard data, cached for STUDENT_DASHBOARD_TTL seconds or until it changes"""
+
+    _cache = TTLCache(max_entries=CACHE_SIZE)
+    _stamps = [VersionStamp(f'{VERSION_KEY_PREFIX}{bucket}') for bucket in range(STAMP_BUCKETS)]
+
+    @staticmethod
+    def ttl() -> float:
+        return current_app.config.get('STUDENT_DASHBOARD_TTL', 60)
+
+    @staticmethod
+    def version_stamp(student_id: int) -> VersionStamp:
+        return StudentDashboard._stamps[student_id % STAMP_BUCKETS]
+
+    @staticmethod
+    def find_student_id(phone: Optional[str] = None, email: Optional[str] = None) -> Optional[int]:
+        """Resolve a student by phone, then by email, each with its own index lookup"""
+        for column, value in ((Student.phone, phone), (Student.email, email)):
+            if value:
+                student_id = db.session.query(Student.id).filter(column == value).limit(1).scalar()
+                if student_id is not None:
+                    return student_id
+        return None
+
+    @staticmethod
+    def load(student_id: int) -> Optional[StudentDashboardView]:
+        """Fetch the profile and both lesson lists in one round trip"""
+        now = datetime.now()
+        upcoming = select(literal('upcoming').label('kind'), *_LESSON_COLUMNS).where(
+            Lesson.student_id == student_id,
+            Lesson.status == LESSON_SCHEDULED,
+            Lesson.lesson_date >= now
+        ).order_by(Lesson.lesson_date).limit(UPCOMING_LIMIT).subquery()
+        recent = select(literal('recent').label('kind'), *_LESSON_COLUMNS).where(
+            Lesson.student_id == student_id,
+            Lesson.status == LESSON_COMPLETED
+        ).order_by(Lesson.completed_date.desc()).limit(RECENT_LIMIT).subquery()
+        lessons = union_all(select(upcoming), select(recent)).subquery()
+
+        student_instructor = aliased(User)
+        lesson_instructor = aliased(User)
+        rows = db.session.execute(
+            select(
+                *_PROFILE_COLUMNS,
+                student_instructor.first_name, student_instructor.last_name, student_instructor.username,
+                lessons,
+                lesson_instructor.first_name, lesson_instructor.last_name, lesson_instructor.username
+            ).select_from(Student).outerjoin(
+                student_instructor, student_instructor.id == Student.instructor_id
+            ).outerjoin(
+                lessons, true()
+            ).outerjoin(
+                lesson_instructor, lesson_instructor.id == lessons.c.instructor_id
+            ).where(Student.id == student_id)
+        ).all()
+        if not rows:
+            return None
+
+        first = rows[0]
+        profile_values = list(first[:len(_PROFILE_COLUMNS)])
+        profile_values[10] = float(profile_values[10] or 0)
+        instructor_name = _full_name(*first[len(_PROFILE_COLUMNS):len(_PROFILE_COLUMNS) + 3])
+        profile = StudentProfile(*profile_values, instructor_name)
+
+        upcoming_lessons, recent_lessons = [], []
+        offset = len(_PROFILE_COLUMNS) + 3
+        for row in rows:
+            kind, lesson_id, lesson_date, completed_date, duration, location, cost, status, rating, notes, _ = \
+                row[offset:offset + 11]
+            if kind is None:
+                continue
+            lesson = LessonSummary(lesson_id, lesson_date, completed_date, duration, location, float(cost or 0),
+                                   status, rating, notes, _full_name(*row[offset + 11:offset + 14]))
+            (upcoming_lessons if kind == 'upcoming' else recent_lessons).append(lesson)
+
+        upcoming_lessons.sort(key=lambda lesson: lesson.scheduled_date)
+        recent_lessons.sort(key=lambda lesson: lesson.completed_date or datetime.min, reverse=True)
+        return StudentDashboardView(profile, upcoming_lessons, recent_lessons)
+
+    @staticmethod
+    def get(student_id: int) -> Optional[StudentDashboardView]:
+        """Get the cached view, loading it when missing, older than the TTL or of an old version"""
+        key = str(student_id)
+        # Read before loading, so a change committed during the load is not cached as current
+        version = StudentDashboard.version_stamp(student_id).current()
+        cached = StudentDashboard._cache.get(key, StudentDashboard.ttl())
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        view = StudentDashboard.load(student_id)
+        if view is None:
+            return None
+        StudentDashboard._cache.set(key, (version, view))
+        return view
+
+    @staticmethod
+    def lessons(student_id: int, status: Optional[str] = None) -> List[LessonSummary]:
+        """All of a student's lessons (optionally one status) with instructor names, newest first"""
+        query = db.session.query(*_LESSON_COLUMNS[:-1], User.first_name, User.last_name, User.username).outerjoin(
+            User, User.id == Lesson.instructor_id
+        ).filter(Lesson.student_id == student_id)
+        if status:
+            query = query.filter(Lesson.status == status)
+        if status == LESSON_COMPLETED:
+            query = query.order_by(Lesson.completed_date.desc(), Lesson.id.desc())
+        else:
+            query = query.order_by(Lesson.lesson_date.desc(), Lesson.id.desc())
+
+        return [
+            LessonSummary(lesson_id, lesson_date, completed_date, duration, location, float(cost or 0),
+                          lesson_status, rating, notes, _full_name(first_name, last_name, username))
+            for lesson_id, lesson_date, completed_date, duration, location, cost, lesson_status, rating, notes,
+                first_name, last_name, username in query
+        ]
+
+    @staticmethod
+    def invalidate(student_id: Optional[int] = None):
+        StudentDashboard._cache.clear(str(student_id) if student_id is not None else None)
+
+
+def _record(target, student_id):
+    session = object_session(target)
+    if session is not None and student_id is not None:
+        session.info.setdefault('student_dashboard_changes', set()).add(student_id)
+
+
+def _lesson_changed(mapper, connection, target):
+    _record(target, target.student_id)
+    # A lesson moved to another student changes both dashboards
+    _record(target, previous_value(target, 'student_id'))
+
+
+def _student_changed(mapper, connection, target):
+    _record(target, target.id)
+
+
+def _session_committed(session):
+    student_ids = session.info.pop('student_dashboard_changes', ())
+    if not student_ids:
+        return
+    VersionStamp.bump_all({StudentDashboard.version_stamp(student_id) for student_id in student_ids})
+    for student_id in student_ids:
+        StudentDashboard.invalidate(student_id)
+
+
+def _session_rolled_back(session):
+    session.info.pop('student_dashboard_changes', None)
+
+
+def register_student_dashboard_listeners():
+    """Drop a student's cached dashboard in every worker once a change to it is committed"""
+    # A reassigned lesson also drops the old student's dashboard
+    track_previous(Lesson.student_id)
+
+    listeners = [
+        (Lesson, 'after_insert', _lesson_changed),
+        (Lesson, 'after_update', _lesson_changed),
+        (Lesson, 'after_delete', _lesson_changed),
+        (Student, 'after_update', _student_changed),
+        (Student, 'after_delete', _student_changed),
+        (Session, 'after_commit', _session_committed),
+        (Session, 'after_rollback', _session_rolled_back),
+    ]
+    for target, event_name, listener in listeners:
+        if not event.contains(target, event_name, listener):
+            event.listen(target, event_name, listener)
+
+
+register_student_dashboard_listeners()
@@ -3,10 +3,8 @@ Subscription Management Service for DriveLink
 Handles instructor subscriptions, payments, and commission tracking
 """
 import os
-import stripe
 from datetime import datetime, timedelta
 from decimal import Decimal
-from sqlalchemy import func
 from app import db
 from models import (
     User, InstructorSubscription, CommissionRecord, SubscriptionPlan, 
@@ -14,8 +12,13 @@ from models import (
     PAYMENT_COMPLETED, PAYMENT_FAILED, SUBSCRIPTION_CANCELLED
 )
 
-# Configure Stripe
-stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+
+def _stripe():
+    """The Stripe SDK, configured; imported on first use as it is slower to import than the whole app"""
+    import stripe
+    stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+    return stripe
+
 
 class SubscriptionManager:
     """Service for managing instructor subscriptions"""
@@ -82,6 +85,7 @@ class SubscriptionManager:
     @staticmethod
     def create_stripe_customer(user):
         """Create a Stripe customer for the instructor"""
+        stripe = _stripe()
         try:
             customer = stripe.Customer.create(
                 email=user.email,
@@ -234,31 +238,20 @@ class SubscriptionManager:
     @staticmethod
     def get_instructor_analytics(instructor_id):
         """Get analytics for an instructor"""
-        instructor = User.query.get(instructor_id)
+        # Primary-key lookups: the instructor is usually the logged-in user already
+        instructor = db.session.get(User, instructor_id)
         if not instructor:
             return None
         
-        # Calculate monthly earnings
-        current_month = datetime.now().replace(day=1)
-        monthly_commissions = db.session.query(func.sum(CommissionRecord.instructor_earning)).filter(
-            CommissionRecord.instructor_id == instructor_id,
-            CommissionRecord.created_at >= current_month
-        ).scalar() or 0
-        
-        # Student count
-        student_count = len(instructor.instructor_students)
-        
-        # Monthly lessons
-        monthly_lessons = db.session.query(func.count(CommissionRecord.id)).filter(
-            CommissionRecord.instructor_id == instructor_id,
-            CommissionRecord.created_at >= current_month
-        ).scalar() or 0
+        # Monthly earnings, lessons and student count from the maintained counters
+        from instructor_stats import InstructorStatsService
+        counters = InstructorStatsService.get(instructor_id)
         
         return {
-            'monthly_earnings': float(monthly_commissions),
+            'monthly_earnings': counters.monthly_earnings,
             'total_earnings': float(instructor.total_earnings),
-            'student_count': student_count,
-            'monthly_lessons': monthly_lessons,
+            'student_count': counters.student_count,
+            'monthly_lessons': counters.monthly_lessons,
             'average_rating': instructor.average_rating,
             'total_lessons': instructor.total_lessons_taught
         }
@@ -276,13 +269,11 @@ class MarketplaceManager:
             User.subscription_status == SUBSCRIPTION_ACTIVE
         ).all()
         
-        # Filter by availability and subscription limits
-        available_instructors = []
-        for instructor in instructors:
-            if instructor.can_take_students():
-                available_instructors.append(instructor)
+        # Filter by subscription limits (student counts from one instructor_stats read)
+        from capacity_service import InstructorCapacity
+        capacity = InstructorCapacity.get_capacity(instructors)
         
-        return available_instructors
+        return [instructor for instructor in instructors if capacity[instructor.id].has_room]
     
     @staticmethod
     def create_marketplace_booking(student, booking_data):
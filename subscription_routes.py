@@ -2,17 +2,24 @@
 Subscription Routes for DriveLink
 Handles subscription management, billing, and marketplace features
 """
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
+from flask import Blueprint, current_app, render_template, request, jsonify, redirect, url_for, flash
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 import json
+from sqlalchemy import func
 from app import db
 from models import (
     User, Student, InstructorSubscription, SubscriptionPlan, CommissionRecord,
     MarketplaceBooking, InstructorReview, SUBSCRIPTION_ACTIVE
 )
 from subscription_manager import SubscriptionManager, MarketplaceManager
+from capacity_service import InstructorCapacity
 from auth import require_role
+from rollups import RollupReports
+from csv_export import csv_response
+from exports import commissions_export
+from listings import parse_date
+from replica_routing import replica_reads
 
 # Create blueprint for subscription routes
 subscription_bp = Blueprint('subscription', __name__, url_prefix='/subscription')
@@ -87,11 +94,19 @@ def marketplace():
         User.subscription_status == SUBSCRIPTION_ACTIVE
     ).all()
     
-    # Add additional info to each instructor
+    # Add additional info to each instructor (grouped queries, not one per instructor)
+    capacity = InstructorCapacity.get_capacity(instructors)
+    review_counts = dict(db.session.query(
+        InstructorReview.instructor_id,
+        func.count(InstructorReview.id)
+    ).filter(
+        InstructorReview.instructor_id.in_([i.id for i in instructors])
+    ).group_by(InstructorReview.instructor_id).all()) if instructors else {}
+    
     for instructor in instructors:
-        instructor.student_count = len(instructor.instructor_students)
-        instructor.reviews_count = len(instructor.reviews)
-        instructor.can_accept_students = instructor.can_take_students()
+        instructor.student_count = capacity[instructor.id].current_students
+        instructor.reviews_count = review_counts.get(instructor.id, 0)
+        instructor.can_accept_students = capacity[instructor.id].has_room
     
     return render_template('marketplace.html', instructors=instructors)
 
@@ -170,46 +185,43 @@ def admin_subscriptions():
                          total_revenue=total_revenue,
                          active_subscriptions=active_subscriptions)
 
+def _report_range(args):
+    """Parse the date_from/date_to (inclusive, YYYY-MM-DD) arguments of a report request"""
+    date_from = parse_date(args.get('date_from'))
+    date_to = parse_date(args.get('date_to'))
+    if date_from and date_to and date_from > date_to:
+        date_from, date_to = date_to, date_from
+    return date_from, date_to
+
 @subscription_bp.route('/admin/commission-reports')
 @login_required
 @require_role('admin')
+@replica_reads()
 def commission_reports():
     """Admin commission reports and analytics"""
-    from sqlalchemy import func
-    
-    # Get commission summary
-    commission_data = db.session.query(
-        func.sum(CommissionRecord.commission_amount).label('total_commission'),
-        func.sum(CommissionRecord.instructor_earning).label('total_instructor_earnings'),
-        func.count(CommissionRecord.id).label('total_lessons')
-    ).first()
+    date_from, date_to = _report_range(request.args)
+    # Rollup ranges exclude their end, so stop the day after the last one shown
+    end = date_to + timedelta(days=1) if date_to else None
     
-    # Monthly breakdown
-    monthly_commissions = db.session.query(
-        func.extract('month', CommissionRecord.created_at).label('month'),
-        func.extract('year', CommissionRecord.created_at).label('year'),
-        func.sum(CommissionRecord.commission_amount).label('commission'),
-        func.count(CommissionRecord.id).label('lessons')
-    ).group_by(
-        func.extract('month', CommissionRecord.created_at),
-        func.extract('year', CommissionRecord.created_at)
-    ).order_by('year', 'month').all()
-    
-    # Top earning instructors
-    top_instructors = db.session.query(
-        User.id,
-        User.first_name,
-        User.last_name,
-        func.sum(CommissionRecord.instructor_earning).label('total_earnings'),
-        func.count(CommissionRecord.id).label('total_lessons')
-    ).join(CommissionRecord).group_by(
-        User.id, User.first_name, User.last_name
-    ).order_by('total_earnings desc').limit(10).all()
+    # All three figures are summed from the daily instructor rollups
+    commission_data = RollupReports.commission_totals(date_from, end)
+    monthly_commissions = RollupReports.monthly_commissions(date_from, end)
+    top_instructors = RollupReports.top_instructors(10, date_from, end)
     
     return render_template('commission_reports.html',
                          commission_data=commission_data,
                          monthly_commissions=monthly_commissions,
-                         top_instructors=top_instructors)
+                         top_instructors=top_instructors,
+                         date_from=date_from,
+                         date_to=date_to)
+
+@subscription_bp.route('/admin/commission-reports/export.csv')
+@login_required
+@require_role('admin')
+def export_commission_records():
+    """Stream the commission records in the report's date range as CSV"""
+    export = commissions_export(current_user, request.args)
+    return csv_response(export.filename, export.header, export.rows)
 
 @subscription_bp.route('/api/instructor-stats/<int:instructor_id>')
 @login_required
@@ -219,4 +231,12 @@ def instructor_stats_api(instructor_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     analytics = SubscriptionManager.get_instructor_analytics(instructor_id)
-    return jsonify(analytics)
\ No newline at end of file
+    if analytics is None:
+        return jsonify({'error': 'Instructor not found'}), 404
+    
+    # Clients poll this; let them reuse it briefly and then revalidate with If-None-Match
+    response = jsonify(analytics)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['INSTRUCTOR_STATS_MAX_AGE']
+    response.add_etag()
+    return response.make_conditional(request)
\ No newline at end of file
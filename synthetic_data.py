@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data for DriveLink
+Seeded, deterministic generator of realistic data volumes for performance
+testing: instructors, students, lessons, payments, commission records, reviews,
+student progress, WhatsApp sessions and lesson location points, spread over
+Harare suburbs with weekday and time-of-day booking patterns.
+
+Rows are written with COPY on PostgreSQL (psycopg2) and Core executemany
+inserts elsewhere, in batches of whole students, so memory stays flat. Ids are
+assigned here after the current maximum, so a database can be extended. The
+derived tables (rollups, instructor stats, demand buckets, system totals) are
+rebuilt at the end, because bulk inserts bypass the mapper listeners that
+maintain them.
+
+Volumes grow linearly with --scale:
+
+    scale   instructors   students   lessons (approx.)
+    1       50            2,000      50,000
+    10      500           20,000     500,000
+    100     5,000         200,000    5,000,000
+
+The same --seed, --scale and --anchor date always produce the same rows (apart
+from bookkeeping columns left to their model defaults, such as updated_at).
+
+    python synthetic_data.py --scale 10 --seed 42
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import math
+import random
+import sys
+import time
+from bisect import bisect
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from typing import Dict, Iterable, List, Sequence
+
+from sqlalchemy import func, select, text
+
+logger = logging.getLogger(__name__)
+
+# Volumes at --scale 1
+BASE_INSTRUCTORS = 50
+BASE_STUDENTS = 2000
+# Planned course length; recent sign-ups are cut off at the booking horizon
+MEAN_LESSONS_PER_STUDENT = 32
+MAX_LESSONS_PER_STUDENT = 80
+
+# Students generated (with all their rows) per insert batch
+STUDENT_BATCH = 1000
+
+# Registrations go back this far; bookings run this far past the anchor date
+HISTORY_DAYS = 730
+BOOKING_HORIZON_DAYS = 30
+
+# Share of completed lessons with a review, and with recorded location points
+REVIEW_SHARE = 0.3
+TRACKED_SHARE = 0.02
+POINTS_PER_TRACKED_LESSON = 10
+
+# (suburb, latitude, longitude, weight) - weights follow population, so the
+# high-density suburbs send the most students
+HARARE_SUBURBS = [
+    ('CBD', -17.8292, 31.0522, 6),
+    ('Avondale', -17.8005, 31.0371, 4),
+    ('Belvedere', -17.8333, 31.0167, 3),
+    ('Borrowdale', -17.7566, 31.0933, 3),
+    ('Budiriro', -17.8928, 30.9306, 8),
+    ('Chitungwiza', -18.0127, 31.0756, 12),
+    ('Eastlea', -17.8244, 31.0733, 3),
+    ('Glen View', -17.9000, 30.9667, 8),
+    ('Greendale', -17.8167, 31.1167, 3),
+    ('Hatfield', -17.8833, 31.0833, 3),
+    ('Highfield', -17.8833, 30.9983, 8),
+    ('Kuwadzana', -17.8289, 30.9156, 7),
+    ('Marlborough', -17.7500, 30.9833, 3),
+    ('Mbare', -17.8561, 31.0369, 7),
+    ('Mount Pleasant', -17.7731, 31.0500, 3),
+    ('Msasa', -17.8333, 31.1167, 2),
+    ('Warren Park', -17.8375, 30.9858, 6),
+    ('Waterfalls', -17.8931, 31.0353, 5),
+]
+_SUBURB_WEIGHTS = list(accumulate(suburb[3] for suburb in HARARE_SUBURBS))
+
+# Booking patterns: Saturdays are busiest, Sundays quiet; early morning and after work peak
+WEEKDAY_WEIGHTS = [1.0, 0.9, 0.9, 1.0, 1.1, 1.6, 0.3]
+HOURS = [6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18]
+_HOUR_WEIGHTS = list(accumulate([3, 9, 10, 7, 6, 6, 5, 5, 6, 8, 10, 9, 4]))
+
+FIRST_NAMES = ['Tendai', 'Tatenda', 'Rutendo', 'Farai', 'Chipo', 'Tafadzwa', 'Nyasha', 'Kudzai', 'Blessing',
+               'Tinashe', 'Rumbidzai', 'Takudzwa', 'Simbarashe', 'Ruvimbo', 'Tapiwa', 'Vimbai', 'Munashe',
+               'Panashe', 'Anesu', 'Fadzai', 'Tariro', 'Kudakwashe', 'Chiedza', 'Tonderai']
+LAST_NAMES = ['Moyo', 'Ncube', 'Sibanda', 'Dube', 'Mpofu', 'Ndlovu', 'Chikore', 'Mutasa', 'Mapfumo', 'Chiwenga',
+              'Mhlanga', 'Zhou', 'Gumbo', 'Marufu', 'Nyathi', 'Mushonga', 'Chikomba', 'Makoni', 'Banda', 'Phiri']
+
+# (plan, commission rate, share of instructors), rates as in SubscriptionManager
+PLANS = [('basic', 0.15, 0.6), ('premium', 0.12, 0.3), ('pro', 0.08, 0.1)]
+
+PAYMENT_METHODS = [('cash', 'cash', 35), ('online', 'ecocash', 40), ('online', 'onemoney', 10),
+                   ('online', 'visa', 10), ('online', 'mastercard', 5)]
+_PAYMENT_WEIGHTS = list(accumulate(method[2] for method in PAYMENT_METHODS))
+
+RATING_WEIGHTS = list(accumulate([2, 3, 10, 35, 50]))
+REVIEW_TEXTS = [None, None, 'Very patient instructor.', 'Helped me with parallel parking.',
+                'Always on time.', 'Explains the road rules clearly.', 'Lesson was rushed.',
+                'Great with nervous learners.']
+
+
+def _weighted(rng: random.Random, cumulative: Sequence[float]) -> int:
+    """Index drawn with the weights whose running totals are given"""
+    return bisect(cumulative, rng.random() * cumulative[-1])
+
+
+def _near(rng: random.Random, latitude: float, longitude: float, km: float):
+    """A point within about km kilometres of the given one"""
+    return (round(latitude + rng.uniform(-km, km) / 111.0, 6),
+            round(longitude + rng.uniform(-km, km) / 106.0, 6))
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+class TableWriter:
+    """Buffers rows for one table and writes them in bulk, filling in column defaults"""
+
+    def __init__(self, connection, table, columns: Sequence[str]):
+        self.connection = connection
+        self.table = table
+        self.count = 0
+        self.rows: List[tuple] = []
+
+        # Columns the generator leaves out get their model defaults, as an ORM insert would
+        defaults = {}
+        for column in table.columns:
+            if column.name in columns or column.default is None:
+                continue
+            if column.default.is_scalar:
+                defaults[column.name] = column.default.arg
+            elif column.default.is_callable:
+                defaults[column.name] = column.default.arg(None)
+        self.columns = list(columns) + list(defaults)
+        self.default_values = tuple(defaults.values())
+
+    def add(self, *values):
+        self.rows.append(values + self.default_values)
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.connection.dialect.name == 'postgresql' and self.connection.dialect.driver == 'psycopg2':
+            self._copy()
+        else:
+            self.connection.execute(self.table.insert(), [dict(zip(self.columns, row)) for row in self.rows])
+        self.count += len(self.rows)
+        self.rows = []
+
+    def _copy(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in self.rows:
+            writer.writerow(['\\N' if value is None else value for value in row])
+        buffer.seek(0)
+        cursor = self.connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {self.table.name} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+
+class SyntheticDataGenerator:
+    """Generates one dataset; run() writes it through the given engine"""
+
+    def __init__(self, engine, scale: int = 1, seed: int = 42, anchor: date = None):
+        self.engine = engine
+        self.scale = scale
+        self.seed = seed
+        self.anchor = datetime.combine(anchor or date.today(), datetime.min.time())
+        self.rng = random.Random(seed)
+        self.password_hash = None
+        self.next_ids: Dict[str, int] = {}
+        self.instructors: List[tuple] = []  # (id, suburb index, rate 30, rate 60, commission rate)
+        self.instructors_by_suburb: Dict[int, List[int]] = {}
+        self.admin_id = None
+
+    def _ids(self, connection, table, count: int) -> range:
+        """Reserve count ids after the table's current maximum"""
+        if table.name not in self.next_ids:
+            self.next_ids[table.name] = (connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+        start = self.next_ids[table.name]
+        self.next_ids[table.name] += count
+        return range(start, start + count)
+
+    def _name(self) -> str:
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    def _lesson_time(self, day: datetime) -> datetime:
+        """Move day forward onto a likely weekday, at a likely hour"""
+        rng = self.rng
+        peak = max(WEEKDAY_WEIGHTS)
+        while rng.random() * peak > WEEKDAY_WEIGHTS[day.weekday()]:
+            day += timedelta(days=1)
+        return day.replace(hour=HOURS[_weighted(rng, _HOUR_WEIGHTS)], minute=rng.choice((0, 0, 30)),
+                           second=0, microsecond=0)
+
+    def run(self, rebuild: bool = True) -> Dict[str, int]:
+        """Insert the whole dataset; returns the rows written per table"""
+        from werkzeug.security import generate_password_hash
+
+        # One hash for every synthetic account keeps generation fast (password: "password")
+        self.password_hash = generate_password_hash('password')
+        started = time.monotonic()
+        counts: Dict[str, int] = {}
+
+        with self.engine.begin() as connection:
+            counts.update(self._users(connection))
+
+        students = BASE_STUDENTS * self.scale
+        for offset in range(0, students, STUDENT_BATCH):
+            with self.engine.begin() as connection:
+                batch = self._student_batch(connection, min(STUDENT_BATCH, students - offset))
+            for name, count in batch.items():
+                counts[name] = counts.get(name, 0) + count
+            logger.info(f"{min(offset + STUDENT_BATCH, students)}/{students} students, "
+                        f"{counts.get('lessons', 0)} lessons ({time.monotonic() - started:.0f}s)")
+
+        with self.engine.begin() as connection:
+            self._instructor_totals(connection)
+            self._finish(connection)
+
+        if rebuild:
+            self._rebuild_derived()
+        logger.info(f"Generated {sum(counts.values())} rows in {time.monotonic() - started:.0f}s: {counts}")
+        return counts
+
+    def _users(self, connection) -> Dict[str, int]:
+        """Instructors (with subscription plans and base suburbs) and a processing admin"""
+        from models import User, WhatsAppSession, ROLE_ADMIN, ROLE_INSTRUCTOR
+
+        rng = self.rng
+        users = TableWriter(connection, User.__table__, [
+            'id', 'username', 'email', 'password_hash', 'first_name', 'last_name', 'phone', 'role', 'active',
+            'is_verified', 'base_location', 'service_areas', 'latitude', 'longitude', 'hourly_rate_30min',
+            'hourly_rate_60min', 'experience_years', 'subscription_plan', 'subscription_status',
+            'license_class', 'kyc_status', 'city', 'created_at'
+        ])
+        sessions = TableWriter(connection, WhatsAppSession.__table__, [
+            'id', 'user_id', 'phone_number', 'user_type', 'session_id', 'session_data', 'last_activity',
+            'is_active', 'created_at'
+        ])
+
+        count = BASE_INSTRUCTORS * self.scale
+        user_ids = self._ids(connection, User.__table__, count + 1)
+        self.admin_id = user_ids[0]
+        users.add(self.admin_id, f'synth_admin_{self.admin_id}', f'synth_admin_{self.admin_id}@example.com',
+                  self.password_hash, 'Synthetic', 'Admin', f'+26371{self.admin_id:07d}', ROLE_ADMIN, True, True,
+                  'CBD', None, None, None, None, None, None, None, None, None, 'approved', 'Harare',
+                  self.anchor - timedelta(days=HISTORY_DAYS))
+
+        session_ids = self._ids(connection, WhatsAppSession.__table__, count)
+        plan_weights = list(accumulate(plan[2] for plan in PLANS))
+        for user_id, session_id in zip(user_ids[1:], session_ids):
+            suburb = _weighted(rng, _SUBURB_WEIGHTS)
+            name, latitude, longitude, _ = HARARE_SUBURBS[suburb]
+            plan, commission_rate, _ = PLANS[_weighted(rng, plan_weights)]
+            rate_60 = _money(rng.randrange(30, 55))
+            rate_30 = _money(float(rate_60) * 0.6)
+            areas = {name} | {rng.choice(HARARE_SUBURBS)[0] for _ in range(2)}
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            created_at = self.anchor - timedelta(days=HISTORY_DAYS + rng.randrange(0, 365))
+            phone = f'+26371{user_id:07d}'
+            verified = rng.random() < 0.9
+
+            users.add(user_id, f'synth_instructor_{user_id}', f'synth_instructor_{user_id}@example.com',
+                      self.password_hash, first_name, last_name, phone, ROLE_INSTRUCTOR, rng.random() < 0.95,
+                      verified, name, json.dumps(sorted(areas)), *_near(rng, latitude, longitude, 1.5),
+                      rate_30, rate_60, rng.randrange(1, 25), plan, 'active', 'Class 4',
+                      'approved' if verified else 'pending', 'Harare', created_at)
+            sessions.add(session_id, user_id, phone, ROLE_INSTRUCTOR, f'synth-{session_id}', '{}',
+                         self.anchor - timedelta(minutes=rng.randrange(0, 14 * 24 * 60)), True, created_at)
+
+            self.instructors.append((user_id, suburb, rate_30, rate_60, commission_rate))
+            self.instructors_by_suburb.setdefault(suburb, []).append(len(self.instructors) - 1)
+
+        users.flush()
+        sessions.flush()
+        return {'users': users.count, 'whatsapp_sessions': sessions.count}
+
+    def _student_batch(self, connection, count: int) -> Dict[str, int]:
+        """count students with their lessons and everything that follows from them"""
+        from models import (CommissionRecord, Lesson, LocationTracker, Payment, Review, Student,
+                            StudentProgress, WhatsAppSession, LESSON_CANCELLED, LESSON_COMPLETED,
+                            LESSON_SCHEDULED, ROLE_STUDENT)
+
+        rng = self.rng
+        anchor = self.anchor
+        horizon = anchor + timedelta(days=BOOKING_HORIZON_DAYS)
+
+        students = TableWriter(connection, Student.__table__, [
+            'id', 'name', 'phone', 'email', 'license_type', 'current_location', 'latitude', 'longitude',
+            'instructor_id', 'registration_date', 'is_active', 'total_lessons_required', 'lessons_completed',
+            'account_balance'
+        ])
+        lessons = TableWriter(connection, Lesson.__table__, [
+            'id', 'student_id', 'instructor_id', 'lesson_date', 'duration_minutes', 'lesson_type', 'location',
+            'pickup_location', 'pickup_latitude', 'pickup_longitude', 'cost', 'base_price', 'status',
+            'completed_date', 'rating', 'created_at', 'updated_at'
+        ])
+        payments = TableWriter(connection, Payment.__table__, [
+            'id', 'student_id', 'amount', 'payment_type', 'payment_method', 'reference_number', 'processed_by',
+            'created_at'
+        ])
+        commissions = TableWriter(connection, CommissionRecord.__table__, [
+            'id', 'instructor_id', 'lesson_id', 'lesson_amount', 'commission_rate', 'commission_amount',
+            'instructor_earning', 'paid_to_instructor', 'payment_date', 'created_at'
+        ])
+        reviews = TableWriter(connection, Review.__table__, [
+            'id', 'lesson_id', 'student_id', 'instructor_id', 'overall_rating', 'patience_rating',
+            'punctuality_rating', 'communication_rating', 'review_text', 'is_verified', 'created_at',
+            'updated_at'
+        ])
+        points = TableWriter(connection, LocationTracker.__table__, [
+            'id', 'lesson_id', 'instructor_id', 'student_id', 'latitude', 'longitude', 'accuracy',
+            'tracking_status', 'speed', 'heading', 'timestamp'
+        ])
+        progress = TableWriter(connection, StudentProgress.__table__, [
+            'id', 'student_id', 'parallel_parking_score', 'city_driving_score', 'reverse_parking_score',
+            'total_lessons_completed', 'total_hours_driven', 'test_readiness_score', 'last_updated'
+        ])
+        sessions = TableWriter(connection, WhatsAppSession.__table__, [
+            'id', 'student_id', 'phone_number', 'user_type', 'session_id', 'session_data', 'last_activity',
+            'is_active', 'created_at'
+        ])
+
+        for student_id in self._ids(connection, Student.__table__, count):
+            suburb = _weighted(rng, _SUBURB_WEIGHTS)
+            suburb_name, latitude, longitude, _ = HARARE_SUBURBS[suburb]
+            home = _near(rng, latitude, longitude, 2.0)
+            # Most students learn with an instructor based in their own suburb
+            local = self.instructors_by_suburb.get(suburb)
+            index = rng.choice(local) if local and rng.random() < 0.8 else rng.randrange(len(self.instructors))
+            instructor_id, _, rate_30, rate_60, commission_rate = self.instructors[index]
+
+            # Skewed towards recent sign-ups, as the platform grows
+            registered = anchor - timedelta(days=HISTORY_DAYS * rng.random() ** 2, hours=rng.randrange(24))
+            license_type = 'Class 2' if rng.random() < 0.1 else 'Class 4'
+            phone = f'+26377{student_id:07d}'
+
+            completed = []
+            day = registered + timedelta(days=rng.randrange(1, 8))
+            for _ in range(min(MAX_LESSONS_PER_STUDENT, int(rng.gammavariate(2, MEAN_LESSONS_PER_STUDENT / 2)))):
+                day += timedelta(days=1 + int(rng.expovariate(1 / 3)))
+                lesson_date = self._lesson_time(day)
+                if lesson_date > horizon:
+                    break
+                day = lesson_date
+                duration = 30 if rng.random() < 0.2 else 60
+                cost = rate_30 if duration == 30 else rate_60
+                if lesson_date >= anchor:
+                    status, completed_date, rating = LESSON_SCHEDULED, None, None
+                elif rng.random() < 0.12:
+                    status, completed_date, rating = LESSON_CANCELLED, None, None
+                else:
+                    status = LESSON_COMPLETED
+                    completed_date = lesson_date + timedelta(minutes=duration)
+                    rating = _weighted(rng, RATING_WEIGHTS) + 1 if rng.random() < 0.5 else None
+                pickup = _near(rng, *home, 0.5)
+                lesson_id = self._ids(connection, Lesson.__table__, 1)[0]
+                booked_at = lesson_date - timedelta(days=rng.randrange(1, 10))
+                lessons.add(lesson_id, student_id, instructor_id, lesson_date, duration,
+                            'test' if rng.random() < 0.03 else 'practical', suburb_name, f'{suburb_name} pickup',
+                            *pickup, cost, cost, status, completed_date, rating, booked_at,
+                            completed_date or booked_at)
+                if status == LESSON_COMPLETED:
+                    completed.append((lesson_id, completed_date, cost, duration, pickup))
+
+            paid = Decimal('0')
+            owed = Decimal('0')
+            pending_lessons = 0
+            for lesson_id, completed_date, cost, duration, pickup in completed:
+                owed += cost
+                pending_lessons += 1
+                # Students pay every few lessons, mostly by EcoCash or cash
+                if pending_lessons >= 4 or rng.random() < 0.2:
+                    payment_type, method, _ = PAYMENT_METHODS[_weighted(rng, _PAYMENT_WEIGHTS)]
+                    amount = _money(math.ceil((owed - paid) / 10) * 10) if owed > paid else _money(20)
+                    payment_id = self._ids(connection, Payment.__table__, 1)[0]
+                    payments.add(payment_id, student_id, amount, payment_type, method,
+                                 f'SYN{payment_id:09d}' if payment_type == 'online' else None, self.admin_id,
+                                 completed_date + timedelta(minutes=rng.randrange(5, 600)))
+                    paid += amount
+                    pending_lessons = 0
+
+                commission = _money(float(cost) * commission_rate)
+                commissions.add(self._ids(connection, CommissionRecord.__table__, 1)[0], instructor_id, lesson_id,
+                                cost, commission_rate, commission, cost - commission,
+                                completed_date < anchor - timedelta(days=7),
+                                completed_date + timedelta(days=7) if completed_date < anchor - timedelta(days=7)
+                                else None, completed_date)
+
+                if rng.random() < REVIEW_SHARE:
+                    overall = _weighted(rng, RATING_WEIGHTS) + 1
+                    reviewed_at = completed_date + timedelta(hours=rng.randrange(1, 48))
+                    reviews.add(self._ids(connection, Review.__table__, 1)[0], lesson_id, student_id,
+                                instructor_id, overall, max(1, min(5, overall + rng.choice((-1, 0, 0, 1)))),
+                                max(1, min(5, overall + rng.choice((-1, 0, 0, 1)))),
+                                max(1, min(5, overall + rng.choice((-1, 0, 0, 1)))),
+                                rng.choice(REVIEW_TEXTS), True, reviewed_at, reviewed_at)
+
+                if rng.random() < TRACKED_SHARE:
+                    # A drive around the pickup point, one reading every few minutes
+                    point = pickup
+                    heading = rng.uniform(0, 360)
+                    step = duration / POINTS_PER_TRACKED_LESSON
+                    point_ids = self._ids(connection, LocationTracker.__table__, POINTS_PER_TRACKED_LESSON)
+                    for k, point_id in enumerate(point_ids):
+                        heading = (heading + rng.uniform(-45, 45)) % 360
+                        speed = round(rng.uniform(0, 60), 1)
+                        distance = speed * step / 60
+                        point = (round(point[0] + distance * math.cos(math.radians(heading)) / 111.0, 6),
+                                 round(point[1] + distance * math.sin(math.radians(heading)) / 106.0, 6))
+                        last = k == POINTS_PER_TRACKED_LESSON - 1
+                        points.add(point_id, lesson_id, instructor_id, student_id, *point,
+                                   round(rng.uniform(3, 20), 1), 'ended' if last else 'active', speed,
+                                   round(heading, 1), completed_date - timedelta(minutes=duration - (k + 1) * step))
+
+            lessons_completed = len(completed)
+            students.add(student_id, self._name(), phone,
+                         f'student{student_id}@example.com' if rng.random() < 0.6 else None, license_type,
+                         suburb_name, *home, instructor_id, registered, rng.random() < 0.9,
+                         30 if license_type == 'Class 2' else 20, lessons_completed, paid - owed)
+
+            if lessons_completed:
+                skill = min(100, lessons_completed * 4)
+                progress.add(self._ids(connection, StudentProgress.__table__, 1)[0], student_id,
+                             min(100, max(0, skill + rng.randrange(-15, 10))),
+                             min(100, max(0, skill + rng.randrange(-10, 10))),
+                             min(100, max(0, skill + rng.randrange(-20, 5))), lessons_completed,
+                             round(sum(lesson[3] for lesson in completed) / 60, 1),
+                             min(100, max(0, skill + rng.randrange(-10, 10))), completed[-1][1])
+
+            if rng.random() < 0.7:
+                session_id = self._ids(connection, WhatsAppSession.__table__, 1)[0]
+                last_activity = min(anchor, registered + timedelta(days=rng.randrange(0, 60)))
+                sessions.add(session_id, student_id, phone, ROLE_STUDENT, f'synth-{session_id}', '{}',
+                             last_activity, anchor - last_activity < timedelta(days=1), registered)
+
+        # Parents before children, so foreign keys hold at every flush
+        writers = [('students', students), ('lessons', lessons), ('payments', payments),
+                   ('commission_records', commissions), ('reviews', reviews), ('location_tracker', points),
+                   ('student_progress', progress), ('whatsapp_sessions', sessions)]
+        for _, writer in writers:
+            writer.flush()
+        return {name: writer.count for name, writer in writers}
+
+    def _instructor_totals(self, connection):
+        """Fill the instructors' denormalized lesson count, rating and earnings"""
+        from models import CommissionRecord, Lesson, Review, User, LESSON_COMPLETED
+
+        if not self.instructors:
+            return
+        users = User.__table__
+        first, last = self.instructors[0][0], self.instructors[-1][0]
+        connection.execute(users.update().where(users.c.id.between(first, last)).values(
+            total_lessons_taught=select(func.count(Lesson.id)).where(
+                Lesson.instructor_id == users.c.id, Lesson.status == LESSON_COMPLETED
+            ).scalar_subquery(),
+            average_rating=func.coalesce(select(func.avg(Review.overall_rating)).where(
+                Review.instructor_id == users.c.id
+            ).scalar_subquery(), 0),
+            total_earnings=func.coalesce(select(func.sum(CommissionRecord.instructor_earning)).where(
+                CommissionRecord.instructor_id == users.c.id
+            ).scalar_subquery(), 0),
+            commission_paid=func.coalesce(select(func.sum(CommissionRecord.commission_amount)).where(
+                CommissionRecord.instructor_id == users.c.id
+            ).scalar_subquery(), 0)
+        ))
+
+    def _finish(self, connection):
+        """Move PostgreSQL id sequences past the explicit ids and refresh planner statistics"""
+        if connection.dialect.name == 'postgresql':
+            for table_name in self.next_ids:
+                connection.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 1) FROM {table_name}))"
+                ))
+        connection.execute(text("ANALYZE"))
+
+    @staticmethod
+    def _rebuild_derived():
+        """Recompute the tables the mapper listeners would have maintained"""
+        from demand_signal import DemandSignal
+        from instructor_stats import InstructorStatsService
+        from rollups import rebuild as rebuild_rollups
+        from system_totals import SystemTotals
+
+        rebuild_rollups()
+        InstructorStatsService.rebuild()
+        DemandSignal.rebuild()
+        SystemTotals.rebuild()
+
+
+def main(argv: Iterable[str] = None) -> Dict[str, int]:
+    parser = argparse.ArgumentParser(description='Bulk-generate synthetic DriveLink data')
+    parser.add_argument('--scale', type=int, default=1, help='volume multiplier (1, 10, 100, ...)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed')
+    parser.add_argument('--anchor', type=date.fromisoformat, default=None,
+                        help='"today" for the generated history (YYYY-MM-DD, default today)')
+    parser.add_argument('--skip-rebuild', action='store_true', help='leave rollups and stats tables alone')
+    args = parser.parse_args(argv)
+
+    from app import app, db
+    import models  # noqa: F401
+
+    with app.app_context():
+        db.create_all()
+        generator = SyntheticDataGenerator(db.engine, scale=args.scale, seed=args.seed, anchor=args.anchor)
+        return generator.run(rebuild=not args.skip_rebuild)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main(sys.argv[1:])
@@ -0,0 +1,168 @@
+"""
+System Totals for DriveLink
+Keeps the row counts shown on /super-admin (users per role, students, lessons)
+in system_totals, maintained from User, Student and Lesson mapper events in the
+same transaction as the write, so the dashboard reads a handful of rows instead
+of counting every table. Each total is split over SLOTS rows ('lessons',
+'lessons#1', ...) and a write adjusts a random one, so concurrent bookings and
+registrations do not all wait on one row lock until they commit; reads add the
+slots up.
+
+Run this module directly to recount the totals from the source tables.
+"""
+import logging
+import random
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import event, func, select
+
+from rollups import increment_counters, previous_value, track_previous
+
+logger = logging.getLogger(__name__)
+
+STUDENTS = 'students'
+LESSONS = 'lessons'
+USERS_PREFIX = 'users:'
+
+# Rows each total is spread over; slot 0 keeps the plain name
+SLOTS = 8
+SLOT_SEPARATOR = '#'
+
+
+def _user_key(role) -> str:
+    return f"{USERS_PREFIX}{role or ''}"
+
+
+def _slot_name(name: str, slot: int) -> str:
+    return f"{name}{SLOT_SEPARATOR}{slot}" if slot else name
+
+
+def add_rows(connection, name: str, delta: int):
+    """Adjust one total, in a random one of its slots"""
+    from models import SystemTotal
+
+    increment_counters(connection, SystemTotal.__table__, {'name': _slot_name(name, random.randrange(SLOTS))},
+                       {'row_count': delta})
+
+
+def count_rows(connection) -> Dict[str, int]:
+    """Every total counted from the source tables"""
+    from models import Lesson, Student, User
+
+    totals = {
+        STUDENTS: connection.execute(select(func.count(Student.id))).scalar(),
+        LESSONS: connection.execute(select(func.count(Lesson.id))).scalar(),
+    }
+    for role, count in connection.execute(select(User.role, func.count(User.id)).group_by(User.role)):
+        totals[_user_key(role)] = count
+    return totals
+
+
+def write_totals(connection, totals: Dict[str, int]):
+    """Replace the stored totals (and their slots) with one row each"""
+    from models import SystemTotal
+
+    table = SystemTotal.__table__
+    now = datetime.now()
+    connection.execute(table.delete())
+    connection.execute(table.insert(), [
+        {'name': name, 'row_count': count, 'updated_at': now} for name, count in totals.items()
+    ])
+
+
+def fill_system_totals(connection):
+    """Count the totals of an existing database (schema migration)"""
+    write_totals(connection, count_rows(connection))
+
+
+class SystemTotals:
+    """Read and rebuild the maintained totals"""
+
+    @staticmethod
+    def get() -> Dict[str, int]:
+        """name -> row count for every stored total, its slots added up"""
+        from app import db
+        from models import SystemTotal
+
+        totals: Dict[str, int] = defaultdict(int)
+        for name, count in db.session.execute(select(SystemTotal.name, SystemTotal.row_count)):
+            totals[name.partition(SLOT_SEPARATOR)[0]] += count
+        return dict(totals)
+
+    @staticmethod
+    def rebuild() -> Dict[str, int]:
+        """Recount every total from the source tables"""
+        from app import db
+
+        connection = db.session.connection()
+        totals = count_rows(connection)
+        write_totals(connection, totals)
+        db.session.commit()
+
+        logger.info(f"Rebuilt {len(totals)} system totals")
+        return totals
+
+
+def _user_inserted(mapper, connection, target):
+    add_rows(connection, _user_key(target.role), 1)
+
+
+def _user_updated(mapper, connection, target):
+    old_role = previous_value(target, 'role')
+    if old_role != target.role:
+        add_rows(connection, _user_key(old_role), -1)
+        add_rows(connection, _user_key(target.role), 1)
+
+
+def _user_deleted(mapper, connection, target):
+    add_rows(connection, _user_key(target.role), -1)
+
+
+def _student_inserted(mapper, connection, target):
+    add_rows(connection, STUDENTS, 1)
+
+
+def _student_deleted(mapper, connection, target):
+    add_rows(connection, STUDENTS, -1)
+
+
+def _lesson_inserted(mapper, connection, target):
+    add_rows(connection, LESSONS, 1)
+
+
+def _lesson_deleted(mapper, connection, target):
+    add_rows(connection, LESSONS, -1)
+
+
+def register_system_total_listeners():
+    """Keep system_totals in step with User, Student and Lesson inserts and deletes and role changes"""
+    from models import Lesson, Student, User
+
+    # A role change is subtracted from the old role's total
+    track_previous(User.role)
+
+    listeners = [
+        (User, 'after_insert', _user_inserted),
+        (User, 'after_update', _user_updated),
+        (User, 'after_delete', _user_deleted),
+        (Student, 'after_insert', _student_inserted),
+        (Student, 'after_delete', _student_deleted),
+        (Lesson, 'after_insert', _lesson_inserted),
+        (Lesson, 'after_delete', _lesson_deleted),
+    ]
+    for model, event_name, listener in listeners:
+        if not event.contains(model, event_name, listener):
+            event.listen(model, event_name, listener)
+
+
+register_system_total_listeners()
+
+
+if __name__ == "__main__":
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    with app.app_context():
+        SystemTotals.rebuild()
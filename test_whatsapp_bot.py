@@ -4,10 +4,12 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from datetime import datetime, timedelta
-from app import app
+from app import create_app
 from models import db, Student, User, Lesson, WhatsAppSession, LESSON_SCHEDULED
 from whatsappbot import whatsapp_bot
 
+app = create_app()
+
 def test_whatsapp_bot():
     """Comprehensive test of WhatsApp bot functionality"""
     
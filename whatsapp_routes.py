@@ -17,7 +17,8 @@ def whatsapp_webhook():
         from_number = request.values.get('From', '').replace('whatsapp:', '')
         media_url = request.values.get('MediaUrl0')  # First media attachment
         
-        logger.info(f"Received WhatsApp message from {from_number}: {incoming_msg}")
+        logger.debug("WhatsApp message received from %s", from_number,
+                     extra={'message_chars': len(incoming_msg), 'has_media': bool(media_url)})
         
         # Process message through enhanced bot
         response_text = enhanced_bot.process_message(from_number, incoming_msg, media_url)
@@ -26,12 +27,12 @@ def whatsapp_webhook():
         resp = MessagingResponse()
         resp.message(response_text)
         
-        logger.info(f"Sent WhatsApp response to {from_number}: {response_text}")
+        logger.debug("WhatsApp reply to %s", from_number, extra={'reply_chars': len(response_text)})
         
         return str(resp)
         
     except Exception as e:
-        logger.error(f"Error in WhatsApp webhook: {str(e)}")
+        logger.exception("Error in WhatsApp webhook")
         resp = MessagingResponse()
         resp.message("Sorry, I'm having technical difficulties. Please try again later.")
         return str(resp)
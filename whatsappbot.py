@@ -10,8 +10,6 @@ from twilio.twiml.messaging_response import MessagingResponse
 from sqlalchemy import and_
 from models import User, Student, Lesson, WhatsAppSession, db, LESSON_SCHEDULED, LESSON_COMPLETED, LESSON_CANCELLED, SystemConfig
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class WhatsAppBot:
@@ -556,7 +554,7 @@ Choose an option below:"""
                     body=message_body
                 )
 
-            logger.info(f"📱 Message sent to {phone_number}")
+            logger.debug("WhatsApp message sent to %s", phone_number)
             return "Message sent successfully"
 
         except Exception as e:
@@ -2450,7 +2448,7 @@ You have a lesson in 2 hours:
         """Enhanced WhatsApp message sending with better error handling"""
         try:
             if not self.twilio_client:
-                logger.warning(f"Twilio not configured. Mock sending to {phone_number}: {message}")
+                logger.debug("Twilio not configured; message to %s not sent", phone_number)
                 return False
 
             if not self.twilio_phone:
@@ -3290,13 +3288,13 @@ def webhook_handler():
 
             # Process button response or regular message
             if button_text and button_payload:
-                logger.info(f"✅ Button response from {clean_phone}: {button_text} (ID: {button_payload})")
+                logger.debug("WhatsApp button response from %s", clean_phone, extra={'button_payload': button_payload})
                 response_text = whatsapp_bot.process_button_response(clean_phone, button_text, button_payload)
             elif message_body:
-                logger.info(f"📝 Text message from {clean_phone}: {message_body}")
+                logger.debug("WhatsApp message received from %s", clean_phone, extra={'message_chars': len(message_body)})
                 response_text = whatsapp_bot.process_message(clean_phone, message_body)
             else:
-                logger.warning(f"⚠️ Empty message from {clean_phone}")
+                logger.warning("Empty WhatsApp message from %s", clean_phone)
                 response_text = "Sorry, I didn't receive any message content. Please try again."
 
             # Create TwiML response
@@ -3308,7 +3306,7 @@ def webhook_handler():
         return jsonify({'error': 'Missing required parameters'}), 400
 
     except Exception as e:
-        logger.error(f"❌ Webhook error: {str(e)}")
+        logger.exception("WhatsApp webhook error")
         # Return friendly error message
         twiml_response = MessagingResponse()
         twiml_response.message("Sorry, I'm having trouble right now. Please try again later.")
@@ -3318,7 +3316,7 @@ def send_whatsapp_message(phone_number, message, buttons=None):
     """Send WhatsApp message via Twilio with optional interactive buttons"""
     try:
         if not whatsapp_bot.twilio_client:
-            logger.warning(f"Twilio not configured. Mock sending to {phone_number}: {message}")
+            logger.debug("Twilio not configured; message to %s not sent", phone_number)
             return False
 
         if not whatsapp_bot.twilio_phone: